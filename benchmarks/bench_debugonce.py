@@ -0,0 +1,368 @@
+"""
+Benchmarks for debugonce.
+
+Run from the repository root:
+
+    python benchmarks/bench_debugonce.py --output bench.json
+    python benchmarks/bench_debugonce.py --compare bench.json --threshold 0.15
+
+Every benchmark runs in a scratch directory, so nothing is written to the
+working tree. Results are written as JSON. Metric names carry their unit;
+those ending in ``_per_s`` are better when higher, all others when lower.
+``--compare`` exits with status 1 if any metric regressed by more than
+``--threshold`` against the stored baseline.
+"""
+
+import argparse
+import http.server
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def per_call_us(func, calls, repeat=5):
+    """Median time of one call of ``func``, in microseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(calls):
+            func()
+        samples.append((time.perf_counter_ns() - start) / calls / 1000)
+    return statistics.median(samples)
+
+
+def _plain_add(a, b):
+    return a + b
+
+
+@benchmark("decorator_overhead_trivial")
+def bench_trivial(quick):
+    from debugonce_packages import debugonce
+    calls = 200 if quick else 2000
+    decorated = debugonce(_plain_add)
+    base = per_call_us(lambda: _plain_add(1, 2), calls)
+    wrapped = per_call_us(lambda: decorated(1, 2), calls)
+    return {"plain_us": base, "decorated_us": wrapped, "overhead_us": wrapped - base}
+
+
+def _leaf(i):
+    return i + 1
+
+
+def _calls_leaves(n):
+    total = 0
+    for i in range(n):
+        total += _leaf(i)
+    return total
+
+
+@benchmark("trace_overhead")
+def bench_trace(quick):
+    from debugonce_packages import debugonce
+    calls = 50 if quick else 500
+    leaves = 100
+    decorated = debugonce(_calls_leaves)
+    traced = debugonce(trace=True)(_calls_leaves)
+    base = per_call_us(lambda: _calls_leaves(leaves), calls)
+    captured = per_call_us(lambda: decorated(leaves), calls)
+    with_trace = per_call_us(lambda: traced(leaves), calls)
+    return {"plain_us": base, "decorated_us": captured, "traced_us": with_trace,
+            "trace_overhead_us": with_trace - captured,
+            "per_event_ns": (with_trace - captured) * 1000 / (2 * leaves + 2)}
+
+
+@benchmark("decorator_overhead_io")
+def bench_io(quick):
+    from debugonce_packages import debugonce
+    path = os.path.join(os.getcwd(), "bench_io.txt")
+    with open(path, "w") as f:
+        f.write("x" * 4096)
+
+    def read_files():
+        for _ in range(10):
+            with open(path, "r") as f:
+                f.read()
+
+    calls = 50 if quick else 500
+    decorated = debugonce(read_files)
+    base = per_call_us(read_files, calls)
+    wrapped = per_call_us(decorated, calls)
+    return {"plain_us": base, "decorated_us": wrapped, "overhead_us": wrapped - base}
+
+
+class _QuietHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def local_http_server():
+    """Start a stand-in HTTP server on localhost; returns ``(server, url)``."""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+@benchmark("decorator_overhead_http")
+def bench_http(quick):
+    import requests
+    from debugonce_packages import debugonce
+    server, url = local_http_server()
+    session = requests.Session()
+    try:
+        def fetch():
+            return session.get(url).status_code
+
+        calls = 20 if quick else 200
+        decorated = debugonce(fetch)
+        base = per_call_us(fetch, calls, repeat=3)
+        wrapped = per_call_us(decorated, calls, repeat=3)
+    finally:
+        server.shutdown()
+    return {"plain_us": base, "decorated_us": wrapped, "overhead_us": wrapped - base}
+
+
+@benchmark("capture_throughput")
+def bench_capture(quick):
+    from debugonce_packages.decorator import capture_state
+    count = 100 if quick else 1000
+    results = {}
+    for label, args in (("small", (1, "two", [3])), ("large", (list(range(10000)), "x" * 100000))):
+        start = time.perf_counter()
+        for _ in range(count):
+            capture_state(_plain_add, args, {}, result=None)
+        results[f"{label}_per_s"] = count / (time.perf_counter() - start)
+    return results
+
+
+@benchmark("serialize")
+def bench_serialize(quick):
+    import datetime
+    import decimal
+    from debugonce_packages.serializer import dumps, encode_state
+    calls = 200 if quick else 2000
+    native = {"function": "f", "args": [1, "two", list(range(100))], "kwargs": {"flag": True},
+              "result": {"rows": [{"id": i, "name": f"row{i}"} for i in range(50)]}}
+    rich = {"function": "f", "args": [datetime.datetime(2024, 5, 20), decimal.Decimal("1.10"), {1, 2, 3}],
+            "kwargs": {"raw": b"x" * 256}, "result": (1, 2.5, None)}
+    return {
+        "plain_json_us": per_call_us(lambda: json.dumps(native, indent=4), calls),
+        "native_us": per_call_us(lambda: dumps(encode_state(dict(native)), indent=True), calls),
+        "rich_us": per_call_us(lambda: dumps(encode_state(dict(rich)), indent=True), calls),
+    }
+
+
+def _call_decorated(n):
+    from debugonce_packages import debugonce
+    decorated = debugonce(_plain_add)
+    for i in range(n):
+        decorated(i, i)
+    return n
+
+
+@benchmark("scaling")
+def bench_scaling(quick):
+    calls = 100 if quick else 1000
+    results = {}
+    for workers in (1, 4, 16):
+        threads = [threading.Thread(target=_call_decorated, args=(calls,)) for _ in range(workers)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        results[f"threads_{workers}_calls_per_s"] = workers * calls / (time.perf_counter() - start)
+    for workers in (1, 4):
+        with multiprocessing.get_context("spawn").Pool(workers) as pool:
+            pool.map(_call_decorated, [1] * workers)  # warm up the workers
+            start = time.perf_counter()
+            pool.map(_call_decorated, [calls] * workers)
+            results[f"processes_{workers}_calls_per_s"] = workers * calls / (time.perf_counter() - start)
+    return results
+
+
+def divide(a, b):
+    return a / b
+
+
+def _capture_one():
+    from debugonce_packages import debugonce
+    try:
+        debugonce(divide)(1, 0)
+    except ZeroDivisionError:
+        pass
+    from debugonce_packages.storage import get_default_storage
+    return get_default_storage().catalog.query(function="divide", limit=1)[0]
+
+
+@benchmark("export_replay_latency")
+def bench_export_replay(quick):
+    from click.testing import CliRunner
+    from debugonce_packages.cli import cli
+    row = _capture_one()
+    session_file = os.path.join(".debugonce", row["location"])
+    runner = CliRunner()
+    repeat = 3 if quick else 10
+    export_ms = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        # --force: later exports would otherwise skip the unchanged script
+        runner.invoke(cli, ["export", session_file, "--force"])
+        export_ms.append((time.perf_counter() - start) * 1000)
+    replay_ms = []
+    env = dict(os.environ, PYTHONPATH=os.path.join(ROOT, "src"))
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-m", "debugonce_packages.cli", "replay", session_file],
+                       capture_output=True, env=env)
+        replay_ms.append((time.perf_counter() - start) * 1000)
+    return {"export_ms": statistics.median(export_ms), "replay_ms": statistics.median(replay_ms)}
+
+
+@benchmark("bulk_replay")
+def bench_bulk_replay(quick):
+    from debugonce_packages import debugonce
+    from debugonce_packages.exporter import export_session
+    from debugonce_packages.replayer import replay_sessions
+    from debugonce_packages.storage import get_default_storage
+    count = 20 if quick else 200
+    decorated = debugonce(divide)
+    for i in range(count):
+        try:
+            decorated(i, i % 2)
+        except ZeroDivisionError:
+            pass
+    refs = [row["session_id"] for row in get_default_storage().catalog.query(function="divide")]
+    for ref in refs:
+        export_session(ref)
+    start = time.perf_counter()
+    replay_sessions(refs)
+    pool_ms = (time.perf_counter() - start) * 1000 / len(refs)
+    script = os.path.splitext(export_session(refs[0])[0])[0] + ".py"
+    start = time.perf_counter()
+    for _ in range(3):
+        subprocess.run([sys.executable, script], capture_output=True)
+    return {"pool_ms_per_session": pool_ms, "plain_subprocess_ms": (time.perf_counter() - start) * 1000 / 3}
+
+
+def _import_cost_us(statement, env):
+    """Cumulative ``-X importtime`` cost of the modules ``statement`` imports, in us."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                          capture_output=True, text=True, env=env, check=True)
+    total, after_site = 0, False
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.strip() == "site" and not name.startswith("  "):
+            after_site = True
+            continue
+        if after_site and not name[1:].startswith(" "):
+            total += int(cumulative)
+    return total
+
+
+@benchmark("import_time")
+def bench_import_time(quick):
+    env = dict(os.environ, PYTHONPATH=os.path.join(ROOT, "src"))
+    repeat = 3 if quick else 10
+    results = {}
+    for label, statement in (("decorator", "from debugonce_packages import debugonce"),
+                             ("package", "import debugonce_packages")):
+        results[f"{label}_import_us"] = statistics.median(
+            _import_cost_us(statement, env) for _ in range(repeat))
+    return results
+
+
+def run(names, quick):
+    results = {}
+    for name in names:
+        with tempfile.TemporaryDirectory() as scratch:
+            cwd = os.getcwd()
+            os.chdir(scratch)
+            try:
+                results[name] = BENCHMARKS[name](quick)
+            finally:
+                os.chdir(cwd)
+        print(f"{name}: " + ", ".join(f"{k}={v:.2f}" for k, v in results[name].items()), file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Return a list of human-readable regressions against ``baseline``."""
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get("results", {}).get(name, {}).get(metric)
+            if not old or metric.startswith("plain_"):
+                continue
+            higher_is_better = metric.endswith("_per_s")
+            change = (old - value) / old if higher_is_better else (value - old) / old
+            if change > threshold:
+                regressions.append(f"{name}.{metric}: {old:.2f} -> {value:.2f} ({change:+.0%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", help="Write results as JSON to this file.")
+    parser.add_argument("--compare", metavar="BASELINE", help="Flag regressions against a stored result file.")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed relative regression (default 0.10).")
+    parser.add_argument("--only", action="append", choices=sorted(BENCHMARKS), help="Run only these benchmarks.")
+    parser.add_argument("--quick", action="store_true", help="Fewer iterations, for smoke runs.")
+    args = parser.parse_args(argv)
+
+    results = run(args.only or list(BENCHMARKS), args.quick)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.time(),
+            "quick": args.quick,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
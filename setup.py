@@ -16,6 +16,9 @@ setup(
         'psutil',
         'requests',
     ],
+    extras_require={
+        'fast': ['orjson'],
+    },
     classifiers=[
         'Programming Language :: Python :: 3',
         'Programming Language :: Python :: 3.8',
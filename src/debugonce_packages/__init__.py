@@ -1,14 +1,72 @@
 """
 This is the debugonce package, which provides a utility for capturing and reproducing bugs effortlessly.
+
+Names are imported lazily on first access, so importing the package (or
+just ``debugonce``) doesn't pull in the CLI, storage or HTTP modules.
 """
 
-from .decorator import debugonce
-from .cli import cli
-from .utils import (
-    get_environment_variables,
-    get_current_working_directory,
-    get_python_version,  # Ensure this is imported
-)
-from .storage import StorageManager  # Example storage manager import
+import importlib
+import sys
+import types
+
+_EXPORTS = {
+    "debugonce": ".decorator",
+    "enable_async_writer": ".decorator",
+    "disable_async_writer": ".decorator",
+    "enable_collector": ".decorator",
+    "disable_collector": ".decorator",
+    "cli": ".cli",
+    "get_environment_variables": ".utils",
+    "get_current_working_directory": ".utils",
+    "get_python_version": ".utils",
+    "StorageManager": ".storage",
+    "configure_storage": ".storage",
+    "configure_environment": ".environment",
+    "configure_blobs": ".blobs",
+    "register_serializer": ".serializer",
+    "configure_decoding": ".serializer",
+    "configure_file_tracking": ".hooks",
+    "configure_http_recording": ".hooks",
+    "configure_file_snapshots": ".snapshots",
+    "configure_call_tree": ".calltree",
+    "configure_tracing": ".tracing",
+    "configure_resources": ".resources",
+    "RetentionPolicy": ".retention",
+    "configure_stats": ".stats",
+    "get_stats": ".stats",
+    "persist_stats": ".stats",
+}
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
+
+
+class _Package(types.ModuleType):
+    def __setattr__(self, name, value):
+        # Importing the ``cli`` submodule would otherwise replace the ``cli``
+        # command as the package attribute.
+        if name == "cli" and isinstance(value, types.ModuleType):
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
+
 
-__all__ = ['debugonce', 'cli', 'some_utility_function', 'StorageManager']
\ No newline at end of file
+__all__ = ['debugonce', 'cli', 'some_utility_function', 'StorageManager',
+           'enable_async_writer', 'disable_async_writer', 'configure_environment',
+           'configure_storage', 'RetentionPolicy', 'configure_stats', 'get_stats',
+           'persist_stats', 'configure_blobs', 'register_serializer', 'configure_decoding',
+           'configure_file_tracking', 'configure_http_recording',
+           'configure_file_snapshots', 'enable_collector', 'disable_collector',
+           'configure_call_tree', 'configure_tracing', 'configure_resources']
@@ -0,0 +1,284 @@
+"""
+Out-of-line storage for large arguments and results.
+
+Before a session is written, every argument, keyword argument and result
+(of the call and of the nested calls in its call tree) whose estimated size
+reaches the blob threshold is encoded, hashed with SHA-256 and written once
+to ``<store>/blobs/<2 hex>/<hash>``. The session keeps only a reference::
+
+    {"__debugonce_blob__": "<hash>", "size": 52428800, "kind": "bytes"}
+
+so identical payloads captured by many sessions are stored once. Values can
+also be hashed now and written later (see ``pending`` in :func:`externalize`
+and :func:`store_blobs`), which lets a capture be written to a different store
+than the one it was prepared for. Recorded
+HTTP response bodies always go to the store this way. An optional
+per-session budget caps the argument and result bytes a session may keep;
+values past it are replaced by a truncation marker with a short preview.
+
+Readers turn references into :class:`BlobRef` objects with
+:func:`attach_blobs`; nothing is read until ``BlobRef.load()`` maps the file.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import reprlib
+import threading
+from .calltree import iter_frames
+from .layout import BLOB_KEY
+from .serializer import decode, dumps, encode
+from .storage import find_in_store, touch, write_atomic
+
+BLOB_DIR = "blobs"
+TRUNCATED_KEY = "__debugonce_truncated__"
+PREVIEW_CHARS = 200
+COPY_CHUNK = 1024 * 1024
+
+_threshold = 256 * 1024
+_session_budget = None
+
+
+def configure_blobs(threshold=256 * 1024, session_budget=None):
+    """Store values of at least ``threshold`` bytes out of line.
+
+    ``session_budget`` caps the argument and result bytes kept per session
+    (``None`` for no cap); values that don't fit are truncated.
+    """
+    global _threshold, _session_budget
+    if threshold is not None and threshold <= 0:
+        raise ValueError("threshold must be positive")
+    _threshold = threshold
+    _session_budget = session_budget
+
+
+def _estimate(value, limit):
+    """Rough encoded size of ``value``; stops counting once it passes ``limit``."""
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value)
+    nbytes = getattr(value, "nbytes", None)  # memoryview, NumPy arrays
+    if isinstance(nbytes, int):
+        return nbytes
+    if isinstance(value, dict):
+        size = 2
+        for key, item in value.items():
+            size += _estimate(key, limit) + _estimate(item, limit) + 4
+            if size > limit:
+                break
+        return size
+    if isinstance(value, (list, tuple, set, frozenset)):
+        size = 2
+        for item in value:
+            size += _estimate(item, limit) + 2
+            if size > limit:
+                break
+        return size
+    return 8
+
+
+def _encode(value):
+    """Return ``(kind, payload)`` for a value, or ``None`` if it can't be stored."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "bytes", bytes(value)
+    if isinstance(value, str):
+        return "str", value.encode("utf-8", "surrogatepass")
+    try:
+        return "json", dumps(encode(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def blob_path(storage_dir, digest):
+    return os.path.join(storage_dir, BLOB_DIR, digest[:2], digest)
+
+
+def store_blob(storage_dir, payload):
+    """Write ``payload`` to the blob store unless it's already there; returns its hash."""
+    digest = hashlib.sha256(payload).hexdigest()
+    path = blob_path(storage_dir, digest)
+    if not touch(path):
+        write_atomic(path, payload)
+    return digest
+
+
+def store_blobs(storage_dir, blobs):
+    """Write the ``(hash, payload)`` pairs collected by :func:`externalize` to the blob store."""
+    for digest, payload in blobs:
+        path = blob_path(storage_dir, digest)
+        if not touch(path):
+            write_atomic(path, payload)
+
+
+def _hash_file(fd):
+    digest = hashlib.sha256()
+    while True:
+        chunk = os.read(fd, COPY_CHUNK)
+        if not chunk:
+            return digest.hexdigest()
+        digest.update(chunk)
+
+
+def store_file(storage_dir, path):
+    """Add the contents of the file at ``path`` to the blob store; returns ``(hash, size)``.
+
+    The file is hashed in chunks first, and copied (again in chunks, never
+    held in memory) only if the store doesn't have it yet. Stored files are
+    made read-only, since replays may hard-link them.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        digest = _hash_file(fd)
+        size = os.fstat(fd).st_size
+        target = blob_path(storage_dir, digest)
+        if touch(target):
+            return digest, size
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        copied = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o444), "wb") as out:
+                while True:
+                    chunk = os.read(fd, COPY_CHUNK)
+                    if not chunk:
+                        break
+                    copied.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            # The file may have changed between the two passes; store what was copied.
+            digest = copied.hexdigest()
+            target = blob_path(storage_dir, digest)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(tmp_path, target)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        return digest, size
+    finally:
+        os.close(fd)
+
+
+def _truncated(value, size):
+    if isinstance(value, (str, bytes, bytearray)):
+        preview = repr(value[:PREVIEW_CHARS])
+    else:
+        preview = reprlib.repr(value)
+    return {TRUNCATED_KEY: True, "size": size, "preview": preview[:PREVIEW_CHARS]}
+
+
+def externalize(state, storage_dir, pending=None):
+    """Move large values of a captured ``state`` into the blob store, in place.
+
+    With a ``pending`` list nothing is written: each payload is hashed and
+    appended to it as ``(hash, payload)`` for :func:`store_blobs`.
+    """
+    if pending is None:
+        def store(payload):
+            return store_blob(storage_dir, payload)
+    else:
+        def store(payload):
+            digest = hashlib.sha256(payload).hexdigest()
+            pending.append((digest, payload))
+            return digest
+    for request in state.get("http_requests") or []:
+        response = request.get("response")
+        if response is not None and isinstance(response.get("body"), (bytes, bytearray)):
+            body = bytes(response["body"])
+            response["body"] = {BLOB_KEY: store(body), "size": len(body), "kind": "bytes"}
+    threshold = _threshold
+    budget = _session_budget
+    if threshold is None and budget is None:
+        return state
+    used = 0
+    slots = []
+    for frame in (state, *iter_frames(state.get("call_tree"))):
+        args = frame.get("args") or []
+        kwargs = frame.get("kwargs") or {}
+        slots.extend((args, index) for index in range(len(args)))
+        slots.extend((kwargs, key) for key in kwargs)
+        slots.append((frame, "result"))
+    for container, key in slots:
+        value = container[key]
+        limit = threshold if threshold is not None else budget
+        size = _estimate(value, limit)
+        if threshold is not None and size >= threshold:
+            encoded = _encode(value)
+            if encoded is None:
+                continue
+            kind, payload = encoded
+            size = len(payload)
+            if budget is not None and used + size > budget:
+                container[key] = _truncated(value, size)
+                continue
+            container[key] = {BLOB_KEY: store(payload), "size": size, "kind": kind}
+        elif budget is not None and used + size > budget:
+            container[key] = _truncated(value, size)
+            continue
+        used += size
+    return state
+
+
+class BlobRef:
+    """A lazily loaded out-of-line value of a session."""
+
+    __slots__ = ("digest", "size", "kind", "path")
+
+    def __init__(self, digest, size, kind, path):
+        self.digest = digest
+        self.size = size
+        self.kind = kind
+        self.path = path
+
+    def load(self):
+        """Map the blob and decode it.
+
+        ``bytes`` blobs come back as a read-only ``memoryview`` over the
+        mapping, so nothing is copied; ``str`` and ``json`` blobs are decoded
+        straight from it, the latter through the serializer's decoder.
+        """
+        if self.path is None:
+            raise FileNotFoundError(f"Blob '{self.digest}' not found.")
+        with open(self.path, "rb") as f:
+            view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)) if self.size else memoryview(b"")
+        if self.kind == "bytes":
+            return view
+        text = str(view, "utf-8", "surrogatepass")
+        return text if self.kind == "str" else decode(json.loads(text))
+
+    def __repr__(self):
+        return f"<blob {self.kind} {self.size} bytes sha256:{self.digest[:12]}>"
+
+
+def _attach(value, session_file):
+    if isinstance(value, dict) and BLOB_KEY in value:
+        digest = value[BLOB_KEY]
+        path = find_in_store(session_file, BLOB_DIR, digest[:2], digest)
+        return BlobRef(digest, value.get("size", 0), value.get("kind", "bytes"), path)
+    return value
+
+
+def attach_blobs(data, session_file):
+    """Replace blob references in a loaded session with :class:`BlobRef` objects."""
+    for frame in (data, *iter_frames(data.get("call_tree"))):
+        if isinstance(frame.get("args"), list):
+            frame["args"] = [_attach(arg, session_file) for arg in frame["args"]]
+        if isinstance(frame.get("kwargs"), dict):
+            frame["kwargs"] = {key: _attach(value, session_file) for key, value in frame["kwargs"].items()}
+        if "result" in frame:
+            frame["result"] = _attach(frame["result"], session_file)
+    for request in data.get("http_requests") or []:
+        response = request.get("response") if isinstance(request, dict) else None
+        if isinstance(response, dict) and "body" in response:
+            response["body"] = _attach(response["body"], session_file)
+    for entry in data.get("file_access") or []:
+        snapshot = entry.get("snapshot") if isinstance(entry, dict) else None
+        if isinstance(snapshot, dict) and "sha256" in snapshot:
+            digest = snapshot["sha256"]
+            path = find_in_store(session_file, BLOB_DIR, digest[:2], digest)
+            snapshot["blob"] = BlobRef(digest, snapshot.get("size", 0), "bytes", path)
+    return data
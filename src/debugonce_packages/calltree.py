@@ -0,0 +1,114 @@
+"""
+Call trees for nested and recursive captures.
+
+Only the outermost decorated call in a context writes a session. Decorated
+calls made while it runs push a :class:`CallFrame` onto the tree instead:
+arguments, result or exception, duration and the I/O seen while the frame
+was active (its own and its children's). The session stores the tree under
+``call_tree`` as the outermost call's child frames.
+
+The tree is bounded by depth, children per frame and frames in total;
+calls past a limit run undecorated and are only counted, in
+``call_tree_dropped``.
+"""
+
+import contextvars
+
+_current = contextvars.ContextVar("debugonce_call_frame", default=None)
+
+_max_depth = 64
+_max_children = 256
+_max_frames = 4096
+
+
+def configure_call_tree(max_depth=64, max_children=256, max_frames=4096):
+    """Bound the call tree recorded for nested decorated calls."""
+    global _max_depth, _max_children, _max_frames
+    if min(max_depth, max_children, max_frames) < 0:
+        raise ValueError("call tree limits must not be negative")
+    _max_depth = max_depth
+    _max_children = max_children
+    _max_frames = max_frames
+
+
+def current_frame():
+    return _current.get()
+
+
+def activate(frame):
+    return _current.set(frame)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+class CallFrame:
+    """One decorated call in a call tree."""
+
+    __slots__ = ("function", "args", "kwargs", "result", "exception", "duration_ns",
+                 "io_log", "children", "depth", "root", "frames", "dropped")
+
+    def __init__(self, function, args, kwargs, parent=None, io_log=None):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.exception = None
+        self.duration_ns = 0
+        self.io_log = io_log
+        self.children = []
+        if parent is None:
+            self.depth = 0
+            self.root = self
+            self.frames = 0
+            self.dropped = 0
+        else:
+            self.depth = parent.depth + 1
+            self.root = parent.root
+            parent.children.append(self)
+            self.root.frames += 1
+
+    def admits_child(self):
+        """Whether a nested call may get a frame; counts it as dropped if not."""
+        root = self.root
+        if self.depth >= _max_depth or len(self.children) >= _max_children or root.frames >= _max_frames:
+            root.dropped += 1
+            return False
+        return True
+
+    def to_dict(self):
+        exception = self.exception
+        frame = {
+            "function": self.function,
+            "args": list(self.args),
+            "kwargs": self.kwargs,
+            "result": self.result,
+            "exception": str(exception) if exception else None,
+            "exception_type": type(exception).__name__ if exception else None,
+            "duration_ms": self.duration_ns / 1e6,
+        }
+        log = self.io_log
+        if log is not None:
+            frame["io_ms"] = log.io_ns / 1e6
+            file_access = log.file_access_log
+            if file_access:
+                frame["file_access"] = file_access
+            if log.http_request_log:
+                frame["http_requests"] = log.http_request_log
+        if self.children:
+            frame["children"] = [child.to_dict() for child in self.children]
+        return frame
+
+    def tree(self):
+        """The child frames of a root frame, as JSON-ready dicts."""
+        return [child.to_dict() for child in self.children]
+
+
+def iter_frames(frames):
+    """Every frame dict of a stored call tree, parents before children."""
+    stack = list(reversed(frames or []))
+    while stack:
+        frame = stack.pop()
+        yield frame
+        stack.extend(reversed(frame.get("children") or []))
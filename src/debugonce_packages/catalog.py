@@ -0,0 +1,365 @@
+"""
+SQLite-backed index of captured sessions.
+
+The catalog lives in ``<storage_dir>/catalog.db`` (WAL mode) and holds one row
+of metadata per session: function, module, exception type and message,
+timestamp, call duration, stored size and where the session body lives. It
+is kept up to date by ``StorageManager`` so ``debugonce list``/``query`` can
+filter sessions without opening a single session body. A second table caches
+the exception fingerprint of every session ``debugonce triage`` has seen, and
+a third records the blobs and environment snapshot each session refers to,
+so deleting sessions can tell which shared entries nobody refers to any more.
+The session count and total stored size are kept as running totals, updated
+in the same transaction as the rows, so retention checks read them without
+scanning the table.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+CATALOG_FILE = "catalog.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    function TEXT,
+    module TEXT,
+    exception_type TEXT,
+    exception TEXT,
+    timestamp REAL,
+    duration_ms REAL,
+    size INTEGER,
+    location TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_timestamp ON sessions (timestamp);
+CREATE INDEX IF NOT EXISTS sessions_function ON sessions (function, timestamp);
+CREATE INDEX IF NOT EXISTS sessions_exception ON sessions (exception_type, timestamp);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    session_id TEXT PRIMARY KEY,
+    fingerprint TEXT,
+    frame TEXT
+);
+CREATE INDEX IF NOT EXISTS fingerprints_fingerprint ON fingerprints (fingerprint);
+CREATE TABLE IF NOT EXISTS refs (
+    session_id TEXT,
+    kind TEXT,
+    digest TEXT
+);
+CREATE INDEX IF NOT EXISTS refs_session ON refs (session_id);
+CREATE INDEX IF NOT EXISTS refs_digest ON refs (digest, kind);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    count INTEGER,
+    bytes INTEGER
+);
+"""
+
+BLOB, ENVIRONMENT = "blob", "env"
+
+COLUMNS = ("session_id", "function", "module", "exception_type", "exception",
+           "timestamp", "duration_ms", "size", "location")
+_SIZE = COLUMNS.index("size")
+
+CLUSTER_COLUMNS = ("fingerprint", "count", "first_seen", "last_seen", "session_id", "location",
+                   "function", "exception_type", "exception", "frame")
+
+_RELATIVE = re.compile(r"^(\d+(?:\.\d+)?)([smhdw])$")
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_time(value):
+    """Parse an ISO timestamp or a relative age such as ``30m``, ``2h`` or ``7d``."""
+    if value is None:
+        return None
+    match = _RELATIVE.match(value.strip())
+    if match:
+        return time.time() - float(match.group(1)) * _UNITS[match.group(2)]
+    return datetime.fromisoformat(value).timestamp()
+
+
+def session_row(session_id, data, size, location):
+    """Build the catalog row for a session body."""
+    timestamp = data.get("timestamp")
+    try:
+        timestamp = datetime.fromisoformat(timestamp).timestamp() if timestamp else None
+    except (TypeError, ValueError):
+        timestamp = None
+    return (
+        session_id,
+        data.get("function"),
+        data.get("module"),
+        data.get("exception_type"),
+        data.get("exception"),
+        timestamp,
+        data.get("duration_ms"),
+        size,
+        location,
+    )
+
+
+def session_refs(session_id, environment_ref, blobs):
+    """The ``refs`` rows of a session: its environment snapshot and blob hashes."""
+    refs = [(session_id, BLOB, digest) for digest in blobs]
+    if environment_ref:
+        refs.append((session_id, ENVIRONMENT, environment_ref))
+    return refs
+
+
+def _filters(function=None, exception=None, module=None, since=None, until=None, before=None, prefix=""):
+    clauses, params = [], []
+    if function is not None:
+        clauses.append(f"{prefix}function = ?")
+        params.append(function)
+    if exception is not None:
+        clauses.append(f"({prefix}exception_type = ? OR {prefix}exception LIKE ?)")
+        params.extend([exception, f"%{exception}%"])
+    if module is not None:
+        clauses.append(f"{prefix}module = ?")
+        params.append(module)
+    if since is not None:
+        clauses.append(f"{prefix}timestamp >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append(f"{prefix}timestamp <= ?")
+        params.append(until)
+    if before is not None:
+        clauses.append(f"{prefix}timestamp < ?")
+        params.append(before)
+    return clauses, params
+
+
+class SessionCatalog:
+    """Session metadata index stored next to the sessions."""
+
+    def __init__(self, storage_dir=".debugonce"):
+        os.makedirs(storage_dir, exist_ok=True)
+        self.path = os.path.join(storage_dir, CATALOG_FILE)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        had_refs = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'refs'").fetchone()
+        self._conn.executescript(_SCHEMA)
+        if not had_refs and self._conn.execute("SELECT 1 FROM sessions LIMIT 1").fetchone():
+            # Sessions indexed before refs were tracked: unknown until the next reindex.
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('refs', 'partial')")
+        # Catalogs from before the running totals get them counted once.
+        self._conn.execute("INSERT OR IGNORE INTO totals (id, count, bytes) "
+                           "SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM sessions")
+
+    @staticmethod
+    def exists(storage_dir=".debugonce"):
+        return os.path.exists(os.path.join(storage_dir, CATALOG_FILE))
+
+    def add_many(self, rows, refs=()):
+        """Index session rows, with the ``refs`` rows (see :func:`session_refs`) they come with."""
+        rows = list(rows)
+        with self._lock:
+            with self._transaction():
+                replaced, replaced_bytes = self._sizes(row[0] for row in rows)
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO sessions ({', '.join(COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(COLUMNS))})",
+                    rows,
+                )
+                self._add_totals(len(rows) - replaced, sum(row[_SIZE] or 0 for row in rows) - replaced_bytes)
+                self._conn.executemany("DELETE FROM refs WHERE session_id = ?", [(row[0],) for row in rows])
+                self._conn.executemany("INSERT INTO refs (session_id, kind, digest) VALUES (?, ?, ?)", refs)
+
+    def set_sizes(self, sizes):
+        """Update the stored size of ``(session_id, size)`` pairs, e.g. after recompression."""
+        sizes = list(sizes)
+        with self._lock:
+            with self._transaction():
+                _, before = self._sizes(session_id for session_id, _ in sizes)
+                self._conn.executemany("UPDATE sessions SET size = ? WHERE session_id = ?",
+                                       [(size, session_id) for session_id, size in sizes])
+                _, after = self._sizes(session_id for session_id, _ in sizes)
+                self._add_totals(0, after - before)
+
+    def remove_many(self, session_ids):
+        """Drop sessions; returns ``(kind, digest)`` of their entries no remaining session refers to.
+
+        Nothing is returned while :meth:`refs_complete` is False.
+        """
+        with self._lock:
+            with self._transaction():
+                ids = [(session_id,) for session_id in session_ids]
+                removed, removed_bytes = self._sizes(session_id for session_id, in ids)
+                candidates = set()
+                for session_id in ids:
+                    candidates.update(self._conn.execute(
+                        "SELECT kind, digest FROM refs WHERE session_id = ?", session_id).fetchall())
+                self._conn.executemany("DELETE FROM sessions WHERE session_id = ?", ids)
+                self._conn.executemany("DELETE FROM fingerprints WHERE session_id = ?", ids)
+                self._conn.executemany("DELETE FROM refs WHERE session_id = ?", ids)
+                self._add_totals(-removed, -removed_bytes)
+                return self._unreferenced(candidates)
+
+    def unreferenced(self, refs):
+        """The ``(kind, digest)`` pairs of ``refs`` that no session refers to."""
+        with self._lock:
+            return self._unreferenced(refs)
+
+    def _unreferenced(self, refs):
+        if not refs or not self._refs_complete():
+            return []
+        return sorted(
+            (kind, digest) for kind, digest in refs
+            if not self._conn.execute("SELECT 1 FROM refs WHERE digest = ? AND kind = ? LIMIT 1",
+                                      (digest, kind)).fetchone()
+        )
+
+    def refs_complete(self):
+        """False while sessions indexed before refs were tracked are still in the catalog."""
+        with self._lock:
+            return self._refs_complete()
+
+    def _refs_complete(self):
+        return self._conn.execute("SELECT 1 FROM meta WHERE key = 'refs'").fetchone() is None
+
+    def clear(self):
+        with self._lock:
+            with self._transaction():
+                self._conn.execute("DELETE FROM sessions")
+                self._conn.execute("DELETE FROM fingerprints")
+                self._conn.execute("DELETE FROM refs")
+                self._conn.execute("DELETE FROM meta WHERE key = 'refs'")
+                self._conn.execute("UPDATE totals SET count = 0, bytes = 0")
+
+    def _sizes(self, session_ids):
+        # (how many of session_ids are indexed, their total size)
+        count = total = 0
+        for session_id in session_ids:
+            row = self._conn.execute("SELECT size FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is not None:
+                count += 1
+                total += row[0] or 0
+        return count, total
+
+    def _add_totals(self, count, size):
+        if count or size:
+            self._conn.execute("UPDATE totals SET count = count + ?, bytes = bytes + ?", (count, size))
+
+    def _transaction(self):
+        return _Transaction(self._conn)
+
+    def query(self, function=None, exception=None, module=None, since=None, until=None,
+              before=None, limit=None, newest_first=True, offset=0):
+        """Return matching rows as dicts, using the indexes only.
+
+        ``exception`` matches either the exception type exactly or a
+        substring of the message. ``until`` is inclusive, ``before`` is not.
+        ``offset`` skips that many matching rows first, for paging.
+        """
+        clauses, params = _filters(function, exception, module, since, until, before)
+        sql = f"SELECT {', '.join(COLUMNS)} FROM sessions"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY timestamp " + ("DESC" if newest_first else "ASC")
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([-1 if limit is None else int(limit), int(offset)])
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def unfingerprinted(self):
+        """``(session_id, location)`` of failed sessions without a cached fingerprint."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT s.session_id, s.location FROM sessions s "
+                "LEFT JOIN fingerprints f ON f.session_id = s.session_id "
+                "WHERE f.session_id IS NULL AND (s.exception_type IS NOT NULL OR s.exception IS NOT NULL)"
+            ).fetchall()
+
+    def add_fingerprints(self, rows):
+        """Cache ``(session_id, fingerprint, frame)`` rows."""
+        with self._lock:
+            with self._transaction():
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO fingerprints (session_id, fingerprint, frame) VALUES (?, ?, ?)", rows)
+
+    def clusters(self, function=None, exception=None, module=None, since=None, until=None, limit=None):
+        """Fingerprinted sessions grouped by fingerprint, largest cluster first.
+
+        Each cluster has its session count, first and last timestamp and the
+        most recent session as its representative.
+        """
+        clauses, params = _filters(function, exception, module, since, until, prefix="s.")
+        sql = ("SELECT f.fingerprint, COUNT(*), MIN(s.timestamp), MAX(s.timestamp), "
+               "s.session_id, s.location, s.function, s.exception_type, s.exception, f.frame "
+               "FROM fingerprints f JOIN sessions s ON s.session_id = f.session_id")
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        # SQLite takes the bare columns from the row holding MAX(s.timestamp).
+        sql += " GROUP BY f.fingerprint ORDER BY COUNT(*) DESC, MAX(s.timestamp) DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(zip(CLUSTER_COLUMNS, row)) for row in rows]
+
+    def oldest(self, limit, function=None, before=None):
+        """``(session_id, size)`` of the oldest sessions, optionally filtered."""
+        clauses, params = [], []
+        if function is not None:
+            clauses.append("function = ?")
+            params.append(function)
+        if before is not None:
+            clauses.append("timestamp < ?")
+            params.append(before)
+        sql = "SELECT session_id, size FROM sessions"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY timestamp ASC LIMIT ?"
+        params.append(int(limit))
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def functions_over(self, quota):
+        """``(function, count)`` for every function with more than ``quota`` sessions."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT function, COUNT(*) FROM sessions GROUP BY function HAVING COUNT(*) > ?",
+                (quota,),
+            ).fetchall()
+
+    def totals(self):
+        """``(session count, total stored bytes)``, from the running totals."""
+        with self._lock:
+            count, total = self._conn.execute("SELECT count, bytes FROM totals").fetchone()
+        return count, total
+
+    def count(self, function=None):
+        """The number of sessions, or of those of ``function`` (counted on its index)."""
+        if function is None:
+            return self.totals()[0]
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions WHERE function = ?", (function,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
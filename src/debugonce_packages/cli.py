@@ -5,6 +5,26 @@ import inspect
 import importlib
 import subprocess
 import sys
+import glob
+import itertools
+import time
+from .blobs import attach_blobs
+from .calltree import iter_frames
+from .environment import resolve_environment
+from .exporter import LATENCY_ENV, SCRIPT_SUFFIX, export_session, export_sessions
+from .ids import is_session_id
+from .replayer import replay_sessions
+from .serializer import decode_state
+from datetime import datetime
+from .catalog import SessionCatalog, parse_time
+from .segments import SegmentLog
+from .stats import load_persisted, summarize
+from .triage import triage as triage_sessions
+from .layout import copy_section
+from .storage import (
+    BACKENDS, SEGMENTS_DIR, StorageManager, clean_storage, iter_session_files, load_session_ref,
+    load_session_sections, open_session_ref, session_path,
+)
 
 @click.group()
 def cli():
@@ -14,14 +34,25 @@ def cli():
 def test_function(a, b, c):
     return a + b + c
 
+# The parts of a session inspect prints; the rest (source, stack trace, I/O logs) is never read.
+INSPECT_SECTIONS = ("function", "args", "kwargs", "result", "exception", "environment_ref",
+                    "environment_variables", "resources", "call_tree", "call_tree_dropped")
+
 @click.command()
-@click.argument('session_file', type=click.Path(exists=True))
-def inspect(session_file):
-    """Inspect a captured session."""
+@click.argument('session_file', type=click.Path())
+@click.option('--section', default=None,
+              help="Print only this top-level part of the session as stored JSON (e.g. args, stack_trace).")
+def inspect(session_file, section):
+    """Inspect a captured session (file path or session id)."""
+    if section is not None:
+        _echo_section(session_file, section)
+        return
     try:
-        with open(session_file, "r") as f:
-            session_data = json.load(f)
-    except json.JSONDecodeError as e:
+        session_data, session_file = load_session_sections(session_file, INSPECT_SECTIONS)
+        resolve_environment(session_data, session_file)
+        decode_state(session_data)
+        attach_blobs(session_data, session_file)
+    except (json.JSONDecodeError, FileNotFoundError) as e:
         click.echo(f"Error reading session file: {e}", err=True)
         sys.exit(1)
 
@@ -42,11 +73,205 @@ def inspect(session_file):
         result = session_data.get("result")
         click.echo(f"Result: {result}")
 
+    env_vars = session_data.get("environment_variables")
+    if env_vars is not None:
+        snapshot = session_data.get("environment_ref")
+        suffix = f" (snapshot {snapshot[:12]})" if snapshot else ""
+        click.echo(f"Environment: {len(env_vars)} variables{suffix}")
+
+    usage = session_data.get("resources")
+    if usage:
+        _echo_resources(usage)
+
+    call_tree = session_data.get("call_tree")
+    if call_tree:
+        frames = sum(1 for _ in iter_frames(call_tree))
+        dropped = session_data.get("call_tree_dropped")
+        click.echo(f"Call tree: {frames} nested calls" + (f" ({dropped} more not recorded)" if dropped else ""))
+        _echo_frames(call_tree, 1, [TREE_LINES])
+
+def _echo_section(ref, section):
+    """Stream one section of a session to stdout without parsing the rest."""
+    out = sys.stdout.buffer
+    try:
+        stream, _ = open_session_ref(ref)
+        with stream:
+            copied = copy_section(stream, section, out.write)
+        if not copied:
+            data, _ = load_session_ref(ref)
+            out.write(json.dumps(data[section], indent=2).encode("utf-8"))
+    except KeyError:
+        click.echo(f"Session has no section '{section}'.", err=True)
+        sys.exit(1)
+    except (ValueError, FileNotFoundError) as e:
+        click.echo(f"Error reading session file: {e}", err=True)
+        sys.exit(1)
+    out.write(b"\n")
+    out.flush()
+
+def _mib(size):
+    return f"{size / (1024 * 1024):.1f} MiB" if size is not None else "?"
+
+def _echo_resources(usage):
+    line = f"Resources: wall {usage['wall_ms']:.2f}ms"
+    if "cpu_user_ms" in usage:
+        line += f", cpu {usage['cpu_user_ms']:.2f}ms user / {usage['cpu_system_ms']:.2f}ms sys"
+    click.echo(line)
+    if "rss_before" in usage:
+        peak = " (new peak)" if usage.get("peak_raised") else ""
+        click.echo(f"  RSS {_mib(usage['rss_before'])} -> {_mib(usage['rss_after'])}, "
+                   f"peak {_mib(usage['rss_peak'])}{peak}")
+        click.echo(f"  Open files {usage['fds_before']} -> {usage['fds_after']}, "
+                   f"threads {usage['threads_before']} -> {usage['threads_after']}")
+    else:
+        click.echo(f"  RSS {_mib(usage['rss_after'])}, peak {_mib(usage['rss_peak'])}, "
+                   f"open files {usage['fds_after']}, threads {usage['threads_after']} (sampled on exception)")
+
+TREE_LINES = 100
+
+def _echo_frames(frames, depth, budget):
+    """Print a call tree, one line per frame, up to ``budget[0]`` lines."""
+    for frame in frames:
+        if budget[0] <= 0:
+            click.echo("  " * depth + "...")
+            return
+        budget[0] -= 1
+        outcome = (f"raised {frame['exception_type']}: {frame['exception']}" if frame.get("exception_type")
+                   else f"-> {frame.get('result')!r}")
+        click.echo(f"{'  ' * depth}{frame['function']}{tuple(frame.get('args') or [])} {outcome} "
+                   f"({frame.get('duration_ms', 0):.2f}ms)")
+        _echo_frames(frame.get("children") or [], depth + 1, budget)
+
+def _catalog_filters(command):
+    """Options shared by the commands that answer from the session catalog."""
+    options = [
+        click.option('--function', 'function_name', default=None, help="Only sessions of this function."),
+        click.option('--exception', default=None, help="Exception type, or a substring of its message."),
+        click.option('--module', default=None, help="Only sessions of functions in this module."),
+        click.option('--since', default=None, help="ISO timestamp or age such as 30m, 2h, 7d."),
+        click.option('--until', default=None, help="ISO timestamp or age such as 30m, 2h, 7d."),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+def _query_catalog(function_name, exception, module, since, until, limit, offset=0):
+    catalog = SessionCatalog(".debugonce")
+    try:
+        return catalog.query(
+            function=function_name,
+            exception=exception,
+            module=module,
+            since=parse_time(since),
+            until=parse_time(until),
+            limit=limit,
+            offset=offset,
+        )
+    finally:
+        catalog.close()
+
 @click.command()
-@click.argument('session_file', type=click.Path(exists=True))
-def replay(session_file):
-    """Replay a captured session by executing the exported script."""
+@click.argument('session_file', type=click.Path(), required=False)
+@click.option('--all', 'export_all', is_flag=True, help="Export every captured session.")
+@click.option('--glob', 'pattern', default=None, help="Export the session files matching this glob.")
+@_catalog_filters
+@click.option('--workers', type=int, default=None, help="Worker processes for bulk exports (default: CPU count).")
+@click.option('--force', is_flag=True, help="Rewrite scripts that are already up to date.")
+def export(session_file, export_all, pattern, function_name, exception, module, since, until, workers, force):
+    """Export bug reproduction scripts.
+
+    Pass a session file or id for a single session, or select many with
+    --all, --glob or the catalog filters.
+    """
+    filtered = any(v is not None for v in (function_name, exception, module, since, until))
+    if session_file is not None and not (export_all or pattern or filtered):
+        try:
+            export_session(session_file, force=force)
+        except json.JSONDecodeError:
+            click.echo("Error reading session file: Invalid JSON format", err=True)
+            sys.exit(1)
+        except FileNotFoundError:
+            click.echo("Error reading session file: File not found", err=True)
+            sys.exit(1)
+        except Exception as e:
+            click.echo(f"Error generating replay script: {str(e)}", err=True)
+            sys.exit(1)
+        return 0
+
+    refs = _selected_refs((), export_all, pattern, function_name, exception, module, since, until)
+    if not refs:
+        click.echo("No matching sessions.")
+        return 0
+
+    with click.progressbar(length=len(refs), label="Exporting", file=sys.stderr) as bar:
+        summary = export_sessions(refs, workers=workers, force=force, progress=lambda _: bar.update(1))
+    for ref, error in summary["errors"]:
+        click.echo(f"Failed to export {ref}: {error}", err=True)
+    click.echo(
+        f"Exported {summary['total']} sessions ({summary['written']} written, {summary['unchanged']} unchanged, "
+        f"{summary['failed']} failed) in {summary['elapsed_s']:.2f}s ({summary['per_s']:.0f} sessions/s)."
+    )
+    if summary["failed"]:
+        sys.exit(1)
+    return 0
+
+@click.command()
+@click.argument('session_files', nargs=-1, type=click.Path())
+@click.option('--all', 'replay_all', is_flag=True, help="Replay every captured session.")
+@click.option('--glob', 'pattern', default=None, help="Replay the session files matching this glob.")
+@_catalog_filters
+@click.option('--workers', type=int, default=None, help="Replays run at the same time (default: CPU count).")
+@click.option('--timeout', type=float, default=30.0, show_default=True, help="Seconds before a replay is killed.")
+@click.option('--json', 'as_json', is_flag=True, help="Print one result object per session as JSON.")
+@click.option('--simulate-latency', is_flag=True, help="Delay recorded HTTP responses by their captured latency.")
+def replay(session_files, replay_all, pattern, function_name, exception, module, since, until, workers, timeout,
+           as_json, simulate_latency):
+    """Replay captured sessions.
+
+    With a single session file or id, runs its exported script and prints
+    the output. With several sessions, --all, --glob or the catalog filters,
+    sessions are exported as needed and replayed on a warm interpreter,
+    and each gets a pass / reproduced / different / timeout / error verdict.
+    """
+    filtered = any(v is not None for v in (function_name, exception, module, since, until))
+    if len(session_files) == 1 and not (replay_all or pattern or filtered or as_json):
+        _replay_script(session_files[0], simulate_latency)
+        return
+    refs = _selected_refs(session_files, replay_all, pattern, function_name, exception, module, since, until)
+    if not refs:
+        click.echo("No matching sessions.")
+        return
+    started = time.perf_counter()
+    if as_json:
+        results = replay_sessions(refs, workers=workers, timeout=timeout, simulate_latency=simulate_latency)
+    else:
+        with click.progressbar(length=len(refs), label="Replaying", file=sys.stderr) as bar:
+            results = replay_sessions(refs, workers=workers, timeout=timeout, progress=lambda _: bar.update(1),
+                                      simulate_latency=simulate_latency)
+    elapsed = time.perf_counter() - started
+    if as_json:
+        click.echo(json.dumps(results, indent=4))
+    else:
+        for result in results:
+            detail = result["actual"]["error"] or result["actual"]["exception_type"] or ""
+            click.echo(f"{result['status']:<10}  {result['session']}  {result['duration_ms']:.1f}ms  {detail}")
+        counts = {}
+        for result in results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+        breakdown = ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+        click.echo(f"Replayed {len(results)} sessions in {elapsed:.2f}s: {breakdown}.")
+    if any(result["status"] in ("error", "timeout") for result in results):
+        sys.exit(1)
+
+def _replay_script(session_file, simulate_latency=False):
+    """Run the exported script of one session in a fresh interpreter."""
     export_file = os.path.splitext(session_file)[0] + ".py"
+    if not os.path.exists(export_file):
+        # A session file or id: look for the script 'export' writes next to it.
+        base = session_file
+        if not os.path.exists(session_file) and not os.path.dirname(session_file):
+            base = session_path(".debugonce", os.path.splitext(session_file)[0])
+        export_file = os.path.splitext(base)[0] + "_replay.py"
 
     # Check if the exported script exists
     if not os.path.exists(export_file):
@@ -59,6 +284,7 @@ def replay(session_file):
             [sys.executable, export_file],  # Execute with the current Python interpreter
             capture_output=True,
             text=True,
+            env={**os.environ, LATENCY_ENV: "1"} if simulate_latency else None,
             check=True  # Raise an exception for non-zero exit codes
         )
         click.echo(result.stdout)
@@ -76,143 +302,258 @@ def replay(session_file):
         click.echo(f"An unexpected error occurred: {e}", err=True)
         sys.exit(1)
 
-@click.command()
-@click.argument('session_file', type=click.Path())
-def export(session_file):
-    """Export a bug reproduction script."""
-    try:
-        with open(session_file, "r") as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError:
-                click.echo("Error reading session file: Invalid JSON format", err=True)
-                sys.exit(1)
-
-        # Validate required fields
-        if "function" not in data:
-            click.echo("Error generating replay script: Missing function name", err=True)
-            sys.exit(1)
 
-        # Extract data with proper key names and defaults
-        func_name = data["function"]
-        args = data.get("args", [])
-        kwargs = data.get("kwargs", {})
-        env_vars = data.get("env_vars", {})
-        cwd = data.get("current_working_directory", os.getcwd())
-        http_requests = data.get("http_requests", [])
-        file_access = data.get("file_access", [])
-        exception = data.get("exception")
-        # Use function_code if present, else function_source, else empty string
-        function_code = data.get("function_code") or data.get("function_source") or ""
-
-        # Generate script content
-        script_lines = ["# Bug Reproduction Script"]
-        script_lines.extend(["import json", "import os", "import sys", "import requests", ""])
-
-        # Set environment variables
-        script_lines.append("# Set environment variables")
-        for key, value in env_vars.items():
-            script_lines.append(f'os.environ["{key}"] = "{value}"')
-        script_lines.append("")
-
-        # Set working directory
-        script_lines.append("# Set current working directory")
-        script_lines.append(f'os.chdir("{cwd}")')
-        script_lines.append("")
-
-        # Make HTTP requests
-        script_lines.append("# Make HTTP requests")
-        for request in http_requests:
-            method = request.get("method", "GET").lower()
-            url = request.get("url", "")
-            headers = request.get("headers", {})
-            if method == "get":
-                script_lines.append(f'requests.get("{url}", headers={json.dumps(headers)})')
-            elif method == "post":
-                body = request.get("body", "")
-                script_lines.append(f'requests.post("{url}", headers={json.dumps(headers)}, data={json.dumps(body)})')
-        script_lines.append("")
-
-        # Access files
-        script_lines.append("# Access files")
-        for file in file_access:
-            mode = file.get("mode", "r")  # Default to 'r' if mode is not specified
-            script_lines.append(f'with open("{file["file"]}", "{mode}") as f:')
-            script_lines.append("    pass")
-        script_lines.append("")
-
-        # Function implementation
-        script_lines.append("# Function implementation")
-        if function_code:
-            # Remove @debugonce decorator if present
-            import re
-            function_code_clean = re.sub(r'@debugonce\s*\n', '', function_code)
-            script_lines.append(function_code_clean)
-        else:
-            script_lines.append(f"def {func_name}(*args, **kwargs):\n    raise NotImplementedError('Function source not available')")
-        script_lines.append("")
-
-        # Main execution
-        # Use repr() for each argument to preserve correct types (strings quoted, numbers as-is, etc.)
-        arg_strs = [repr(arg) for arg in args]
-        script_lines.extend([
-            "if __name__ == \"__main__\":",
-            "    try:",
-            f"        result = {func_name}({', '.join(arg_strs)})",  # Direct function call with repr'd args
-            "        print(f\"Function returned: {result}\")",
-            "    except Exception as e:",
-            "        print(f\"Exception occurred during replay: {e}\", file=sys.stderr)",
-            "        sys.exit(1)"
-        ])
-        # Capture exception if present
-        if exception:
-            script_lines.append(f"print(\"Captured exception: {exception}\")")
-
-        # Write script to file
-        export_file = os.path.splitext(session_file)[0] + "_replay.py"
-        with open(export_file, "w") as f:
-            f.write("\n".join(script_lines))
+def _stored_sessions(session_dir, function_name, exception, module, since, until, limit, offset=0):
+    """Sessions as paths relative to ``session_dir`` (or ids, for the segment log)."""
+    filtered = any(v is not None for v in (function_name, exception, module, since, until))
+    if SessionCatalog.exists(session_dir):
+        rows = _query_catalog(function_name, exception, module, since, until, limit, offset)
+        return [row["session_id"] if row["location"] == SEGMENTS_DIR else row["location"] for row in rows]
+    if filtered:
+        click.echo("No session catalog found. Run 'debugonce reindex' first.", err=True)
+        sys.exit(1)
+    sessions = (os.path.relpath(entry.path, session_dir) for entry in iter_session_files(session_dir))
+    segments_dir = os.path.join(session_dir, SEGMENTS_DIR)
+    if os.path.isdir(segments_dir):
+        sessions = itertools.chain(sessions, SegmentLog(segments_dir).ids())
+    return [*itertools.islice(sessions, offset, None if limit is None else offset + limit)]
 
-        return 0
+def _session_ref(entry):
+    return entry if is_session_id(entry) else os.path.join(".debugonce", entry)
 
-    except FileNotFoundError:
-        click.echo("Error reading session file: File not found", err=True)
-        sys.exit(1)
-    except Exception as e:
-        click.echo(f"Error generating replay script: {str(e)}", err=True)
-        sys.exit(1)
+def _selected_refs(session_files, select_all, pattern, function_name, exception, module, since, until):
+    """Sessions picked by explicit refs, --all, --glob or the catalog filters."""
+    if session_files:
+        return [*session_files]
+    if pattern is not None:
+        return sorted(path for path in glob.glob(pattern, recursive=True) if not path.endswith(SCRIPT_SUFFIX))
+    if select_all or any(v is not None for v in (function_name, exception, module, since, until)):
+        return [_session_ref(entry) for entry in
+                _stored_sessions(".debugonce", function_name, exception, module, since, until, None)]
+    click.echo("Error: pass a session file or id, --all, --glob or a filter.", err=True)
+    sys.exit(2)
 
 @click.command()
-def list():
-    """List all captured sessions."""
+@_catalog_filters
+@click.option('--limit', type=click.IntRange(1), default=50, show_default=True,
+              help="Show at most this many sessions per page.")
+@click.option('--page', type=click.IntRange(1), default=1, show_default=True, help="Page of results to show.")
+def list(function_name, exception, module, since, until, limit, page):
+    """List captured sessions, newest first when a catalog is available."""
     session_dir = ".debugonce"
     if not os.path.exists(session_dir):
         click.echo("No captured sessions found.")
         return
-    sessions = os.listdir(session_dir)
+    # One extra row tells whether there is a next page without counting every match.
+    sessions = _stored_sessions(session_dir, function_name, exception, module, since, until,
+                                limit + 1, (page - 1) * limit)
     if not sessions:
         click.echo("No captured sessions found.")
     else:
         click.echo("Captured sessions:")
-        for session in sessions:
+        for session in sessions[:limit]:
             click.echo(f"- {session}")
+        if len(sessions) > limit:
+            click.echo(f"More sessions on the next page (--page {page + 1}).")
+
+@click.command()
+@_catalog_filters
+@click.option('--limit', type=int, default=50, show_default=True, help="Show at most this many sessions.")
+@click.option('--json', 'as_json', is_flag=True, help="Print matching rows as JSON.")
+def query(function_name, exception, module, since, until, limit, as_json):
+    """Query the session catalog without opening session bodies."""
+    if not SessionCatalog.exists(".debugonce"):
+        click.echo("No session catalog found. Run 'debugonce reindex' first.", err=True)
+        sys.exit(1)
+    rows = _query_catalog(function_name, exception, module, since, until, limit)
+    if as_json:
+        click.echo(json.dumps(rows, indent=4))
+        return
+    if not rows:
+        click.echo("No matching sessions.")
+        return
+    for row in rows:
+        when = datetime.fromtimestamp(row["timestamp"]).isoformat(timespec="seconds") if row["timestamp"] else "-"
+        duration = f"{row['duration_ms']:.2f}ms" if row["duration_ms"] is not None else "-"
+        click.echo(
+            f"{when}  {row['function']}  {row['exception_type'] or 'ok'}  "
+            f"{duration}  {row['size']}B  {row['session_id']}"
+        )
+
+@click.command()
+@_catalog_filters
+@click.option('--limit', type=int, default=20, show_default=True, help="Show at most this many clusters.")
+@click.option('--json', 'as_json', is_flag=True, help="Print the clusters as JSON.")
+def triage(function_name, exception, module, since, until, limit, as_json):
+    """Group failed sessions by exception fingerprint, largest group first."""
+    if not SessionCatalog.exists(".debugonce"):
+        click.echo("No session catalog found. Run 'debugonce reindex' first.", err=True)
+        sys.exit(1)
+    started = time.perf_counter()
+    clusters, fresh = triage_sessions(".debugonce", limit=limit, function=function_name, exception=exception,
+                                      module=module, since=parse_time(since), until=parse_time(until))
+    if as_json:
+        click.echo(json.dumps(clusters, indent=4))
+        return
+    if not clusters:
+        click.echo("No failed sessions.")
+        return
+    for cluster in clusters:
+        first, last = (datetime.fromtimestamp(cluster[key]).isoformat(timespec="seconds") if cluster[key] else "-"
+                       for key in ("first_seen", "last_seen"))
+        click.echo(
+            f"{cluster['count']:>6}  {cluster['exception_type'] or '-'}  {cluster['function']}  "
+            f"{cluster['frame'] or '-'}  {first} .. {last}  {cluster['representative']}"
+        )
+    total = sum(cluster["count"] for cluster in clusters)
+    click.echo(f"{total} failed sessions in {len(clusters)} clusters "
+               f"({fresh} newly fingerprinted, {time.perf_counter() - started:.2f}s).")
+
+@click.command()
+@click.option('--json', 'as_json', is_flag=True, help="Print the merged summary as JSON.")
+def stats(as_json):
+    """Summarize capture overhead persisted by decorated processes."""
+    raw_list = load_persisted(".debugonce")
+    if not raw_list:
+        click.echo("No capture statistics found. Enable them with configure_stats(persist=True).")
+        return
+    summary = summarize(raw_list)
+    if as_json:
+        click.echo(json.dumps(summary, indent=4))
+        return
+    click.echo(f"{'Function':<30} {'Captures':>9} {'p50 overhead':>13} {'p99 overhead':>13} {'Bytes written':>14}")
+    for function, data in summary["functions"].items():
+        overhead = data["phases"].get("overhead", {})
+        click.echo(
+            f"{str(function):<30} {data['captures']:>9} {overhead.get('p50_us', 0):>11.1f}us "
+            f"{overhead.get('p99_us', 0):>11.1f}us {data['bytes_written']:>14}"
+        )
+    sampled = {function: data["resources"] for function, data in summary["functions"].items()
+               if "resources" in data}
+    if sampled:
+        click.echo("Resources:")
+        click.echo(f"{'Function':<30} {'Samples':>8} {'p99 cpu':>11} {'Max RSS growth':>15} "
+                   f"{'Max peak RSS':>13} {'Max fds':>8} {'Max threads':>12}")
+        for function, usage in sampled.items():
+            cpu = summary["functions"][function]["phases"].get("cpu", {})
+            click.echo(
+                f"{str(function):<30} {usage['samples']:>8} {cpu.get('p99_us', 0) / 1000:>9.2f}ms "
+                f"{_mib(usage.get('max_rss_growth')):>15} {_mib(usage.get('max_rss_peak')):>13} "
+                f"{usage.get('max_fds', '?'):>8} {usage.get('max_threads', '?'):>12}"
+            )
+    click.echo(f"Dropped captures: {summary['dropped']}")
+    if summary["slowest_phases"]:
+        click.echo("Slowest capture phases (p99):")
+        for entry in summary["slowest_phases"]:
+            click.echo(f"  {entry['function']}  {entry['phase']}  {entry['p99_us']:.1f}us")
+
+@click.command()
+def reindex():
+    """Rebuild the session catalog from the sessions on disk."""
+    if not os.path.exists(".debugonce"):
+        click.echo("No captured sessions found.")
+        return
+    count = StorageManager(".debugonce").reindex()
+    click.echo(f"Indexed {count} sessions.")
 
 @click.command()
-def clean():
-    """Clean all captured sessions."""
+@click.option('--older-than', default=None, help="Only sessions older than this age (e.g. 7d) or ISO timestamp.")
+@click.option('--function', 'function_name', default=None, help="Only sessions of this function.")
+@click.option('--keep-latest', type=int, default=None, help="Keep the newest N of the selected sessions.")
+def clean(older_than, function_name, keep_latest):
+    """Clean captured sessions, either all of them or a selection."""
     session_dir = ".debugonce"
-    if os.path.exists(session_dir):
-        for file in os.listdir(session_dir):
-            os.remove(os.path.join(session_dir, file))
-        click.echo("Cleared all captured sessions.")
-    else:
+    if not os.path.exists(session_dir):
         click.echo("No captured sessions to clean.")
+        return
+    if older_than is None and function_name is None and keep_latest is None:
+        clean_storage(session_dir)
+        click.echo("Cleared all captured sessions.")
+        return
+    had_catalog = SessionCatalog.exists(session_dir)
+    storage = StorageManager(session_dir)
+    if not had_catalog:
+        storage.reindex()
+    rows = storage.catalog.query(function=function_name, before=parse_time(older_than))
+    victims = [row["session_id"] for row in rows[keep_latest or 0:]]
+    if victims:
+        storage.delete_sessions(victims)
+    click.echo(f"Removed {len(victims)} sessions.")
+
+@click.command()
+@click.option('--socket', 'socket_path', default=None, help="Unix socket to listen on (default: .debugonce/collector.sock).")
+@click.option('--backend', type=click.Choice(BACKENDS), default="files", show_default=True, help="Session storage backend.")
+@click.option('--batch-size', type=int, default=256, show_default=True, help="Sessions written per batch.")
+@click.option('--flush-interval', type=float, default=0.5, show_default=True, help="Seconds between batch writes.")
+@click.option('--max-sessions', type=int, default=None, help="Retention: keep at most this many sessions.")
+@click.option('--max-bytes', type=int, default=None, help="Retention: keep at most this many stored bytes.")
+@click.option('--max-age', default=None, help="Retention: drop sessions older than this age (e.g. 7d).")
+def collect(socket_path, backend, batch_size, flush_interval, max_sessions, max_bytes, max_age):
+    """Receive captures from processes using enable_collector() and store them."""
+    import signal
+    from .collector import DEFAULT_SOCKET, Collector
+    from .retention import RetentionPolicy
+    retention = None
+    if any(v is not None for v in (max_sessions, max_bytes, max_age)):
+        retention = RetentionPolicy(max_bytes=max_bytes, max_sessions=max_sessions,
+                                    max_age=time.time() - parse_time(max_age) if max_age else None)
+    collector = Collector(StorageManager(".debugonce", backend=backend, retention=retention),
+                          socket_path or DEFAULT_SOCKET, batch_size=batch_size, flush_interval=flush_interval)
+    try:
+        collector.listen()
+    except RuntimeError as e:
+        click.echo(f"Error: {e}", err=True)
+        sys.exit(1)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: collector.stop())
+    click.echo(f"Collecting on {collector.socket_path}")
+    collector.serve_forever()
+    counters = collector.counters
+    click.echo(f"Stored {counters['sessions']} sessions in {counters['batches']} batches from "
+               f"{counters['connections']} connections ({counters['errors']} errors).")
+    if counters["dropped"]:
+        click.echo(f"Dropped {counters['dropped']} sessions that could not be stored.", err=True)
+
+def _echo_compacted(stats):
+    click.echo(
+        f"Compacted {stats['records']} sessions: {stats['segments_before']} -> {stats['segments_after']} segments, "
+        f"{stats['bytes_before']} -> {stats['bytes_after']} bytes."
+    )
+
+@click.command()
+@click.option('--level', type=click.IntRange(1, 9), default=6, show_default=True, help="zlib compression level.")
+@click.option('--no-compress', is_flag=True, help="Only compact the segment log, leaving session bodies as they are.")
+def compact(level, no_compress):
+    """Recompress stored sessions with a freshly trained dictionary and compact the segment log."""
+    segments_dir = os.path.join(".debugonce", SEGMENTS_DIR)
+    if no_compress:
+        if not os.path.isdir(segments_dir):
+            click.echo("No segment log to compact.")
+            return
+        _echo_compacted(SegmentLog(segments_dir).compact())
+        return
+    if not os.path.isdir(".debugonce"):
+        click.echo("No sessions to compact.")
+        return
+    storage = StorageManager(".debugonce", catalog=SessionCatalog.exists(".debugonce"))
+    result = storage.recompress(level)
+    if "segments" in result:
+        _echo_compacted(result["segments"])
+    dictionary = result["dictionary"] if result["dictionary"].strip("0") else "none"
+    click.echo(f"Recompressed {result['files']} session files: {result['bytes_before']} -> "
+               f"{result['bytes_after']} bytes (dictionary {dictionary}).")
 
 cli.add_command(inspect)
 cli.add_command(replay)
 cli.add_command(export)
 cli.add_command(list)
 cli.add_command(clean)
+cli.add_command(compact)
+cli.add_command(query)
+cli.add_command(reindex)
+cli.add_command(stats)
+cli.add_command(triage)
+cli.add_command(collect)
 
 def main():
     """Entry point for the CLI."""
@@ -0,0 +1,399 @@
+"""
+A local collector for captures from many processes.
+
+Pre-fork servers run decorated code in many workers. Rather than every
+worker writing into ``.debugonce`` on its own, ``debugonce collect`` runs a
+:class:`Collector` on a Unix domain socket and workers enabled with
+``enable_collector()`` send their captures to it. The collector owns the
+store: it writes sessions in batches, keeps the catalog and retention in one
+place, and writes each environment snapshot once however many workers
+report it. Workers still write large values into the collector's blob store,
+which is content-addressed and safe to write concurrently; a capture that
+falls back to a local write takes its blobs along to the local store.
+
+Frames are a one-byte kind and a four-byte big-endian length followed by the
+payload. On connect the collector sends ``HELLO`` (its storage directory, as
+JSON); workers send ``ENV`` (``<digest>\\n<env JSON>``) the first time they
+reference an environment snapshot and ``SESSION`` (``<session id>\\n<session
+JSON>``) for every capture.
+
+:class:`CollectorClient` never waits on the collector. Its socket is
+non-blocking; when the collector is down, or the socket buffer is full, the
+capture is written locally instead, and reconnecting is retried at most once
+a second. A capture whose frame was only partly sent when the connection
+fails is written locally too. The collector keeps a batch it failed to store
+and retries it on the next flush.
+"""
+
+import atexit
+import json
+import os
+import selectors
+import socket
+import struct
+import threading
+import time
+from .blobs import store_blobs
+from .environment import get_snapshot, persist_environment, release_snapshot
+from .serializer import dumps
+
+DEFAULT_SOCKET = os.path.join(".debugonce", "collector.sock")
+HELLO, ENV, SESSION = 1, 2, 3
+MAX_FRAME = 256 * 1024 * 1024
+RETRY_INTERVAL = 1.0
+
+_HEADER = struct.Struct("!BI")
+
+
+def frame(kind, payload):
+    return _HEADER.pack(kind, len(payload)) + payload
+
+
+class FrameReader:
+    """Splits a byte stream into ``(kind, payload)`` frames."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+        frames = []
+        offset = 0
+        while len(self.buffer) - offset >= _HEADER.size:
+            kind, length = _HEADER.unpack_from(self.buffer, offset)
+            if length > MAX_FRAME:
+                raise ValueError(f"Frame of {length} bytes exceeds the limit")
+            end = offset + _HEADER.size + length
+            if len(self.buffer) < end:
+                break
+            frames.append((kind, bytes(self.buffer[offset + _HEADER.size:end])))
+            offset = end
+        del self.buffer[:offset]
+        return frames
+
+
+def _read_frame(sock):
+    reader = FrameReader()
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            raise ConnectionError("Collector closed the connection")
+        frames = reader.feed(chunk)
+        if frames:
+            return frames[0]
+
+
+class CollectorClient:
+    """Sends captures to a collector, or hands them back for a local write.
+
+    ``fallback`` is called with ``[(session_id, state, blobs)]`` for captures
+    that were already prepared for the collector when sending them failed,
+    including one whose frame was only partly sent when the connection broke.
+    ``blobs`` holds the ``(hash, payload)`` pairs the capture references, so
+    the fallback can store them where it writes the session.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, fallback=None, connect_timeout=0.05):
+        self.socket_path = socket_path
+        self.fallback = fallback
+        self.connect_timeout = connect_timeout
+        self.storage_dir = None
+        self.counters = {"sent": 0, "fallback": 0, "connects": 0}
+        self._lock = threading.Lock()
+        self._sock = None
+        self._pid = None
+        self._pending = b""
+        self._unsent = None  # (session_id, state, blobs) whose frame is still in _pending
+        self._sent_envs = set()
+        self._retry_at = 0.0
+        atexit.register(self.close)
+
+    def submit(self, session_id, state, prepare):
+        """Send a capture; ``prepare(state, storage_dir, blobs)`` encodes it first.
+
+        Returns False, with ``state`` untouched, if the collector can't take
+        it right now.
+        """
+        with self._lock:
+            if not self._ready():
+                self.counters["fallback"] += 1
+                return False
+            blobs = []
+            prepare(state, self.storage_dir, blobs)
+            store_blobs(self.storage_dir, blobs)
+            frames = []
+            digest = state.get("environment_ref")
+            env_frame = b""
+            if digest and digest not in self._sent_envs:
+                env = get_snapshot(digest)
+                if env is not None:
+                    env_frame = frame(ENV, digest.encode("ascii") + b"\n" + json.dumps(env).encode("utf-8"))
+                    frames.append(env_frame)
+            frames.append(frame(SESSION, session_id.encode("ascii") + b"\n" + dumps(state)))
+            data = b"".join(frames)
+            try:
+                sent = self._sock.send(data)
+            except BlockingIOError:
+                sent = 0
+            except OSError:
+                self._disconnect()
+                sent = 0
+            if sent == 0:
+                self.counters["fallback"] += 1
+                if self.fallback is not None:
+                    self.fallback([(session_id, state, blobs)])
+                return True
+            if digest:
+                self._sent_envs.add(digest)
+            if env_frame and sent >= len(env_frame):
+                release_snapshot(digest)  # the collector writes it from here on
+            self._pending = data[sent:]
+            if self._pending:
+                self._unsent = (session_id, state, blobs)
+            else:
+                self.counters["sent"] += 1
+            return True
+
+    def _ready(self):
+        if self._sock is not None and self._pid != os.getpid():
+            # A forked child must not write into its parent's connection;
+            # closing the inherited descriptor leaves the parent's open.
+            self._sock.close()
+            self._sock = None
+        if self._sock is None and not self._connect():
+            return False
+        if self._pending:
+            try:
+                sent = self._sock.send(self._pending)
+            except BlockingIOError:
+                return False
+            except OSError:
+                self._disconnect()
+                return False
+            self._pending = self._pending[sent:]
+            if not self._pending:
+                self._unsent = None
+                self.counters["sent"] += 1
+        return not self._pending
+
+    def _connect(self):
+        now = time.monotonic()
+        if now < self._retry_at:
+            return False
+        if not os.path.exists(self.socket_path):
+            self._retry_at = now + RETRY_INTERVAL
+            return False
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.connect_timeout)
+            sock.connect(self.socket_path)
+            kind, payload = _read_frame(sock)
+            if kind != HELLO:
+                raise ConnectionError("Unexpected greeting from collector")
+            self.storage_dir = json.loads(payload)["storage_dir"]
+            sock.setblocking(False)
+        except (OSError, ValueError, KeyError):
+            sock.close()
+            self._retry_at = now + RETRY_INTERVAL
+            return False
+        self._sock = sock
+        self._pid = os.getpid()
+        self._pending = b""
+        self._unsent = None  # inherited from the parent, which still sends it
+        self._sent_envs = set()
+        self.counters["connects"] += 1
+        return True
+
+    def _disconnect(self):
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = None
+        self._pending = b""
+        self._retry_at = time.monotonic() + RETRY_INTERVAL
+        unsent, self._unsent = self._unsent, None
+        if unsent is not None:
+            # The collector drops a partial frame, so write this capture here instead.
+            self.counters["fallback"] += 1
+            if self.fallback is not None:
+                self.fallback([unsent])
+
+    def close(self, timeout=1.0):
+        """Send whatever is still buffered (waiting up to ``timeout``) and disconnect."""
+        atexit.unregister(self.close)
+        with self._lock:
+            if self._sock is None or self._pid != os.getpid():
+                return
+            if self._pending:
+                try:
+                    self._sock.settimeout(timeout)
+                    self._sock.sendall(self._pending)
+                except OSError:
+                    pass
+                else:
+                    self._unsent = None
+                    self.counters["sent"] += 1
+            self._disconnect()
+
+
+class Collector:
+    """Receives captures over a Unix socket and writes them to ``storage`` in batches."""
+
+    def __init__(self, storage, socket_path=DEFAULT_SOCKET, batch_size=256, flush_interval=0.5,
+                 max_backlog=100000):
+        self.storage = storage
+        self.socket_path = socket_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backlog = max_backlog
+        self.counters = {"connections": 0, "sessions": 0, "batches": 0, "environments": 0,
+                         "duplicates": 0, "errors": 0, "dropped": 0}
+        self._batch = []
+        self._seen = set()
+        self._envs = set()
+        self._stopping = threading.Event()
+        self._listener = None
+        self._readers = {}
+
+    def listen(self):
+        directory = os.path.dirname(self.socket_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+            except OSError:
+                os.remove(self.socket_path)  # left behind by a collector that died
+            else:
+                raise RuntimeError(f"A collector is already listening on {self.socket_path}")
+            finally:
+                probe.close()
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        self._listener.listen(128)
+        self._listener.setblocking(False)
+
+    def serve_forever(self):
+        if self._listener is None:
+            self.listen()
+        selector = selectors.DefaultSelector()
+        selector.register(self._listener, selectors.EVENT_READ)
+        hello = frame(HELLO, json.dumps({"storage_dir": os.path.abspath(self.storage.storage_dir)}).encode())
+        flush_at = time.monotonic() + self.flush_interval
+        stored = True  # after a failed flush, wait for the interval before retrying
+        try:
+            while not self._stopping.is_set():
+                for key, _ in selector.select(timeout=max(flush_at - time.monotonic(), 0)):
+                    if key.fileobj is self._listener:
+                        self._accept(selector, hello)
+                    else:
+                        self._receive(selector, key.fileobj)
+                if (stored and len(self._batch) >= self.batch_size) or time.monotonic() >= flush_at:
+                    stored = self.flush()
+                    flush_at = time.monotonic() + self.flush_interval
+        finally:
+            for conn in list(self._readers):
+                selector.unregister(conn)
+                self._drain(conn)
+                conn.close()
+            self._readers.clear()
+            selector.close()
+            if not self.flush():
+                self.counters["dropped"] += len(self._batch)
+                self._batch = []
+            self._listener.close()
+            self._listener = None
+            try:
+                os.remove(self.socket_path)
+            except OSError:
+                pass
+
+    def stop(self):
+        self._stopping.set()
+
+    def _accept(self, selector, hello):
+        try:
+            conn, _ = self._listener.accept()
+        except BlockingIOError:
+            return
+        try:
+            conn.sendall(hello)
+        except OSError:
+            conn.close()
+            return
+        conn.setblocking(False)
+        self._readers[conn] = FrameReader()
+        selector.register(conn, selectors.EVENT_READ)
+        self.counters["connections"] += 1
+
+    def _receive(self, selector, conn):
+        try:
+            data = conn.recv(1024 * 1024)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if data:
+            try:
+                self._handle(self._readers[conn].feed(data))
+                return
+            except ValueError:
+                self.counters["errors"] += 1
+        selector.unregister(conn)
+        del self._readers[conn]
+        conn.close()
+
+    def _drain(self, conn):
+        """Read what a connection still has buffered before shutting down."""
+        while True:
+            try:
+                data = conn.recv(1024 * 1024)
+                if not data:
+                    return
+                self._handle(self._readers[conn].feed(data))
+            except (OSError, ValueError):
+                return
+
+    def _handle(self, frames):
+        for kind, payload in frames:
+            name, _, body = payload.partition(b"\n")
+            name = name.decode("ascii")
+            try:
+                if kind == SESSION:
+                    if name in self._seen:
+                        self.counters["duplicates"] += 1
+                        continue
+                    self._seen.add(name)
+                    self._batch.append((name, json.loads(body)))
+                elif kind == ENV and name not in self._envs:
+                    persist_environment(self.storage.storage_dir, name, json.loads(body))
+                    self._envs.add(name)
+                    self.counters["environments"] += 1
+            except (OSError, ValueError):
+                self.counters["errors"] += 1
+
+    def flush(self):
+        """Store the sessions received so far; a batch that fails to store is kept and retried.
+
+        Returns False if it failed. At most ``max_backlog`` sessions are kept
+        waiting; the oldest past that are dropped and counted.
+        """
+        if not self._batch:
+            return True
+        batch, self._batch = self._batch, []
+        try:
+            self.storage.save_sessions(batch)
+        except IOError:
+            self.counters["errors"] += 1
+            self._batch = batch + self._batch
+            excess = len(self._batch) - self.max_backlog
+            if excess > 0:
+                del self._batch[:excess]
+                self.counters["dropped"] += excess
+            return False
+        self.counters["sessions"] += len(batch)
+        self.counters["batches"] += 1
+        if len(self._seen) > 100000:
+            self._seen.clear()
+        return True
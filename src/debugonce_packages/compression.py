@@ -0,0 +1,280 @@
+"""
+Dictionary compression for stored sessions.
+
+Consecutive sessions are nearly identical: the same keys, source, imports
+and interpreter details. With ``configure_storage(compression="zlib")`` each
+session body is deflated with a preset dictionary (zlib's ``zdict``) trained
+from recent sessions, so what they share costs a back-reference instead of
+being stored again.
+
+A compressed body starts with a header that no JSON document can start
+with::
+
+    b"\\x00DO" | format version (1 byte) | dictionary id (8 bytes, zeros for none)
+
+followed by a zlib stream. Anything else is read as plain JSON, so stores
+can mix plain and compressed sessions and older sessions stay readable.
+
+Dictionaries live in ``<store>/dicts/<id>.zdict``, named by the first 8
+bytes of their SHA-256; ``dicts/current`` holds the id new sessions use.
+They are never rewritten, so a session stays decodable as long as its
+dictionary file is kept.
+"""
+
+import hashlib
+import io
+import os
+import struct
+import threading
+import zlib
+
+MAGIC = b"\x00DO"
+VERSION = 1
+HEADER = struct.Struct(">3sB8s")
+NO_DICTIONARY = bytes(8)
+DICT_DIR = "dicts"
+CURRENT = "current"
+DICT_SIZE = 32 * 1024  # deflate only looks back 32 KiB
+TRAIN_SAMPLES = 64
+COVERED = 0.25  # a sample compressing this well is already represented
+CHUNK = 64 * 1024
+
+_cache = {}  # dictionary id -> dictionary bytes
+_cache_lock = threading.Lock()
+
+
+def is_compressed(payload):
+    return payload[:len(MAGIC)] == MAGIC
+
+
+def _deflated_size(data, dictionary=None):
+    deflater = zlib.compressobj(6, zdict=dictionary) if dictionary else zlib.compressobj(6)
+    return len(deflater.compress(data) + deflater.flush())
+
+
+def train_dictionary(samples, size=DICT_SIZE):
+    """Build a zlib preset dictionary from sample session bodies, oldest first.
+
+    Deflate matches whole runs of a session against the dictionary, so it is
+    made of sample sessions rather than loose strings. Going from the newest
+    sample back, a sample the dictionary so far doesn't already compress
+    well goes in, so every kind of session seen recently is represented;
+    space left over is filled with the remaining samples, newest first. The
+    newest distinct samples end up last, where deflate reaches them with the
+    shortest distances.
+    """
+    limit = size // 4
+    distinct, common, used = [], [], 0
+    for sample in reversed(samples):
+        sample = bytes(sample[:limit])
+        if not sample:
+            continue
+        dictionary = b"".join(reversed(distinct))
+        if used + len(sample) <= size and (
+                not dictionary or _deflated_size(sample, dictionary) > _deflated_size(sample) * COVERED):
+            distinct.append(sample)
+            used += len(sample)
+        else:
+            common.append(sample)
+    filler = []
+    for sample in common:
+        if used + len(sample) > size:
+            break
+        filler.append(sample)
+        used += len(sample)
+    return b"".join(reversed(filler)) + b"".join(reversed(distinct))
+
+
+def dictionary_id(dictionary):
+    return hashlib.sha256(dictionary).digest()[:8]
+
+
+def save_dictionary(storage_dir, dictionary):
+    """Store ``dictionary`` and make it the one new sessions are compressed with."""
+    directory = os.path.join(storage_dir, DICT_DIR)
+    os.makedirs(directory, exist_ok=True)
+    dict_id = dictionary_id(dictionary)
+    path = os.path.join(directory, f"{dict_id.hex()}.zdict")
+    if not os.path.exists(path):
+        _replace(path, dictionary)
+    _replace(os.path.join(directory, CURRENT), dict_id.hex().encode("ascii"))
+    with _cache_lock:
+        _cache[dict_id] = dictionary
+    return dict_id
+
+
+def _replace(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def load_dictionary(dict_id, path):
+    """The dictionary ``dict_id``, read from ``path`` the first time."""
+    dictionary = _cache.get(dict_id)
+    if dictionary is None:
+        if path is None:
+            raise FileNotFoundError(f"Compression dictionary {dict_id.hex()} not found")
+        with open(path, "rb") as f:
+            dictionary = f.read()
+        if dictionary_id(dictionary) != dict_id:
+            raise ValueError(f"Compression dictionary {path} is corrupt")
+        with _cache_lock:
+            _cache[dict_id] = dictionary
+    return dictionary
+
+
+class InflatingReader:
+    """A read-only file object over a compressed body, inflated as it is read."""
+
+    def __init__(self, f, inflater):
+        self._f = f
+        self._inflater = inflater
+        self._buffer = bytearray()
+        self._done = False
+
+    def _fill(self):
+        data = self._inflater.unconsumed_tail or self._f.read(CHUNK)
+        if data:
+            self._buffer += self._inflater.decompress(data, CHUNK)
+            return
+        self._buffer += self._inflater.flush()
+        self._done = True
+        if not self._inflater.eof:
+            raise ValueError("Truncated compressed session")
+
+    def read(self, size=-1):
+        while not self._done and (size < 0 or len(self._buffer) < size):
+            self._fill()
+        if size < 0 or size >= len(self._buffer):
+            data, self._buffer = bytes(self._buffer), bytearray()
+            return data
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def readline(self, size=-1):
+        start = 0
+        while True:
+            end = self._buffer.find(b"\n", start)
+            if end >= 0:
+                return self.read(end + 1 if size < 0 else min(end + 1, size))
+            if self._done or 0 <= size <= len(self._buffer):
+                return self.read(size)
+            start = len(self._buffer)
+            self._fill()
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def open_stream(f, find_dictionary):
+    """Return a file object reading the plain body behind binary file ``f``.
+
+    Plain bodies come back as ``f`` itself, rewound; compressed ones as an
+    :class:`InflatingReader`. ``find_dictionary(name)`` returns the path of
+    ``dicts/<name>`` or None.
+    """
+    head = f.read(HEADER.size)
+    if not is_compressed(head):
+        f.seek(0)
+        return f
+    if len(head) < HEADER.size:
+        raise ValueError("Truncated compressed session header")
+    _, version, dict_id = HEADER.unpack(head)
+    if version != VERSION:
+        raise ValueError(f"Unsupported session compression version {version}")
+    if dict_id == NO_DICTIONARY:
+        return InflatingReader(f, zlib.decompressobj())
+    path = None if dict_id in _cache else find_dictionary(f"{dict_id.hex()}.zdict")
+    return InflatingReader(f, zlib.decompressobj(zdict=load_dictionary(dict_id, path)))
+
+
+def read_stream(f, find_dictionary):
+    """Read a whole session body from binary file ``f``, inflating it chunk by chunk."""
+    return open_stream(f, find_dictionary).read()
+
+
+def decompress(payload, find_dictionary):
+    """Plain JSON bytes of a stored session body, compressed or not."""
+    if not is_compressed(payload):
+        return payload
+    return read_stream(io.BytesIO(payload), find_dictionary)
+
+
+class SessionCompressor:
+    """Compresses session bodies for one store, training its dictionary when there is none.
+
+    Until a dictionary exists, bodies are deflated without one and the first
+    ``TRAIN_SAMPLES`` are kept to train it. A dictionary trained by another
+    process (e.g. ``debugonce compact``) is picked up by :meth:`refresh`.
+    """
+
+    def __init__(self, storage_dir, level=6):
+        self.storage_dir = storage_dir
+        self.level = level
+        self.current = (NO_DICTIONARY, None)  # (dictionary id, dictionary), swapped as one
+        self._samples = []
+        self._current_mtime = None
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def _current_path(self):
+        return os.path.join(self.storage_dir, DICT_DIR, CURRENT)
+
+    def refresh(self):
+        """Switch to the store's current dictionary if it changed."""
+        try:
+            mtime = os.stat(self._current_path()).st_mtime_ns
+            if mtime == self._current_mtime:
+                return
+            with open(self._current_path(), "rb") as f:
+                dict_id = bytes.fromhex(f.read().decode("ascii").strip())
+            dictionary = load_dictionary(dict_id, os.path.join(self.storage_dir, DICT_DIR, f"{dict_id.hex()}.zdict"))
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            self.current = (dict_id, dictionary)
+            self._current_mtime = mtime
+            self._samples = []
+
+    def compress(self, body):
+        if self.current[1] is None:
+            self._sample(body)
+        dict_id, dictionary = self.current
+        if dictionary is None:
+            deflater = zlib.compressobj(self.level)
+        else:
+            deflater = zlib.compressobj(self.level, zdict=dictionary)
+        return HEADER.pack(MAGIC, VERSION, dict_id) + deflater.compress(body) + deflater.flush()
+
+    def _sample(self, body):
+        with self._lock:
+            if self.current[1] is not None:
+                return
+            self._samples.append(bytes(body))
+            if len(self._samples) < TRAIN_SAMPLES:
+                return
+            samples, self._samples = self._samples, []
+        self.train(samples)
+
+    def train(self, samples):
+        """Train a dictionary from ``samples`` (oldest first), store it and use it from now on."""
+        dictionary = train_dictionary(samples)
+        if not dictionary:
+            return None
+        dict_id = save_dictionary(self.storage_dir, dictionary)
+        with self._lock:
+            self.current = (dict_id, dictionary)
+            try:
+                self._current_mtime = os.stat(self._current_path()).st_mtime_ns
+            except OSError:
+                pass
+        return dict_id
@@ -1,118 +1,179 @@
 import functools
-import inspect
-import requests
-from requests import sessions
-import json
 import os
 import sys
-import traceback
-from datetime import datetime
-import builtins  # To override the built-in open function
-import logging
-from logging.handlers import RotatingFileHandler
+import threading
+import time
 
-# Configure logging
+# The capture machinery (I/O hooks, call tree, stats, storage, serializer,
+# source lookup, ...) and the log file are set up on the first call of a
+# decorated function, not on import: importing debugonce should cost next to
+# nothing and must not touch the filesystem.
 log_file = os.path.join(".debugonce", "debugonce.log")
-os.makedirs(os.path.dirname(log_file), exist_ok=True)
-logger = logging.getLogger("debugonce")
-logger.setLevel(logging.DEBUG)
+logger = None
+handler = None
+_ready = False
+_ready_lock = threading.Lock()
 
-# Remove all handlers before adding our file handler to avoid accidental stdout/stderr logging
-for handler in list(logger.handlers):
-    logger.removeHandler(handler)
+def _setup_logging():
+    global logger, handler
+    import logging
+    from logging.handlers import RotatingFileHandler
+    logger = logging.getLogger("debugonce")
+    logger.setLevel(logging.DEBUG)
 
-handler = RotatingFileHandler(log_file, maxBytes=5*1024*1024, backupCount=3)
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+    # Remove all handlers before adding our file handler to avoid accidental stdout/stderr logging
+    for old_handler in list(logger.handlers):
+        logger.removeHandler(old_handler)
 
-def debugonce(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        import unittest.mock
-        file_access_log = []
-        http_request_log = []
+    try:
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
+        handler = RotatingFileHandler(log_file, maxBytes=5*1024*1024, backupCount=3)
+    except OSError:
+        # e.g. a read-only filesystem: capture without a log file
+        handler = logging.NullHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+def _ensure_ready():
+    """Import the capture machinery and set up logging, once."""
+    global _ready, traceback, externalize, store_blobs, persist_environment, snapshot_environment
+    global get_source_and_imports, new_session_id, encode_state, get_default_storage
+    global calltree, hooks, resources, stats, CallFrame, IOLog, datetime
+    if _ready:
+        return
+    with _ready_lock:
+        if _ready:
+            return
+        _setup_logging()
+        import traceback
+        from datetime import datetime
+        from . import calltree, hooks, resources, stats
+        from .calltree import CallFrame
+        from .hooks import IOLog
+        from .blobs import externalize, store_blobs
+        from .environment import persist_environment, snapshot_environment
+        from .source_cache import get_source_and_imports
+        from .ids import new_session_id
+        from .serializer import encode_state
+        from .storage import get_default_storage
+        _ready = True
 
-        def normalize_url(method, url):
-            try:
-                return requests.Request(method, url).prepare().url
-            except Exception:
-                return url
+def debugonce(func=None, *, trace=False):
+    """Capture calls of ``func``; ``trace=True`` also records the functions it calls.
 
+    Use as ``@debugonce`` or ``@debugonce(trace=True)``. See
+    :mod:`debugonce_packages.tracing` for what tracing records.
+    """
+    if func is None:
+        return functools.partial(debugonce, trace=trace)
+    if trace:
+        from .tracing import Tracer
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _ready:
+            _ensure_ready()
+        parent = calltree.current_frame()
+        if parent is not None:
+            # Inside another capture: record a frame in its call tree.
+            if not parent.admits_child():
+                return func(*args, **kwargs)
+            return _call_nested(func, parent, args, kwargs)
+        entered = time.perf_counter_ns()
+        io_log = IOLog()
+        root = CallFrame(func.__name__, args, kwargs)
         exception = None
         result = None
-        import builtins as _builtins
-        # Get the current open and request (may be a mock) at call time
-        def get_wrapped_open():
-            real_open = _builtins.open
-            def open_wrapper(file, mode='r', *a, **k):
-                if any(m in mode for m in ['w', 'a', 'x']):
-                    operation = 'write'
-                elif 'r' in mode:
-                    operation = 'read'
-                else:
-                    operation = 'other'
-                file_access_log.append({
-                    "file": file,
-                    "mode": mode,
-                    "operation": operation,
-                    "timestamp": datetime.now().isoformat()
-                })
-                return real_open(file, mode, *a, **k)
-            return open_wrapper
-        def get_wrapped_request():
-            real_request = sessions.Session.request
-            def request_wrapper(self, method, url, *a, **k):
-                response = real_request(self, method, url, *a, **k)
-                http_request_log.append({
-                    "method": method,
-                    "url": normalize_url(method, url),
-                    "status_code": getattr(response, 'status_code', None),
-                    "timestamp": datetime.now().isoformat()
-                })
-                return response
-            return request_wrapper
-        with unittest.mock.patch('builtins.open', new=get_wrapped_open()):
-            with unittest.mock.patch.object(sessions.Session, 'request', new=get_wrapped_request()):
-                try:
-                    result = func(*args, **kwargs)
-                except Exception as e:
-                    exception = e
-                    result = None
+        token = hooks.activate(io_log)
+        frame_token = calltree.activate(root)
+        tracer = Tracer() if trace else None
+        sampled = resources.mode
+        before = resources.sample() if sampled == resources.ALWAYS else None
+        start = time.perf_counter_ns()
+        try:
+            if tracer is not None:
+                tracer.start()
+            result = func(*args, **kwargs)
+        except Exception as e:
+            exception = e
+            result = None
+        finally:
+            if tracer is not None:
+                tracer.stop()
+            returned = time.perf_counter_ns()
+            calltree.deactivate(frame_token)
+            hooks.deactivate(token)
+            io_log.files.finish()
+        usage = None
+        if sampled is not None and (before is not None or exception is not None):
+            usage = resources.usage(sampled, before, resources.sample(), returned - start)
         # Save state, but never let it swallow the original exception
         try:
             capture_state(
                 func, args, kwargs,
                 result=result,
                 exception=exception,
-                file_access_log=file_access_log,
-                request_log=http_request_log
+                file_access_log=io_log.file_access_log,
+                file_events=io_log.files.events(),
+                request_log=io_log.http_request_log,
+                duration_ms=(returned - start) / 1e6,
+                call_tree=root,
+                trace=tracer,
+                resource_usage=usage
             )
         except Exception:
             logger.exception("Error capturing state in debugonce decorator")
-        logger.info(f"Captured state for function {func.__name__} at {datetime.now().isoformat()}")
+        logger.info("Captured state for function %s", func.__name__)
+        stats.record(func.__name__, "overhead", (start - entered) + (time.perf_counter_ns() - returned))
+        stats.record(func.__name__, "io", io_log.io_ns)
+        if usage is not None:
+            stats.record_resources(func.__name__, usage)
+        stats.count(func.__name__, captures=1)
         if exception is not None:
             raise exception
         return result
     return wrapper
 
-def capture_state(func, args, kwargs, result=None, exception=None, file_access_log=None, request_log=None):
-    # Get function source code and imports
+def _call_nested(func, parent, args, kwargs):
+    frame = CallFrame(func.__name__, args, kwargs, parent, IOLog())
+    token = hooks.activate(frame.io_log)
+    frame_token = calltree.activate(frame)
+    start = time.perf_counter_ns()
     try:
-        func_source = inspect.getsource(func)
-        module = inspect.getmodule(func)
-        imports = [line for line in inspect.getsource(module).split('\n') if line.startswith('import') or line.startswith('from')]
+        frame.result = func(*args, **kwargs)
+        return frame.result
     except Exception as e:
-        func_source = f"def {func.__name__}(*args, **kwargs):\n    raise NotImplementedError('Source code not available')"
-        imports = []
+        frame.exception = e
+        raise
+    finally:
+        frame.duration_ns = time.perf_counter_ns() - start
+        calltree.deactivate(frame_token)
+        hooks.deactivate(token)
+        frame.io_log.files.finish()
+
+def capture_state(func, args, kwargs, result=None, exception=None, file_access_log=None, request_log=None,
+                  duration_ms=None, file_events=None, call_tree=None, trace=None,
+                  resource_usage=None):
+    _ensure_ready()
+    # Get function source code and imports (memoized per code object)
+    started = time.perf_counter_ns()
+    func_source, imports = get_source_and_imports(func)
+    looked_up = time.perf_counter_ns()
+    environment_ref = snapshot_environment()
+    stats.record(func.__name__, "source", looked_up - started)
+    stats.record(func.__name__, "environment", time.perf_counter_ns() - looked_up)
 
     state = {
         "function": func.__name__,
+        "module": getattr(func, "__module__", None),
         "args": list(args),
         "kwargs": kwargs,
         "result": result,
         "exception": str(exception) if exception else None,
-        "environment_variables": dict(os.environ),
+        "exception_type": type(exception).__name__ if exception else None,
+        "duration_ms": duration_ms,
+        "environment_ref": environment_ref,
         "current_working_directory": os.getcwd(),
         "python_version": sys.version,
         "timestamp": datetime.now().isoformat(),
@@ -122,14 +183,146 @@ def capture_state(func, args, kwargs, result=None, exception=None, file_access_l
         "imports": imports
     }
 
+    if file_events:
+        state["file_events"] = file_events
+
+    if call_tree is not None and call_tree.children:
+        state["call_tree"] = call_tree.tree()
+    if call_tree is not None and call_tree.dropped:
+        state["call_tree_dropped"] = call_tree.dropped
+
+    if trace is not None:
+        state["trace"] = trace.to_dict()
+
+    if resource_usage is not None:
+        state["resources"] = resource_usage
+
     if exception:
-        state["stack_trace"] = traceback.format_exc()
+        # capture_state runs after the except block, so format the exception itself.
+        state["stack_trace"] = "".join(
+            traceback.format_exception(type(exception), exception, exception.__traceback__))
 
     save_state(state)
 
+_async_writer = None
+_log_listener = None
+
+def enable_async_writer(max_queue=1000, batch_size=64, flush_interval=0.5, policy="block"):
+    """Write captured sessions from a background thread instead of inline.
+
+    ``policy`` decides what happens when ``max_queue`` states are already
+    waiting: ``"block"`` the caller, ``"drop_oldest"`` or ``"drop_new"``.
+    Log records are routed through a queue handler while the writer is on.
+    """
+    global _async_writer, _log_listener
+    import queue
+    from logging.handlers import QueueHandler, QueueListener
+    from .writer import AsyncSessionWriter
+    _ensure_ready()
+    disable_async_writer()
+    _async_writer = AsyncSessionWriter(
+        _write_pending,
+        max_queue=max_queue,
+        batch_size=batch_size,
+        flush_interval=flush_interval,
+        policy=policy,
+    )
+    log_queue = queue.SimpleQueue()
+    logger.removeHandler(handler)
+    logger.addHandler(QueueHandler(log_queue))
+    _log_listener = QueueListener(log_queue, handler)
+    _log_listener.start()
+    return _async_writer
+
+def disable_async_writer():
+    """Flush and stop the background writer, restoring inline writes."""
+    global _async_writer, _log_listener
+    if _async_writer is not None:
+        _async_writer.close()
+        _async_writer = None
+    if _log_listener is not None:
+        from logging.handlers import QueueHandler
+        for queue_handler in [h for h in logger.handlers if isinstance(h, QueueHandler)]:
+            logger.removeHandler(queue_handler)
+        _log_listener.stop()
+        _log_listener = None
+        logger.addHandler(handler)
+
+def get_async_writer():
+    return _async_writer
+
+_collector = None
+
+def enable_collector(socket_path=None):
+    """Send captures to a ``debugonce collect`` process instead of writing them here.
+
+    Captures are written locally whenever the collector can't take them
+    right away, so a missing or slow collector never blocks the caller.
+    """
+    global _collector
+    from .collector import DEFAULT_SOCKET, CollectorClient
+    _ensure_ready()
+    disable_collector()
+
+    def fallback(sessions):
+        try:
+            _write_pending(sessions)
+        except Exception:
+            logger.exception("Error writing captured state")
+
+    _collector = CollectorClient(socket_path or DEFAULT_SOCKET, fallback=fallback)
+    return _collector
+
+def disable_collector():
+    """Disconnect from the collector, going back to local writes."""
+    global _collector
+    if _collector is not None:
+        _collector.close()
+        _collector = None
+
 def save_state(state):
-    # Save the state to a file
-    os.makedirs(".debugonce", exist_ok=True)
-    file_path = os.path.join(".debugonce", f"session_{int(datetime.now().timestamp())}.json")
-    with open(file_path, "w") as f:
-        json.dump(state, f, indent=4)
\ No newline at end of file
+    _ensure_ready()
+    session_id = new_session_id()
+    collector = _collector
+    if collector is not None and collector.submit(session_id, state, _prepare):
+        return
+    writer = _async_writer
+    if writer is not None:
+        # Encode now: the writer thread must not see the caller's objects, which may change after the call.
+        # Large values are only hashed here; the writer thread stores them.
+        blobs = []
+        _prepare(state, None, blobs)
+        writer.submit((session_id, state, blobs))
+        return
+    write_states([(session_id, state)])
+
+def write_state(state):
+    _ensure_ready()
+    write_states([(new_session_id(), state)])
+
+def _prepare(state, storage_dir, blobs=None):
+    # Move large values to the blob store (or to ``blobs``) and make the rest JSON-native
+    externalize(state, storage_dir, blobs)
+    encode_state(state)
+
+def _write_pending(sessions):
+    # (session_id, state, blobs) from the writer queue or a collector fallback: blobs are stored first
+    storage_dir = get_default_storage().storage_dir
+    for _, _, blobs in sessions:
+        store_blobs(storage_dir, blobs)
+    _write_prepared([(session_id, state) for session_id, state, _ in sessions])
+
+def _write_prepared(sessions):
+    storage = get_default_storage()
+    for _, state in sessions:
+        if state.get("environment_ref"):
+            persist_environment(storage.storage_dir, state["environment_ref"])
+    storage.save_sessions(sessions)
+
+def write_states(sessions):
+    # Save (session_id, state) pairs to the configured store (session files or segment log)
+    _ensure_ready()
+    storage = get_default_storage()
+    for _, state in sessions:
+        _prepare(state, storage.storage_dir)
+    _write_prepared(sessions)
@@ -0,0 +1,148 @@
+"""
+Content-addressed environment snapshots.
+
+Instead of copying ``os.environ`` into every session, a capture records the
+SHA-256 of the (redacted) environment. The snapshot itself is written once to
+``<store>/env/<hash>.json`` and shared by every session that references it.
+The hash is only recomputed when the environment actually changed, which is
+detected by comparing the raw ``os.environ`` mapping against the last one
+seen. Recent snapshots are kept in memory for writing; one that no store has
+received yet is kept however many newer ones there are, so a session never
+refers to a snapshot that can no longer be written.
+"""
+
+import fnmatch
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from .storage import find_in_store, touch, write_atomic
+
+ENV_DIR = "env"
+REDACTED = "<redacted>"
+MAX_SNAPSHOTS = 16
+
+_lock = threading.Lock()
+_allow = None
+_deny = None
+_last_raw = None
+_last_digest = None
+_snapshots = {}   # digest -> env dict, most recent MAX_SNAPSHOTS
+_unwritten = {}   # digest -> env dict not yet in any store; never evicted
+
+
+def _compile(patterns):
+    if not patterns:
+        return None
+    return re.compile("|".join(fnmatch.translate(p) for p in patterns), re.IGNORECASE)
+
+
+def configure_environment(allow=None, deny=None):
+    """Set glob patterns for the variables captured with each session.
+
+    Only variables matching ``allow`` (all, when ``None``) are kept, and the
+    values of those matching ``deny`` are replaced with ``"<redacted>"``.
+    """
+    global _allow, _deny, _last_raw, _last_digest
+    with _lock:
+        _allow = _compile(allow)
+        _deny = _compile(deny)
+        _last_raw = None
+        _last_digest = None
+
+
+def _raw_environ():
+    # os.environ keeps its encoded mapping in _data; comparing it directly
+    # avoids decoding every key and value on each capture.
+    return getattr(os.environ, "_data", os.environ)
+
+
+def _redact(env):
+    if _allow is not None:
+        env = {k: v for k, v in env.items() if _allow.match(k)}
+    if _deny is not None:
+        env = {k: (REDACTED if _deny.match(k) else v) for k, v in env.items()}
+    return env
+
+
+def digest_environment(env):
+    payload = json.dumps(env, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def snapshot_environment():
+    """Return the hash of the current environment, computing it only on change."""
+    global _last_raw, _last_digest
+    raw = _raw_environ()
+    with _lock:
+        if _last_digest is not None and raw == _last_raw:
+            return _last_digest
+        env = _redact(dict(os.environ))
+        digest = digest_environment(env)
+        _last_raw = dict(raw)
+        _last_digest = digest
+        _snapshots[digest] = env
+        _unwritten[digest] = env
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            del _snapshots[next(iter(_snapshots))]
+        return digest
+
+
+def get_snapshot(digest):
+    """The environment recorded as ``digest`` by this process, or ``None``."""
+    with _lock:
+        env = _snapshots.get(digest)
+        return _unwritten.get(digest) if env is None else env
+
+
+def release_snapshot(digest):
+    """Note that a store has the snapshot ``digest``, so it may be evicted like any other."""
+    with _lock:
+        _unwritten.pop(digest, None)
+
+
+def persist_environment(storage_dir, digest, env=None):
+    """Write the snapshot for ``digest`` under ``storage_dir`` if it isn't there yet."""
+    path = os.path.join(storage_dir, ENV_DIR, f"{digest}.json")
+    if touch(path):
+        release_snapshot(digest)
+        return
+    if env is None:
+        env = get_snapshot(digest)
+    if env is None:
+        logging.getLogger("debugonce").warning(
+            "Environment snapshot %s is not in memory; sessions referring to it have no environment", digest)
+        return
+    write_atomic(path, json.dumps(env, sort_keys=True))
+    release_snapshot(digest)
+
+
+def load_environment(session_file, digest):
+    """Find and load the snapshot ``digest`` for a session stored at ``session_file``.
+
+    The store is searched from the session's directory upwards, then in
+    ``.debugonce`` under the current directory.
+    """
+    path = find_in_store(session_file, ENV_DIR, f"{digest}.json")
+    if path is None:
+        raise FileNotFoundError(f"Environment snapshot '{digest}' not found.")
+    return dict(_read_snapshot(path))
+
+
+@functools.lru_cache(maxsize=MAX_SNAPSHOTS)
+def _read_snapshot(path):
+    # Snapshots are content-addressed and never rewritten, so caching by path
+    # is safe; bulk exports read the same few snapshots thousands of times.
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def resolve_environment(data, session_file):
+    """Fill ``environment_variables`` in a loaded session from its snapshot reference."""
+    digest = data.get("environment_ref")
+    if digest and "environment_variables" not in data:
+        data["environment_variables"] = load_environment(session_file, digest)
+    return data
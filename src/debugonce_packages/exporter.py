@@ -0,0 +1,300 @@
+"""
+Replay script generation, for one session or many.
+
+``build_script`` turns a loaded session into the source of a reproduction
+script. ``export_session`` writes it next to the session as
+``<session>_replay.py``; the script's second line records a hash of the
+session body, so re-exporting an unchanged session is a read of one line.
+``export_sessions`` fans a list of sessions out over a process pool.
+
+Sessions with recorded HTTP responses get scripts that serve those responses
+instead of going to the network; setting ``DEBUGONCE_SIMULATE_LATENCY=1``
+when running the script delays each one by its recorded latency. Sessions
+with file snapshots get scripts that run the call in a sandbox holding those
+files rather than in the original working directory.
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from .blobs import BlobRef, attach_blobs
+from .environment import resolve_environment
+from .serializer import TYPE_KEY
+from .layout import parse_session
+from .storage import read_session_ref, write_atomic
+
+SCRIPT_SUFFIX = "_replay.py"
+SCRIPT_VERSION = "6"
+HASH_LINE = "# debugonce-session: {}"
+LATENCY_ENV = "DEBUGONCE_SIMULATE_LATENCY"
+CWD_ENV = "DEBUGONCE_REPLAY_CWD"  # run the call here instead of the captured working directory
+
+_DECORATOR_RE = re.compile(r'@debugonce(\s*\([^)]*\))?\s*\n')
+
+_HEADER = ["# Bug Reproduction Script", None, "import json", "import os", "import sys", "import requests", ""]
+
+_BLOB_LOADER = [
+    "def _load_blob(path, kind):",
+    "    import mmap",
+    "    with open(path, 'rb') as f:",
+    "        view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))",
+    "    if kind == 'bytes':",
+    "        return view",
+    "    text = str(view, 'utf-8', 'surrogatepass')",
+    "    if kind == 'str':",
+    "        return text",
+    "    from debugonce_packages.serializer import decode",
+    "    return decode(json.loads(text))",
+    "",
+]
+
+_DECODER = [
+    "from debugonce_packages.serializer import decode as _decode",
+    "from debugonce_packages.serializer import configure_decoding",
+    "configure_decoding(allow_imports=True)  # this script runs the captured code anyway",
+    "",
+]
+
+_SERVE = [
+    "# Serve recorded HTTP responses instead of the network",
+    "from debugonce_packages.http_replay import serve_recorded",
+    "serve_recorded(json.loads({recordings!r}), simulate_latency=os.environ.get({env!r}) == '1')",
+    "",
+]
+
+_MATERIALIZE = [
+    "# Run in a sandbox holding the files the call read",
+    "from debugonce_packages.snapshots import materialize",
+    "materialize(json.loads({files!r}), {cwd!r})",
+    "",
+]
+
+_MAIN = """if __name__ == "__main__":
+    try:
+        result = {call}
+        print(f"Function returned: {{result}}")
+    except Exception as e:
+        print(f"Exception occurred during replay: {{e}}", file=sys.stderr)
+        sys.exit(1)"""
+
+
+class ExportError(Exception):
+    """A session that can't be turned into a replay script."""
+
+
+def script_path(session_file):
+    return os.path.splitext(session_file)[0] + SCRIPT_SUFFIX
+
+
+def session_digest(payload):
+    return hashlib.sha256(SCRIPT_VERSION.encode("ascii") + b"\0" + payload).hexdigest()
+
+
+def _blob_expr(ref):
+    if ref.path is None:
+        raise FileNotFoundError(f"Blob '{ref.digest}' not found.")
+    return f"_load_blob({os.path.abspath(ref.path)!r}, {ref.kind!r})"
+
+
+def _arg_expr(arg):
+    """Python source that rebuilds a captured (encoded) argument."""
+    if isinstance(arg, BlobRef):
+        return _blob_expr(arg)
+    encoded = json.dumps(arg)
+    if TYPE_KEY in encoded:
+        return f"_decode(json.loads({encoded!r}))"
+    return repr(arg)
+
+
+def _recordings(http_requests):
+    """Recorded responses of a session, with body blobs as absolute paths."""
+    recordings = []
+    for request in http_requests:
+        response = request.get("response")
+        if not isinstance(response, dict):
+            continue
+        response = dict(response)
+        body = response.pop("body", None)
+        if isinstance(body, BlobRef):
+            if body.path is None:
+                raise FileNotFoundError(f"Blob '{body.digest}' not found.")
+            response["body_path"] = os.path.abspath(body.path)
+        recordings.append({"method": request.get("method", "GET"), "url": request.get("url", ""),
+                           "elapsed_ms": request.get("elapsed_ms"), "response": response})
+    return recordings
+
+
+def _snapshots(file_access):
+    """Files with a stored snapshot, as ``{"path", "blob", "writable"}`` dicts."""
+    written = {entry.get("file") for entry in file_access if entry.get("operation") == "write"}
+    files = []
+    for entry in file_access:
+        snapshot = entry.get("snapshot")
+        if not isinstance(snapshot, dict) or not isinstance(snapshot.get("blob"), BlobRef):
+            continue
+        blob = snapshot["blob"]
+        if blob.path is None:
+            raise FileNotFoundError(f"Blob '{blob.digest}' not found.")
+        files.append({"path": snapshot["path"], "blob": os.path.abspath(blob.path),
+                      "writable": entry.get("file") in written})
+    return files
+
+
+def build_script(data, digest=""):
+    """Return the replay script for a loaded session (environment and blobs attached)."""
+    if "function" not in data:
+        raise ExportError("Missing function name")
+
+    func_name = data["function"]
+    args = data.get("args", [])
+    env_vars = data.get("env_vars") or data.get("environment_variables", {})
+    cwd = data.get("current_working_directory", os.getcwd())
+    http_requests = data.get("http_requests", [])
+    file_access = data.get("file_access", [])
+    exception = data.get("exception")
+    # Use function_code if present, else function_source, else empty string
+    function_code = data.get("function_code") or data.get("function_source") or ""
+
+    lines = list(_HEADER)
+    lines[1] = HASH_LINE.format(digest)
+    # repr() JSON-native arguments; tagged values and blobs get a loader expression
+    arg_strs = [_arg_expr(arg) for arg in args]
+    # Large values live in the blob store and are mapped, not embedded
+    if any(isinstance(arg, BlobRef) for arg in args):
+        lines.extend(_BLOB_LOADER)
+    # Values JSON can't hold are rebuilt with the serializer's decoder
+    if any(expr.startswith("_decode(") for expr in arg_strs):
+        lines.extend(_DECODER)
+
+    lines.append("# Set environment variables")
+    lines.extend(f'os.environ[{json.dumps(key)}] = {json.dumps(value)}' for key, value in env_vars.items())
+    lines.append("")
+
+    snapshots = _snapshots(file_access)
+    if snapshots:
+        lines.extend(_MATERIALIZE)
+        lines[-2] = lines[-2].format(files=json.dumps(snapshots), cwd=cwd)
+        snapshotted = {entry.get("file") for entry in file_access if "snapshot" in entry}
+        file_access = [entry for entry in file_access if entry.get("file") not in snapshotted]
+    else:
+        lines.append("# Set current working directory")
+        lines.append(f'if os.environ.get("{CWD_ENV}"):')
+        lines.append(f'    os.chdir(os.environ["{CWD_ENV}"])')
+        lines.append('else:')
+        lines.append(f'    os.chdir("{cwd}")')
+        lines.append("")
+
+    recordings = _recordings(http_requests)
+    if recordings:
+        lines.extend(_SERVE)
+        lines[-2] = lines[-2].format(recordings=json.dumps(recordings), env=LATENCY_ENV)
+        http_requests = []
+
+    lines.append("# Make HTTP requests")
+    for request in http_requests:
+        method = request.get("method", "GET").lower()
+        url = request.get("url", "")
+        headers = json.dumps(request.get("headers", {}))
+        if method == "get":
+            lines.append(f'requests.get("{url}", headers={headers})')
+        elif method == "post":
+            lines.append(f'requests.post("{url}", headers={headers}, data={json.dumps(request.get("body", ""))})')
+    lines.append("")
+
+    lines.append("# Access files")
+    for file in file_access:
+        lines.append(f'with open("{file["file"]}", "{file.get("mode", "r")}") as f:')
+        lines.append("    pass")
+    lines.append("")
+
+    lines.append("# Function implementation")
+    if function_code:
+        lines.append(_DECORATOR_RE.sub("", function_code))
+    else:
+        lines.append(f"def {func_name}(*args, **kwargs):\n    raise NotImplementedError('Function source not available')")
+    lines.append("")
+
+    lines.append(_MAIN.format(call=f"{func_name}({', '.join(arg_strs)})"))
+    if exception:
+        lines.append(f"print(\"Captured exception: {exception}\")")
+    return "\n".join(lines)
+
+
+def _is_current(path, digest):
+    try:
+        with open(path, "r") as f:
+            f.readline()
+            return f.readline().rstrip("\n") == HASH_LINE.format(digest)
+    except OSError:
+        return False
+
+
+def export_session(ref, force=False):
+    """Write the replay script for the session ``ref`` (a path or a session id).
+
+    Returns ``(script path, "written" | "unchanged")``; the script is left
+    alone if it was generated from the same session body, unless ``force``.
+    """
+    payload, session_file = read_session_ref(ref)
+    digest = session_digest(payload)
+    path = script_path(session_file)
+    if not force and _is_current(path, digest):
+        return path, "unchanged"
+    data = parse_session(payload)
+    if not isinstance(data, dict):
+        raise ExportError("Session is not a JSON object")
+    resolve_environment(data, session_file)
+    attach_blobs(data, session_file)
+    write_atomic(path, build_script(data, digest))
+    return path, "written"
+
+
+def _export_one(ref, force):
+    try:
+        path, status = export_session(ref, force)
+        return ref, path, status, None
+    except Exception as e:
+        return ref, None, "failed", f"{type(e).__name__}: {e}"
+
+
+def _export_chunk(refs, force):
+    return [_export_one(ref, force) for ref in refs]
+
+
+def export_sessions(refs, workers=None, force=False, progress=None, chunk_size=32):
+    """Export many sessions, in a process pool when ``workers`` > 1.
+
+    ``progress`` is called with each ``(ref, path, status, error)`` result
+    as chunks complete. Returns a summary with per-status counts, the
+    failures, the elapsed time and the throughput.
+    """
+    refs = list(refs)
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    summary = {"written": 0, "unchanged": 0, "failed": 0, "errors": []}
+
+    def collect(results):
+        for result in results:
+            ref, _, status, error = result
+            summary[status] += 1
+            if error is not None:
+                summary["errors"].append((ref, error))
+            if progress is not None:
+                progress(result)
+
+    chunks = [refs[i:i + chunk_size] for i in range(0, len(refs), chunk_size)]
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            collect(_export_chunk(chunk, force))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            for results in pool.map(_export_chunk, chunks, [force] * len(chunks)):
+                collect(results)
+    elapsed = time.perf_counter() - started
+    summary["total"] = len(refs)
+    summary["elapsed_s"] = elapsed
+    summary["per_s"] = len(refs) / elapsed if elapsed > 0 else 0.0
+    return summary
@@ -0,0 +1,365 @@
+"""
+Process-wide I/O tracking hooks.
+
+``builtins.open`` and ``requests.Session.request`` are wrapped once per
+process; the HTTP hook as soon as ``requests`` has been imported by anyone,
+so debugonce itself never imports it. Each hook looks up the active
+``IOLog`` through a ``ContextVar`` and records the event there, so
+concurrent captures in different threads never see each other's file or HTTP
+activity. With no active log the hooks fall straight through to the original
+callables.
+
+File opens are not kept as one dict per call. A :class:`FileAccessLog`
+aggregates them per path and operation (count, first/last time, size) and
+keeps the most recent raw events in a fixed-size ring buffer of integer
+arrays, counting the ones it had to overwrite. Times are
+``time.monotonic_ns()`` offsets from the start of the capture.
+
+Every HTTP request records its latency. With :func:`configure_http_recording`
+the response (status, headers and a size-capped body) is recorded as well,
+so exported scripts can serve it back without touching the network.
+"""
+
+import builtins
+import contextvars
+import os
+import sys
+import threading
+import time
+from array import array
+
+_active_log = contextvars.ContextVar("debugonce_active_log", default=None)
+_install_lock = threading.Lock()
+
+OPERATIONS = ("other", "read", "write")
+_OTHER, _READ, _WRITE = 0, 1, 2
+_max_events = 1000
+_snapshotter = None  # set by snapshots.configure_file_snapshots()
+_record_responses = False
+_max_body = 1024 * 1024
+
+
+def configure_file_tracking(max_events=1000):
+    """Keep at most ``max_events`` raw file events per capture (0: aggregates only)."""
+    global _max_events
+    if max_events < 0:
+        raise ValueError("max_events must not be negative")
+    _max_events = max_events
+
+
+def configure_http_recording(enabled=True, max_body=1024 * 1024):
+    """Record HTTP responses, keeping at most ``max_body`` bytes of each body."""
+    global _record_responses, _max_body
+    if max_body < 0:
+        raise ValueError("max_body must not be negative")
+    _record_responses = enabled
+    _max_body = max_body
+
+
+def _recorded_response(response):
+    recorded = {
+        "status_code": response.status_code,
+        "reason": response.reason,
+        "headers": dict(response.headers),
+        "encoding": response.encoding,
+        "url": response.url,
+    }
+    if getattr(response, "_content", None) is False:
+        # stream=True: the body is still on the wire and belongs to the caller, so it isn't read.
+        recorded.update(size=None, truncated=True, streamed=True, body=None)
+        return recorded
+    try:
+        body = response.content or b""
+    except Exception:
+        body = b""
+    recorded.update(size=len(body), truncated=len(body) > _max_body, body=body[:_max_body])
+    return recorded
+
+
+def _operation(mode):
+    if 'w' in mode or 'a' in mode or 'x' in mode:
+        return _WRITE
+    if 'r' in mode:
+        return _READ
+    return _OTHER
+
+
+def _path_key(file):
+    if type(file) is str:
+        return sys.intern(file)
+    if isinstance(file, int):
+        return file
+    try:
+        return sys.intern(os.fsdecode(os.fspath(file)))
+    except TypeError:
+        return str(file)
+
+
+class FileStats:
+    """Aggregate of the opens of one path with one operation."""
+
+    __slots__ = ("path", "mode", "operation", "count", "first_ns", "last_ns", "size", "base_size", "snapshot")
+
+    def __init__(self, path, mode, operation, now):
+        self.path = path
+        self.mode = mode
+        self.operation = operation
+        self.count = 0
+        self.first_ns = now
+        self.last_ns = now
+        self.size = 0
+        self.base_size = None
+        self.snapshot = None
+
+    def to_dict(self):
+        entry = {
+            "file": self.path,
+            "mode": self.mode,
+            "operation": OPERATIONS[self.operation],
+            "count": self.count,
+            "first_ns": self.first_ns,
+            "last_ns": self.last_ns,
+        }
+        if self.operation == _READ:
+            entry["size_at_open"] = self.size
+        elif self.operation == _WRITE:
+            entry["growth"] = self.size
+        if self.snapshot is not None:
+            entry["snapshot"] = self.snapshot
+        return entry
+
+
+class FileAccessLog:
+    """Per-path aggregates plus a bounded ring buffer of raw file events.
+
+    Reads record ``size_at_open``, the summed sizes of the files when they
+    were opened (how much was actually read is not tracked); writes record
+    ``growth``, how much the files had grown by the time :meth:`finish` ran.
+    """
+
+    __slots__ = ("start_ns", "paths", "stats", "capacity", "times", "path_ids", "ops", "total", "snapshot_bytes")
+
+    def __init__(self, start_ns, capacity):
+        self.start_ns = start_ns
+        self.paths = {}   # interned path -> index
+        self.stats = {}   # (path index, operation) -> FileStats, in first-seen order
+        self.capacity = capacity
+        self.times = None
+        self.path_ids = None
+        self.ops = None
+        self.total = 0
+        self.snapshot_bytes = 0
+
+    def record(self, path, mode, operation, now, size):
+        index = self.paths.get(path)
+        if index is None:
+            index = self.paths[path] = len(self.paths)
+        offset = now - self.start_ns
+        stats = self.stats.get((index, operation))
+        if stats is None:
+            stats = self.stats[(index, operation)] = FileStats(path, mode, operation, offset)
+        stats.count += 1
+        stats.last_ns = offset
+        if size is not None:
+            if operation == _READ:
+                stats.size += size
+            elif stats.base_size is None:
+                stats.base_size = size
+        if self.capacity:
+            if self.times is None:
+                self.times = array('q', bytes(8 * self.capacity))
+                self.path_ids = array('i', bytes(4 * self.capacity))
+                self.ops = bytearray(self.capacity)
+            slot = self.total % self.capacity
+            self.times[slot] = offset
+            self.path_ids[slot] = index
+            self.ops[slot] = operation
+        self.total += 1
+        return stats
+
+    @property
+    def overflow(self):
+        return max(0, self.total - self.capacity)
+
+    def finish(self):
+        """Measure how much the files opened for writing grew."""
+        for stats in self.stats.values():
+            if stats.operation == _WRITE and stats.base_size is not None:
+                try:
+                    size = os.stat(stats.path).st_size
+                except (OSError, TypeError, ValueError):
+                    continue
+                stats.size = max(0, size - stats.base_size)
+
+    def entries(self):
+        return [stats.to_dict() for stats in self.stats.values()]
+
+    def events(self):
+        """Raw events, oldest first, in columnar form; ``None`` if there were none."""
+        if not self.total or not self.capacity:
+            return None
+        count = min(self.total, self.capacity)
+        first = self.total - count
+        slots = [(first + i) % self.capacity for i in range(count)]
+        return {
+            "paths": [*self.paths],
+            "time_ns": [self.times[slot] for slot in slots],
+            "path": [self.path_ids[slot] for slot in slots],
+            "operation": [OPERATIONS[self.ops[slot]] for slot in slots],
+            "overflow": self.overflow,
+        }
+
+
+class IOLog:
+    """Collects the file and HTTP events seen while it is active."""
+
+    __slots__ = ("files", "http_request_log", "parent", "io_ns")
+
+    def __init__(self):
+        self.files = FileAccessLog(time.monotonic_ns(), _max_events)
+        self.http_request_log = []
+        self.parent = None
+        self.io_ns = 0
+
+    @property
+    def file_access_log(self):
+        """Per-path, per-operation file access summaries as dicts."""
+        return self.files.entries()
+
+    def add_io_time(self, ns):
+        log = self
+        while log is not None:
+            log.io_ns += ns
+            log = log.parent
+
+    def record_file(self, file, mode, size=None):
+        path = _path_key(file)
+        operation = _operation(mode)
+        now = time.monotonic_ns()
+        snapshot = None
+        log = self
+        while log is not None:
+            stats = log.files.record(path, mode, operation, now, size)
+            if (_snapshotter is not None and operation == _READ and size is not None
+                    and stats.snapshot is None and type(path) is str):
+                if snapshot is None:
+                    snapshot = self._snapshot(path, size)
+                stats.snapshot = snapshot
+                if "sha256" in snapshot:
+                    log.files.snapshot_bytes += snapshot["size"]
+            log = log.parent
+
+    def _snapshot(self, path, size):
+        # The snapshot's own file I/O must not show up in the capture.
+        token = _active_log.set(None)
+        try:
+            return _snapshotter(path, size, self.files.snapshot_bytes)
+        finally:
+            _active_log.reset(token)
+
+    def record_http(self, method, url, response, elapsed_ns=None, params=None):
+        entry = {
+            "method": method,
+            "url": normalize_url(method, url, params),
+            "status_code": getattr(response, 'status_code', None),
+            "timestamp": _now()
+        }
+        if elapsed_ns is not None:
+            entry["elapsed_ms"] = elapsed_ns / 1e6
+        if _record_responses and response is not None:
+            entry["response"] = _recorded_response(response)
+        log = self
+        while log is not None:
+            log.http_request_log.append(entry)
+            log = log.parent
+
+
+def _now():
+    from datetime import datetime  # deferred: hooks are imported with the decorator
+    return datetime.now().isoformat()
+
+
+def normalize_url(method, url, params=None):
+    try:
+        import requests
+        return requests.Request(method, url, params=params).prepare().url
+    except Exception:
+        return url
+
+
+def _make_open_hook(real_open):
+    def open_hook(file, mode='r', *args, **kwargs):
+        log = _active_log.get()
+        if log is None:
+            return real_open(file, mode, *args, **kwargs)
+        start = time.perf_counter_ns()
+        opened = None
+        try:
+            opened = real_open(file, mode, *args, **kwargs)
+            return opened
+        finally:
+            log.add_io_time(time.perf_counter_ns() - start)
+            size = None
+            if opened is not None:
+                try:
+                    size = os.fstat(opened.fileno()).st_size
+                except (AttributeError, OSError, ValueError):
+                    pass
+            log.record_file(file, mode, size)
+    return open_hook
+
+
+def _make_request_hook(real_request):
+    def request_hook(self, method, url, *args, **kwargs):
+        log = _active_log.get()
+        if log is None:
+            return real_request(self, method, url, *args, **kwargs)
+        start = time.perf_counter_ns()
+        try:
+            response = real_request(self, method, url, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            log.add_io_time(elapsed)
+        log.record_http(method, url, response, elapsed, kwargs.get("params", args[0] if args else None))
+        return response
+    return request_hook
+
+
+_HOOK_CODES = (
+    _make_open_hook(None).__code__,
+    _make_request_hook(None).__code__,
+)
+
+
+def _is_hook(fn):
+    return getattr(fn, "__code__", None) in _HOOK_CODES
+
+
+def install():
+    """Make sure the hooks sit on top of ``open`` and ``Session.request``.
+
+    The common case is two attribute checks and a ``sys.modules`` lookup. A
+    hook is (re)installed only when something else, such as a test-time mock,
+    has replaced it; when the mock is undone the earlier hook comes back, so
+    hooks never stack. Until ``requests`` is imported there is nothing to
+    hook for HTTP.
+    """
+    sessions = sys.modules.get("requests.sessions")
+    if _is_hook(builtins.open) and (sessions is None or _is_hook(sessions.Session.request)):
+        return
+    with _install_lock:
+        if not _is_hook(builtins.open):
+            builtins.open = _make_open_hook(builtins.open)
+        if sessions is not None and not _is_hook(sessions.Session.request):
+            sessions.Session.request = _make_request_hook(sessions.Session.request)
+
+
+def activate(log):
+    """Route events from the current context to ``log``; returns a reset token."""
+    install()
+    log.parent = _active_log.get()
+    return _active_log.set(log)
+
+
+def deactivate(token):
+    _active_log.reset(token)
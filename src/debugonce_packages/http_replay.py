@@ -0,0 +1,112 @@
+"""
+Serving recorded HTTP responses during replay.
+
+Sessions captured after ``configure_http_recording()`` carry, for every
+request, the response status, headers and body (the body in the blob store)
+and the latency measured at capture time. :func:`serve_recorded` routes all
+``requests`` sessions through a :class:`RecordedAdapter` that answers from
+those recordings, so a replay needs no network and sees the same responses
+as the original call.
+
+Requests are matched on method and URL. Repeated requests are answered in
+recorded order, the last recording being reused once they run out; a request
+that was never recorded raises ``requests.ConnectionError``, and so does one
+whose body wasn't recorded in full (cut at ``max_body`` or streamed). With
+``simulate_latency`` every response is delayed by its recorded latency.
+"""
+
+import io
+import time
+from datetime import timedelta
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from .blobs import BlobRef
+from .hooks import normalize_url
+
+_real_get_adapter = None
+
+
+def _body(response):
+    body = response.get("body")
+    if isinstance(body, BlobRef):
+        return bytes(body.load())
+    if isinstance(body, (bytes, bytearray, memoryview)):
+        return bytes(body)
+    if response.get("body_path"):
+        with open(response["body_path"], "rb") as f:
+            return f.read()
+    return b""
+
+
+class RecordedAdapter(BaseAdapter):
+    """Transport adapter that answers requests from recorded responses."""
+
+    def __init__(self, recordings, simulate_latency=False):
+        super().__init__()
+        self.simulate_latency = simulate_latency
+        self.served = []
+        self._recordings = {}
+        self._next = {}
+        for entry in recordings:
+            if isinstance(entry, dict) and entry.get("response") is not None:
+                key = (entry.get("method", "GET").upper(), entry.get("url", ""))
+                self._recordings.setdefault(key, []).append(entry)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        key = (request.method.upper(), normalize_url(request.method, request.url))
+        entries = self._recordings.get(key)
+        if not entries:
+            raise requests.ConnectionError(f"No recorded response for {key[0]} {key[1]}", request=request)
+        index = self._next.get(key, 0)
+        self._next[key] = index + 1
+        entry = entries[min(index, len(entries) - 1)]
+        if entry["response"].get("truncated"):
+            what = "was streamed" if entry["response"].get("streamed") else "was cut at the recording size limit"
+            raise requests.ConnectionError(
+                f"Recorded response for {key[0]} {key[1]} is incomplete: its body {what}", request=request)
+        elapsed_ms = entry.get("elapsed_ms") or 0.0
+        if self.simulate_latency and elapsed_ms:
+            time.sleep(elapsed_ms / 1000)
+        self.served.append({"method": key[0], "url": key[1], "recorded_ms": elapsed_ms})
+        return self.build_response(request, entry["response"], elapsed_ms)
+
+    def build_response(self, request, recorded, elapsed_ms):
+        body = _body(recorded)
+        response = requests.Response()
+        response.status_code = recorded.get("status_code")
+        response.reason = recorded.get("reason")
+        response.headers = CaseInsensitiveDict(recorded.get("headers") or {})
+        response.encoding = recorded.get("encoding")
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.elapsed = timedelta(milliseconds=elapsed_ms)
+        response.raw = io.BytesIO(body)
+        response._content = body
+        response._content_consumed = True
+        return response
+
+    def close(self):
+        pass
+
+
+def serve_recorded(recordings, simulate_latency=False):
+    """Answer every ``requests`` call from ``recordings`` (a session's ``http_requests``).
+
+    Returns the installed :class:`RecordedAdapter`; :func:`stop_serving`
+    puts the real transport back.
+    """
+    global _real_get_adapter
+    adapter = RecordedAdapter(recordings, simulate_latency)
+    if _real_get_adapter is None:
+        _real_get_adapter = requests.Session.get_adapter
+    requests.Session.get_adapter = lambda session, url: adapter
+    return adapter
+
+
+def stop_serving():
+    global _real_get_adapter
+    if _real_get_adapter is not None:
+        requests.Session.get_adapter = _real_get_adapter
+        _real_get_adapter = None
@@ -0,0 +1,87 @@
+"""
+Unique, sortable session identifiers.
+
+An id is ``session_`` followed by 22 Crockford base32 characters::
+
+    time (10, ms since the epoch) | pid (5) | process nonce (3) | counter (4)
+
+Ids from one process are strictly increasing: the counter is bumped for ids
+minted in the same millisecond and the clock is never allowed to go
+backwards. The pid and a per-process random nonce, both refreshed after
+``fork()``, keep ids from concurrent workers and containers apart. Sorting
+ids sorts sessions by capture time.
+"""
+
+import os
+import threading
+import time
+
+PREFIX = "session_"
+# Shards are two directory levels cut from the time prefix: ~9 days of
+# captures per top-level directory and ~33 seconds per directory below it,
+# so neither level ever holds more than 32 ** 2 entries.
+SHARD_LEVELS = (5, 7)
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_COUNTER_MAX = 32 ** 4
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+_process = ""
+
+
+def _encode(value, length):
+    chars = []
+    for _ in range(length):
+        chars.append(_ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def _reset_process():
+    global _process, _last_ms, _counter
+    nonce = int.from_bytes(os.urandom(2), "big") & (32 ** 3 - 1)
+    _process = _encode(os.getpid() & (32 ** 5 - 1), 5) + _encode(nonce, 3)
+    _last_ms = 0
+    _counter = 0
+
+
+_reset_process()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_process)
+
+
+def new_session_id():
+    """Return a new, unique, monotonically increasing session id."""
+    global _last_ms, _counter
+    now = time.time_ns() // 1_000_000
+    with _lock:
+        if now > _last_ms:
+            _last_ms = now
+            _counter = 0
+        else:
+            _counter += 1
+            if _counter >= _COUNTER_MAX:
+                _last_ms += 1
+                _counter = 0
+        return f"{PREFIX}{_encode(_last_ms, 10)}{_process}{_encode(_counter, 4)}"
+
+
+def is_session_id(name):
+    body = name[len(PREFIX):]
+    return name.startswith(PREFIX) and len(body) == 22 and all(c in _ALPHABET for c in body)
+
+
+def shard_of(session_id):
+    """The shard directory of a session id, as a relative path (``"01HZ3/QK"``)."""
+    body = session_id[len(PREFIX):]
+    outer, inner = SHARD_LEVELS
+    return os.path.join(body[:outer], body[outer:inner])
+
+
+def timestamp_of(session_id):
+    """Capture time of a session id, in seconds since the epoch."""
+    ms = 0
+    for c in session_id[len(PREFIX):len(PREFIX) + 10]:
+        ms = ms * 32 + _ALPHABET.index(c)
+    return ms / 1000
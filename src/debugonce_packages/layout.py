@@ -0,0 +1,173 @@
+"""
+Header-first layout of session bodies.
+
+A stored session is a JSON object whose first line is a small header::
+
+    {"_header":{"format":1,"function":"divide","module":"app","timestamp":"...",
+                "exception_type":"ZeroDivisionError","exception":"division by zero",
+                "duration_ms":0.02,"environment_ref":"9f2c...","blobs":[],
+                "sections":{"args":[12,9],"stack_trace":[40,2310],...}},
+    "function": "divide",
+    "args": [1, 0],
+    ...
+    }
+
+followed by one ``"key": value`` section per top-level key. ``sections``
+maps each key to the offset and length of its value, counted from the end
+of the header line, so readers can take the metadata from the first line
+alone (:func:`read_header`) or copy out one section without parsing
+anything else (:func:`copy_section`). ``blobs`` lists the blob store entries
+the session refers to, so the catalog can track what is still referenced
+without reading bodies. The whole body is still plain JSON;
+:func:`parse_session` drops the header again. Bodies without a header
+(sessions written before this layout) are read by parsing them whole.
+"""
+
+import json
+from .calltree import iter_frames
+from .serializer import dumps
+
+HEADER_KEY = "_header"
+FORMAT = 1
+HEADER_FIELDS = ("function", "module", "timestamp", "exception_type", "exception", "duration_ms",
+                 "environment_ref")
+BLOB_KEY = "__debugonce_blob__"
+MAX_HEADER_TEXT = 1000  # longer exception messages are cut short in the header
+MAX_HEADER_LINE = 1024 * 1024
+CHUNK = 64 * 1024
+
+_PREFIX = b'{"' + HEADER_KEY.encode("ascii") + b'":'
+_SEPARATOR = b",\n"
+
+
+def _header_value(value):
+    if isinstance(value, str) and len(value) > MAX_HEADER_TEXT:
+        return value[:MAX_HEADER_TEXT]
+    return value
+
+
+def blob_digests(data):
+    """Hashes of the blob store entries a JSON-native session refers to."""
+    digests = set()
+    for frame in (data, *iter_frames(data.get("call_tree"))):
+        args = frame.get("args")
+        kwargs = frame.get("kwargs")
+        values = [frame.get("result")]
+        values.extend(args if isinstance(args, list) else ())
+        values.extend(kwargs.values() if isinstance(kwargs, dict) else ())
+        digests.update(value[BLOB_KEY] for value in values if isinstance(value, dict) and BLOB_KEY in value)
+    for request in data.get("http_requests") or []:
+        response = request.get("response") if isinstance(request, dict) else None
+        body = response.get("body") if isinstance(response, dict) else None
+        if isinstance(body, dict) and BLOB_KEY in body:
+            digests.add(body[BLOB_KEY])
+    for entry in data.get("file_access") or []:
+        snapshot = entry.get("snapshot") if isinstance(entry, dict) else None
+        if isinstance(snapshot, dict) and "sha256" in snapshot:
+            digests.add(snapshot["sha256"])
+    return digests
+
+
+def encode_session(data, indent=False):
+    """Serialize a JSON-native session to bytes, header first."""
+    sections, offsets = [], {}
+    position = 0
+    for key, value in data.items():
+        if key == HEADER_KEY:
+            continue
+        name = dumps(key) + (b": " if indent else b":")
+        body = dumps(value, indent=indent)
+        offsets[key] = [position + len(name), len(body)]
+        sections.append(name + body)
+        position += len(name) + len(body) + len(_SEPARATOR)
+    header = {"format": FORMAT}
+    for field in HEADER_FIELDS:
+        header[field] = _header_value(data.get(field))
+    header["blobs"] = sorted(blob_digests(data))
+    header["sections"] = offsets
+    if not sections:
+        return _PREFIX + dumps(header) + b"}"
+    return _PREFIX + dumps(header) + _SEPARATOR + _SEPARATOR.join(sections) + b"\n}"
+
+
+def header_first(payload, indent=False):
+    """``payload`` in the header-first layout, re-encoding an old-layout body."""
+    if payload.startswith(_PREFIX):
+        return payload
+    data = json.loads(payload)
+    return encode_session(data, indent=indent) if isinstance(data, dict) else payload
+
+
+def parse_session(payload):
+    """Load a session body of either layout, without the header."""
+    data = json.loads(payload)
+    if isinstance(data, dict):
+        data.pop(HEADER_KEY, None)
+    return data
+
+
+def read_header(stream):
+    """The header of the session body read from ``stream``, or None for the old layout.
+
+    Only the first line of the body is read, and only its first bytes if it
+    isn't a header.
+    """
+    if stream.read(len(_PREFIX)) != _PREFIX:
+        return None
+    line = stream.readline(MAX_HEADER_LINE)
+    if not line.endswith(_SEPARATOR):
+        return None
+    try:
+        return json.loads(line[:-len(_SEPARATOR)])
+    except ValueError:
+        return None
+
+
+def _skip(stream, count):
+    if count > 0 and getattr(stream, "seekable", lambda: False)():
+        stream.seek(count, 1)
+        return
+    while count > 0:
+        skipped = len(stream.read(min(count, CHUNK)))
+        if not skipped:
+            raise ValueError("Session body ends before its section")
+        count -= skipped
+
+
+def copy_section(stream, name, write):
+    """Pass the raw JSON of section ``name`` to ``write`` in chunks.
+
+    Returns False if the body has no header (the caller has to parse it
+    whole); raises ``KeyError`` if the session has no such section.
+    """
+    header = read_header(stream)
+    if header is None:
+        return False
+    offset, length = header["sections"][name]
+    _skip(stream, offset)
+    while length > 0:
+        chunk = stream.read(min(length, CHUNK))
+        if not chunk:
+            raise ValueError(f"Session body ends inside section '{name}'")
+        write(chunk)
+        length -= len(chunk)
+    return True
+
+
+def read_sections(stream, names):
+    """Parse only the sections ``names`` (those present) into a dict.
+
+    Returns None if the body has no header. The sections are read in
+    file order, skipping everything in between.
+    """
+    header = read_header(stream)
+    if header is None:
+        return None
+    data = {}
+    position = 0
+    wanted = sorted((header["sections"][name], name) for name in names if name in header["sections"])
+    for (offset, length), name in wanted:
+        _skip(stream, offset - position)
+        data[name] = json.loads(stream.read(length))
+        position = offset + length
+    return data
@@ -0,0 +1,276 @@
+"""
+Replaying many sessions on a warm interpreter.
+
+Starting ``sys.executable`` for every replay script spends most of the time
+booting Python and importing ``requests``. Instead, the runner imports the
+modules replay scripts need once, then forks one child per replay (at most
+``workers`` at a time). Each child starts in its own scratch directory
+(where file snapshots are materialized too, and which ``DEBUGONCE_REPLAY_CWD``
+makes scripts without snapshots stay in) with the runner's original
+environment, runs the exported script as ``__main__`` and reports what
+happened over a pipe. Children that exceed the timeout are killed.
+
+Every replay yields a JSON-serializable dict whose ``status`` is one of:
+
+- ``pass``: neither the captured call nor the replay raised
+- ``reproduced``: the replay raised the captured exception type
+- ``different``: the replay's outcome differs from the captured one
+- ``timeout``: the replay ran past the timeout and was killed
+- ``error``: the script could not be exported or failed outside the call
+"""
+
+import gc
+import importlib
+import json
+import os
+import runpy
+import selectors
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from .exporter import CWD_ENV, LATENCY_ENV, export_session
+from .snapshots import SANDBOX_ENV
+from .storage import load_session_ref
+
+PRELOAD = ("json", "requests", "debugonce_packages.serializer", "debugonce_packages.http_replay",
+           "debugonce_packages.snapshots")
+OUTPUT_LIMIT = 64 * 1024
+
+
+def _expected(data):
+    return {"exception_type": data.get("exception_type"), "exception": data.get("exception")}
+
+
+def classify(expected, actual):
+    """Compare a replay's outcome with the captured one."""
+    if actual.get("error"):
+        return "error"
+    if expected["exception"] is None and expected["exception_type"] is None:
+        return "pass" if actual["exception_type"] is None else "different"
+    if actual["exception_type"] is None:
+        return "different"
+    if expected["exception_type"] is not None:
+        same = expected["exception_type"] == actual["exception_type"]
+    else:
+        same = expected["exception"] == actual["exception"]
+    return "reproduced" if same else "different"
+
+
+def _run_child(script, sandbox, environ, result_fd):
+    """Body of a forked replay child; never returns."""
+    report = {"exception_type": None, "exception": None, "error": None}
+    try:
+        output = os.open(os.path.join(sandbox, "output"), os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        errors = os.open(os.path.join(sandbox, "errors"), os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        os.dup2(output, 1)
+        os.dup2(errors, 2)
+        sys.stdout = open(1, "w", closefd=False)
+        sys.stderr = open(2, "w", closefd=False)
+        os.chdir(sandbox)
+        os.environ.clear()
+        os.environ.update(environ)
+        os.environ[SANDBOX_ENV] = os.path.join(sandbox, "files")
+        os.environ[CWD_ENV] = sandbox
+        sys.argv = [script]
+        try:
+            runpy.run_path(script, run_name="__main__")
+        except SystemExit as e:
+            # The script catches the replayed exception and exits; the
+            # original exception is the context of that SystemExit.
+            if e.code not in (None, 0):
+                if e.__context__ is not None:
+                    report["exception_type"] = type(e.__context__).__name__
+                    report["exception"] = str(e.__context__)
+                else:
+                    report["error"] = f"exit code {e.code}"
+        except BaseException as e:
+            report["error"] = f"{type(e).__name__}: {e}"
+    except BaseException as e:
+        report["error"] = f"{type(e).__name__}: {e}"
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.write(result_fd, json.dumps(report).encode("utf-8"))
+    finally:
+        os._exit(0)
+
+
+def _read_limited(path):
+    try:
+        with open(path, "r", errors="replace") as f:
+            return f.read(OUTPUT_LIMIT)
+    except OSError:
+        return ""
+
+
+class ReplayRunner:
+    """Fork-per-replay runner that keeps ``workers`` replays in flight."""
+
+    def __init__(self, workers=None, timeout=30.0, preload=PRELOAD):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.timeout = timeout
+        self.environ = dict(os.environ)
+        for name in preload:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                pass
+
+    def run(self, jobs, progress=None):
+        """Run ``(key, script, expected)`` jobs; returns results in job order."""
+        jobs = list(jobs)
+        if not hasattr(os, "fork"):
+            return [self._run_subprocess(job, progress) for job in jobs]
+        # Keep the collector from touching (and so copying) the parent's
+        # objects in every child.
+        gc.freeze()
+        results = [None] * len(jobs)
+        pending = list(enumerate(jobs))
+        pending.reverse()
+        running = {}
+        selector = selectors.DefaultSelector()
+        try:
+            while pending or running:
+                while pending and len(running) < self.workers:
+                    index, job = pending.pop()
+                    fd, child = self._start(job)
+                    running[fd] = (index, job, child)
+                    selector.register(fd, selectors.EVENT_READ)
+                now = time.monotonic()
+                wait = min(child["deadline"] for _, _, child in running.values()) - now
+                for key, _ in selector.select(timeout=max(wait, 0) if self.timeout else None):
+                    index, job, child = running[key.fd]
+                    chunk = os.read(key.fd, 65536)
+                    if chunk:
+                        child["report"] += chunk
+                        continue
+                    selector.unregister(key.fd)
+                    del running[key.fd]
+                    results[index] = self._finish(job, child, timed_out=False)
+                    if progress is not None:
+                        progress(results[index])
+                now = time.monotonic()
+                for fd, (index, job, child) in list(running.items()):
+                    if self.timeout and now >= child["deadline"]:
+                        try:
+                            os.kill(child["pid"], signal.SIGKILL)
+                        except ProcessLookupError:
+                            pass
+                        selector.unregister(fd)
+                        del running[fd]
+                        results[index] = self._finish(job, child, timed_out=True)
+                        if progress is not None:
+                            progress(results[index])
+        finally:
+            selector.close()
+            gc.unfreeze()
+        return results
+
+    def _start(self, job):
+        _, script, _ = job
+        sandbox = tempfile.mkdtemp(prefix="debugonce-replay-")
+        read_fd, write_fd = os.pipe()
+        started = time.monotonic()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            _run_child(script, sandbox, self.environ, write_fd)
+        os.close(write_fd)
+        deadline = started + self.timeout if self.timeout else float("inf")
+        return read_fd, {"pid": pid, "fd": read_fd, "sandbox": sandbox, "started": started,
+                         "deadline": deadline, "report": b""}
+
+    def _finish(self, job, child, timed_out):
+        key, script, expected = job
+        os.close(child["fd"])
+        try:
+            os.waitpid(child["pid"], 0)
+        except ChildProcessError:
+            pass
+        duration_ms = (time.monotonic() - child["started"]) * 1000
+        stdout = _read_limited(os.path.join(child["sandbox"], "output"))
+        stderr = _read_limited(os.path.join(child["sandbox"], "errors"))
+        shutil.rmtree(child["sandbox"], ignore_errors=True)
+        if timed_out:
+            actual = {"exception_type": None, "exception": None, "error": f"timed out after {self.timeout}s"}
+        else:
+            try:
+                actual = json.loads(child["report"])
+            except ValueError:
+                actual = {"exception_type": None, "exception": None, "error": "replay process died"}
+        status = "timeout" if timed_out else classify(expected, actual)
+        return _result(key, script, status, expected, actual, duration_ms, stdout, stderr)
+
+    def _run_subprocess(self, job, progress):
+        key, script, expected = job
+        started = time.monotonic()
+        sandbox = tempfile.mkdtemp(prefix="debugonce-replay-")
+        try:
+            proc = subprocess.run([sys.executable, script], capture_output=True, text=True,
+                                  cwd=sandbox, env={**self.environ, SANDBOX_ENV: os.path.join(sandbox, "files"),
+                                                    CWD_ENV: sandbox},
+                                  timeout=self.timeout)
+        except subprocess.TimeoutExpired as e:
+            actual = {"exception_type": None, "exception": None, "error": f"timed out after {self.timeout}s"}
+            result = _result(key, script, "timeout", expected, actual,
+                             (time.monotonic() - started) * 1000, e.stdout or "", e.stderr or "")
+        else:
+            # Without fork only the exception message printed by the script is known.
+            marker = "Exception occurred during replay: "
+            message = next((line[len(marker):] for line in proc.stderr.splitlines() if line.startswith(marker)), None)
+            actual = {"exception_type": None, "exception": message, "error": None}
+            if message is not None:
+                actual["exception_type"] = expected["exception_type"] if message == expected["exception"] else "Exception"
+            elif proc.returncode:
+                actual["error"] = f"exit code {proc.returncode}"
+            result = _result(key, script, classify(expected, actual), expected, actual,
+                             (time.monotonic() - started) * 1000, proc.stdout, proc.stderr)
+        finally:
+            shutil.rmtree(sandbox, ignore_errors=True)
+        if progress is not None:
+            progress(result)
+        return result
+
+
+def _result(key, script, status, expected, actual, duration_ms, stdout="", stderr=""):
+    return {
+        "session": key,
+        "script": script,
+        "status": status,
+        "expected": expected,
+        "actual": actual,
+        "duration_ms": duration_ms,
+        "stdout": stdout[:OUTPUT_LIMIT],
+        "stderr": stderr[:OUTPUT_LIMIT],
+    }
+
+
+def replay_sessions(refs, workers=None, timeout=30.0, progress=None, simulate_latency=False):
+    """Export (if needed) and replay sessions; returns one result dict per session.
+
+    With ``simulate_latency`` recorded HTTP responses are delayed by the
+    latency measured when they were captured.
+    """
+    jobs, results = [], {}
+    for ref in refs:
+        try:
+            data, _ = load_session_ref(ref)
+            script, _ = export_session(ref)
+        except Exception as e:
+            actual = {"exception_type": None, "exception": None, "error": f"{type(e).__name__}: {e}"}
+            results[ref] = _result(ref, None, "error", {"exception_type": None, "exception": None}, actual, 0.0)
+            if progress is not None:
+                progress(results[ref])
+            continue
+        jobs.append((ref, os.path.abspath(script), _expected(data)))
+    runner = ReplayRunner(workers, timeout)
+    if simulate_latency:
+        runner.environ[LATENCY_ENV] = "1"
+    for result in runner.run(jobs, progress):
+        results[result["session"]] = result
+    return [results[ref] for ref in refs]
@@ -0,0 +1,94 @@
+"""
+Resource usage of captured calls.
+
+With :func:`configure_resources`, the outermost decorated call is sampled
+before and after it runs and the session gets a ``resources`` entry::
+
+    {"sampled": "always", "wall_ms": 12.5, "cpu_user_ms": 11.0, "cpu_system_ms": 0.9,
+     "rss_before": 52428800, "rss_after": 61865984, "rss_peak": 61865984,
+     "peak_raised": true, "fds_before": 7, "fds_after": 9,
+     "threads_before": 1, "threads_after": 1}
+
+Each sample reads the process once through psutil's ``oneshot()`` (RSS,
+open file descriptors or handles, threads), plus ``getrusage`` where it
+exists for CPU time and the peak RSS. CPU time and the peak are
+process-wide: other threads count too, and ``peak_raised`` says whether the
+process reached a new RSS high-water mark during the call.
+
+With ``only_on_exception=True`` nothing is read unless the call raises; the
+session then has the after-sample and ``wall_ms`` only.
+"""
+
+import os
+import sys
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ru_maxrss is in kilobytes on Linux, bytes on macOS
+_MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+ALWAYS, ON_EXCEPTION = "always", "on_exception"
+
+mode = None
+_process = None
+
+
+def configure_resources(enabled=True, only_on_exception=False):
+    """Record resource usage of captured calls, or only of those that raise."""
+    global mode
+    mode = (ON_EXCEPTION if only_on_exception else ALWAYS) if enabled else None
+
+
+def _get_process():
+    global _process
+    if _process is None or _process.pid != os.getpid():
+        import psutil
+        _process = psutil.Process()
+    return _process
+
+
+def sample():
+    """``(cpu user s, cpu system s, rss, peak rss, fds, threads)`` for this process, or None."""
+    try:
+        return _read()
+    except Exception:
+        # psutil missing or refusing; sampling must never fail the call
+        return None
+
+
+def _read():
+    process = _get_process()
+    with process.oneshot():
+        memory = process.memory_info()
+        fds = process.num_fds() if hasattr(process, "num_fds") else process.num_handles()
+        threads = process.num_threads()
+        cpu = process.cpu_times() if resource is None else None
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        user, system, peak = usage.ru_utime, usage.ru_stime, usage.ru_maxrss * _MAXRSS_UNIT
+    else:
+        user, system, peak = cpu.user, cpu.system, getattr(memory, "peak_wset", None)
+    return user, system, memory.rss, peak, fds, threads
+
+
+def usage(sampled, before, after, wall_ns):
+    """The ``resources`` entry for a call sampled ``before`` (when ``sampled`` is
+    ``"always"``) and ``after``; None if the after-sample failed."""
+    if after is None:
+        return None
+    user, system, rss, peak, fds, threads = after
+    entry = {"sampled": sampled, "wall_ms": wall_ns / 1e6}
+    if before is not None:
+        entry.update({
+            "cpu_user_ms": (user - before[0]) * 1000,
+            "cpu_system_ms": (system - before[1]) * 1000,
+            "rss_before": before[2],
+            "peak_raised": peak is not None and before[3] is not None and peak > before[3],
+            "fds_before": before[4],
+            "threads_before": before[5],
+        })
+    entry.update({"rss_after": rss, "rss_peak": peak, "fds_after": fds, "threads_after": threads})
+    return entry
@@ -0,0 +1,96 @@
+"""
+Size- and age-bounded retention for the session store.
+
+A ``RetentionPolicy`` is checked every ``check_every`` written sessions,
+from whichever thread writes them (the background writer when it is
+enabled). Each check answers from the session catalog, never from a
+directory scan, and evicts at most ``batch`` of the oldest offending
+sessions, so a large backlog is worked off incrementally. The count and
+size limits read the catalog's running totals; the per-function quota is
+counted only for the functions written since the last check (every
+function on a policy's first check).
+"""
+
+import threading
+import time
+
+
+class RetentionPolicy:
+    """Limits for the session store; ``None`` disables a limit.
+
+    ``max_age`` is in seconds and ``per_function`` caps the number of
+    sessions kept for any single function. ``max_bytes`` counts stored
+    session bodies only: blobs and environment snapshots are shared, and are
+    removed when the last session referring to them is deleted.
+    """
+
+    def __init__(self, max_bytes=None, max_sessions=None, max_age=None, per_function=None,
+                 check_every=100, batch=500):
+        self.max_bytes = max_bytes
+        self.max_sessions = max_sessions
+        self.max_age = max_age
+        self.per_function = per_function
+        self.check_every = max(1, check_every)
+        self.batch = batch
+        self.evicted = 0
+        self._pending = 0
+        self._functions = None  # written since the last check; None: not known yet
+        self._lock = threading.Lock()
+
+    def note_writes(self, count, functions=()):
+        """Record ``count`` new sessions of ``functions``; returns True when a check is due."""
+        with self._lock:
+            if self._functions is not None:
+                self._functions.update(functions)
+            self._pending += count
+            if self._pending < self.check_every:
+                return False
+            self._pending = 0
+            return True
+
+    def select_victims(self, catalog):
+        """Pick up to ``batch`` session ids that the limits require evicting."""
+        chosen = {}  # session id -> size, oldest first
+
+        def take(rows):
+            for session_id, size in rows:
+                if len(chosen) >= self.batch:
+                    return
+                chosen.setdefault(session_id, size or 0)
+
+        if self.max_age is not None:
+            take(catalog.oldest(self.batch, before=time.time() - self.max_age))
+        if self.per_function is not None:
+            with self._lock:
+                functions, self._functions = self._functions, set()
+            if functions is None:
+                over = catalog.functions_over(self.per_function)
+            else:
+                over = [(function, catalog.count(function=function)) for function in functions if function]
+            for function, count in over:
+                excess = count - self.per_function
+                if excess <= 0:
+                    continue
+                if excess > self.batch - len(chosen):
+                    with self._lock:
+                        self._functions.add(function)  # still over after this batch
+                take(catalog.oldest(min(excess, self.batch), function=function))
+        if self.max_sessions is not None or self.max_bytes is not None:
+            count, total_bytes = catalog.totals()
+            count -= len(chosen)
+            total_bytes -= sum(chosen.values())
+
+            def over():
+                return ((self.max_sessions is not None and count > self.max_sessions)
+                        or (self.max_bytes is not None and total_bytes > self.max_bytes))
+
+            if over():
+                for session_id, size in catalog.oldest(self.batch + len(chosen)):
+                    if not over() or len(chosen) >= self.batch:
+                        break
+                    if session_id in chosen:
+                        continue
+                    chosen[session_id] = size or 0
+                    count -= 1
+                    total_bytes -= size or 0
+        return list(chosen)
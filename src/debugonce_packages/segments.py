@@ -0,0 +1,322 @@
+"""
+Append-only segmented session log.
+
+Sessions are appended as length-prefixed, compact JSON records to rotating
+``segment_NNNNNN.log`` files. Each record is::
+
+    kind (1 byte) | id length (2) | payload length (4) | crc32 (4) | id | payload
+
+where ``kind`` is ``PUT`` or ``DELETE`` (a tombstone with an empty payload).
+An in-memory offset index maps session ids to ``(segment, offset, length)``
+for random access. When a segment is sealed its record headers are written
+to ``segment_NNNNNN.idx`` so reopening the log doesn't need to walk it.
+``compact()`` rewrites live records and drops superseded ones and tombstones.
+
+Payloads are JSON or, for stores with compression on, compressed JSON (see
+:mod:`debugonce_packages.compression`); :meth:`SegmentLog.read` handles both.
+"""
+
+import json
+import os
+import re
+import struct
+import threading
+import zlib
+from .compression import DICT_DIR, decompress
+from .layout import parse_session
+from .serializer import dumps
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+PUT = 1
+DELETE = 2
+HEADER = struct.Struct(">BHII")
+FSYNC_POLICIES = ("always", "batch", "never")
+_SEGMENT_RE = re.compile(r"^segment_(\d{6})\.log$")
+
+
+class SegmentLog:
+    """A directory of append-only segment files with an offset index."""
+
+    def __init__(self, directory, max_segment_bytes=64 * 1024 * 1024, fsync="batch"):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{fsync}', expected one of {FSYNC_POLICIES}")
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._reset()
+        self.refresh()
+
+    def _reset(self):
+        self._index = {}
+        self._scanned = {}  # segment number -> bytes already indexed
+
+    def _segment_path(self, number, suffix="log"):
+        return os.path.join(self.directory, f"segment_{number:06d}.{suffix}")
+
+    def segments(self):
+        numbers = []
+        for name in os.listdir(self.directory):
+            match = _SEGMENT_RE.match(name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def _file_lock(self):
+        return _FileLock(os.path.join(self.directory, ".lock"))
+
+    def _apply(self, number, kind, session_id, offset, length):
+        self._index.pop(session_id, None)
+        if kind == PUT:
+            self._index[session_id] = (number, offset, length)
+
+    def _scan(self, number, start):
+        """Walk record headers from ``start``; stops at a torn trailing record."""
+        entries = []
+        path = self._segment_path(number)
+        size = os.path.getsize(path)
+        offset = start
+        with open(path, "rb") as f:
+            f.seek(offset)
+            while offset + HEADER.size <= size:
+                kind, id_len, length, _ = HEADER.unpack(f.read(HEADER.size))
+                end = offset + HEADER.size + id_len + length
+                if kind not in (PUT, DELETE) or end > size:
+                    break
+                session_id = f.read(id_len).decode("utf-8")
+                entries.append((kind, session_id, offset + HEADER.size + id_len, length))
+                f.seek(length, os.SEEK_CUR)
+                offset = end
+        return entries, offset
+
+    def refresh(self):
+        """Index records appended since the last refresh, by this or another process."""
+        with self._lock:
+            numbers = self.segments()
+            last = numbers[-1] if numbers else None
+            for number in numbers:
+                if number not in self._scanned and number != last:
+                    entries = self._load_sealed_index(number)
+                    if entries is not None:
+                        for entry in entries:
+                            self._apply(number, *entry)
+                        self._scanned[number] = os.path.getsize(self._segment_path(number))
+                        continue
+                start = self._scanned.get(number, 0)
+                entries, end = self._scan(number, start)
+                for entry in entries:
+                    self._apply(number, *entry)
+                self._scanned[number] = end
+
+    def _load_sealed_index(self, number):
+        try:
+            with open(self._segment_path(number, "idx"), "r") as f:
+                return [tuple(entry) for entry in json.load(f)]
+        except (OSError, ValueError):
+            return None
+
+    def _seal(self, number):
+        entries, _ = self._scan(number, 0)
+        tmp_path = self._segment_path(number, "idx.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f, separators=(",", ":"))
+        os.replace(tmp_path, self._segment_path(number, "idx"))
+
+    @staticmethod
+    def _encode(kind, session_id, payload):
+        id_bytes = session_id.encode("utf-8")
+        return HEADER.pack(kind, len(id_bytes), len(payload), zlib.crc32(payload)) + id_bytes + payload
+
+    def append_many(self, records):
+        """Append ``(session_id, data)`` pairs; ``data=None`` writes a tombstone.
+
+        ``data`` may also be an already encoded payload (bytes). Returns the
+        payload size of each record.
+        """
+        encoded = []
+        for session_id, data in records:
+            if data is None:
+                encoded.append((DELETE, session_id, b""))
+            else:
+                payload = data if isinstance(data, bytes) else dumps(data)
+                encoded.append((PUT, session_id, payload))
+        with self._lock, self._file_lock():
+            self.refresh()
+            numbers = self.segments()
+            number = numbers[-1] if numbers else 1
+            size = self._scanned.get(number, 0)
+            fd = os.open(self._segment_path(number), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                if os.fstat(fd).st_size > size:
+                    # A writer died mid-record; we hold the lock, so drop the torn tail.
+                    os.ftruncate(fd, size)
+                for kind, session_id, payload in encoded:
+                    record = self._encode(kind, session_id, payload)
+                    if size and size + len(record) > self.max_segment_bytes:
+                        if self.fsync != "never":
+                            os.fsync(fd)
+                        os.close(fd)
+                        self._scanned[number] = size
+                        self._seal(number)
+                        number += 1
+                        size = 0
+                        fd = os.open(self._segment_path(number), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                    os.write(fd, record)
+                    self._apply(number, kind, session_id, size + len(record) - len(payload), len(payload))
+                    size += len(record)
+                    if self.fsync == "always":
+                        os.fsync(fd)
+                if self.fsync == "batch":
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+            self._scanned[number] = size
+        return [len(payload) for _, _, payload in encoded]
+
+    def append(self, session_id, data):
+        self.append_many([(session_id, data)])
+
+    def delete(self, session_id):
+        self.append_many([(session_id, None)])
+
+    def __contains__(self, session_id):
+        with self._lock:
+            if session_id not in self._index:
+                self.refresh()
+            return session_id in self._index
+
+    def ids(self):
+        """Live session ids in the order they were written."""
+        with self._lock:
+            self.refresh()
+            return list(self._index)
+
+    def read_bytes(self, session_id):
+        with self._lock:
+            location = self._index.get(session_id)
+            if location is None:
+                self.refresh()
+                location = self._index.get(session_id)
+            if location is None:
+                raise FileNotFoundError(f"Session '{session_id}' not found in segment log.")
+            try:
+                return self._read_at(session_id, *location)
+            except FileNotFoundError:
+                # Compacted away by another process: rebuild the index once.
+                self._reset()
+                self.refresh()
+                location = self._index.get(session_id)
+                if location is None:
+                    raise
+                return self._read_at(session_id, *location)
+
+    def _read_at(self, session_id, number, offset, length):
+        header_offset = offset - len(session_id.encode("utf-8")) - HEADER.size
+        with open(self._segment_path(number), "rb") as f:
+            f.seek(header_offset)
+            _, _, _, crc = HEADER.unpack(f.read(HEADER.size))
+            f.seek(offset)
+            payload = f.read(length)
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            raise IOError(f"Corrupt record for '{session_id}' in segment {number} at offset {offset}")
+        return payload
+
+    def find_dictionary(self, name):
+        """Path of the store's compression dictionary ``name``, or None."""
+        path = os.path.join(os.path.dirname(os.path.abspath(self.directory)), DICT_DIR, name)
+        return path if os.path.exists(path) else None
+
+    def read(self, session_id):
+        return parse_session(decompress(self.read_bytes(session_id), self.find_dictionary))
+
+    def compact(self, transform=None):
+        """Rewrite live records into fresh segments and remove the old ones.
+
+        ``transform(payload)``, if given, returns the payload to write for
+        each live record (used to recompress them). Records are read,
+        transformed and written one at a time, so memory use doesn't grow
+        with the store; if anything fails the new segments are removed and
+        the old ones are left as they were.
+        """
+        with self._lock, self._file_lock():
+            self.refresh()
+            old = self.segments()
+            bytes_before = sum(os.path.getsize(self._segment_path(n)) for n in old)
+            live = [*self._index.items()]
+            number = (old[-1] + 1) if old else 1
+            first_new = number
+            size = 0
+            fd = os.open(self._segment_path(number), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                for session_id, location in live:
+                    payload = self._read_at(session_id, *location)
+                    if transform is not None:
+                        payload = transform(payload)
+                    record = self._encode(PUT, session_id, payload)
+                    if size and size + len(record) > self.max_segment_bytes:
+                        os.fsync(fd)
+                        os.close(fd)
+                        self._seal(number)
+                        number += 1
+                        size = 0
+                        fd = os.open(self._segment_path(number), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                    os.write(fd, record)
+                    size += len(record)
+                os.fsync(fd)
+            except BaseException:
+                for n in range(first_new, number + 1):
+                    for suffix in ("log", "idx"):
+                        try:
+                            os.remove(self._segment_path(n, suffix))
+                        except FileNotFoundError:
+                            pass
+                raise
+            finally:
+                os.close(fd)
+            for n in old:
+                for suffix in ("log", "idx"):
+                    try:
+                        os.remove(self._segment_path(n, suffix))
+                    except FileNotFoundError:
+                        pass
+            self._reset()
+            self.refresh()
+            bytes_after = sum(os.path.getsize(self._segment_path(n)) for n in range(first_new, number + 1))
+            return {
+                "records": len(live),
+                "segments_before": len(old),
+                "segments_after": number - first_new + 1,
+                "bytes_before": bytes_before,
+                "bytes_after": bytes_after,
+            }
+
+    def clear(self):
+        """Remove every segment and index file."""
+        with self._lock, self._file_lock():
+            for name in os.listdir(self.directory):
+                if name.startswith("segment_"):
+                    os.remove(os.path.join(self.directory, name))
+            self._reset()
+
+
+class _FileLock:
+    """Exclusive advisory lock so several processes can append to one log."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
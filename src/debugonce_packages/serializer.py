@@ -0,0 +1,311 @@
+"""
+Type-dispatched encoding of captured values.
+
+Arguments, keyword arguments and results are turned into JSON-native data
+before a session is written. Values JSON can't represent become tagged
+objects::
+
+    {"__debugonce_type__": "datetime", "value": "2024-05-20T14:35:08"}
+
+that :func:`decode` turns back into the original type. Encoders are looked
+up by exact type first, then along the MRO; the result of that lookup is
+cached per type. Built in are the common stdlib types (datetime, Decimal,
+UUID, paths, sets, tuples, complex, enums, dataclasses), ``bytes`` and other
+buffer-protocol objects, and NumPy arrays (without importing NumPy). Anything
+else falls back to a lossy ``repr`` entry. More types can be added with
+:func:`register_serializer`.
+
+Dataclasses and enums are rebuilt from the class name stored with them,
+but only from modules that are already imported: the name comes from the
+session file, and importing a module runs its code. Trusted modules can be
+allowed with :func:`configure_decoding`. Values whose class isn't available
+decode to their stored fields or value.
+
+``dumps`` uses ``orjson`` when it is installed and the standard ``json``
+module otherwise.
+"""
+
+import base64
+import dataclasses
+import datetime
+import decimal
+import enum
+import importlib
+import json
+import math
+import pathlib
+import sys
+import threading
+import uuid
+from .calltree import iter_frames
+
+try:
+    import orjson
+except ImportError:  # optional, pip install debugonce[fast]
+    orjson = None
+
+TYPE_KEY = "__debugonce_type__"
+
+_PLAIN = frozenset((str, int, bool, type(None)))
+
+_lock = threading.Lock()
+_encoders = {}   # type -> (tag, encode)
+_decoders = {}   # tag -> decode
+_cache = {}      # type -> (tag, encode) or None, resolved along the MRO
+_importable = ()  # modules decode may import, or True for any
+
+
+def register_serializer(cls, tag, encode, decode=None):
+    """Encode instances of ``cls`` (and subclasses) with ``encode``.
+
+    ``encode`` returns JSON-native data (it may contain further values to
+    encode); ``decode`` rebuilds the instance from it. Without a decoder the
+    encoded data is what readers get back.
+    """
+    with _lock:
+        _encoders[cls] = (tag, encode)
+        if decode is not None:
+            _decoders[tag] = decode
+        _cache.clear()
+
+
+def configure_decoding(allow_imports=()):
+    """Let decoding import ``allow_imports`` (module names, with their submodules) to find classes.
+
+    ``True`` allows any module; exported replay scripts, which run the
+    captured code anyway, use that.
+    """
+    global _importable
+    _importable = True if allow_imports is True else tuple(allow_imports)
+
+
+def _may_import(module_name):
+    if _importable is True:
+        return True
+    return any(module_name == allowed or module_name.startswith(allowed + ".") for allowed in _importable)
+
+
+def _lookup(cls):
+    try:
+        return _cache[cls]
+    except KeyError:
+        pass
+    found = None
+    for base in cls.__mro__:
+        if base in _encoders:
+            found = _encoders[base]
+            break
+    if found is None and dataclasses.is_dataclass(cls):
+        found = ("dataclass", _encode_dataclass)
+    if found is None and cls.__module__ == "numpy" and cls.__name__ == "ndarray":
+        found = ("ndarray", _encode_ndarray)
+    with _lock:
+        _cache[cls] = found
+    return found
+
+
+def encode(value):
+    """Return ``value`` as JSON-native data, tagging anything JSON can't hold."""
+    cls = type(value)
+    if cls in _PLAIN:
+        return value
+    if cls is float:
+        if math.isfinite(value):
+            return value
+        return {TYPE_KEY: "float", "value": repr(value)}
+    if cls is list:
+        return [item if type(item) in _PLAIN else encode(item) for item in value]
+    if cls is dict:
+        if all(type(key) is str for key in value) and TYPE_KEY not in value:
+            return {key: item if type(item) in _PLAIN else encode(item) for key, item in value.items()}
+        return {TYPE_KEY: "dict", "items": [[encode(k), encode(v)] for k, v in value.items()]}
+    entry = _lookup(cls)
+    if entry is not None:
+        tag, encoder = entry
+        return {TYPE_KEY: tag, "value": encode(encoder(value))}
+    for base in (dict, list, str, int, float):
+        if isinstance(value, base):
+            return encode(base(value))
+    try:
+        view = memoryview(value)
+    except TypeError:
+        return {TYPE_KEY: "repr", "type": _qualified_name(cls), "value": repr(value)}
+    return {TYPE_KEY: "buffer", "value": _encode_buffer(view)}
+
+
+def decode(data):
+    """Rebuild the values produced by :func:`encode`."""
+    cls = type(data)
+    if cls is list:
+        return [decode(item) for item in data]
+    if cls is not dict:
+        return data
+    tag = data.get(TYPE_KEY)
+    if tag is None:
+        return {key: decode(item) for key, item in data.items()}
+    if tag == "dict":
+        return {_hashable(decode(k)): decode(v) for k, v in data["items"]}
+    if tag == "repr":
+        return data
+    decoder = _decoders.get(tag)
+    value = decode(data.get("value"))
+    return decoder(value) if decoder is not None else value
+
+
+def _hashable(key):
+    return tuple(key) if isinstance(key, list) else key
+
+
+def dumps(data, indent=False):
+    """Serialize JSON-native ``data`` to bytes, with ``orjson`` when available."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0)
+        except TypeError:
+            pass
+    if indent:
+        return json.dumps(data, indent=4).encode("utf-8")
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+def _encode_values(frame):
+    frame["args"] = [encode(arg) for arg in frame.get("args") or []]
+    frame["kwargs"] = {key: encode(value) for key, value in (frame.get("kwargs") or {}).items()}
+    frame["result"] = encode(frame.get("result"))
+
+
+def _decode_values(frame):
+    if isinstance(frame.get("args"), list):
+        frame["args"] = decode(frame["args"])
+    if isinstance(frame.get("kwargs"), dict):
+        frame["kwargs"] = decode(frame["kwargs"])
+    if "result" in frame:
+        frame["result"] = decode(frame["result"])
+
+
+def encode_state(state):
+    """Encode the captured values of a session (and its call tree) in place."""
+    _encode_values(state)
+    for frame in iter_frames(state.get("call_tree")):
+        _encode_values(frame)
+    return state
+
+
+def decode_state(data):
+    """Decode the captured values of a loaded session (and its call tree) in place."""
+    _decode_values(data)
+    for frame in iter_frames(data.get("call_tree")):
+        _decode_values(frame)
+    return data
+
+
+def _qualified_name(cls):
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def _import_class(name):
+    module_name, _, qualname = name.rpartition(".")
+    while module_name:
+        module = sys.modules.get(module_name)
+        if module is None and module_name != "__main__" and _may_import(module_name):
+            try:
+                module = importlib.import_module(module_name)
+            except Exception:
+                module = None
+        if module is not None:
+            obj = module
+            try:
+                for part in qualname.split("."):
+                    obj = getattr(obj, part)
+                return obj
+            except AttributeError:
+                return None
+        module_name, _, head = module_name.rpartition(".")
+        qualname = f"{head}.{qualname}"
+    return None
+
+
+def _encode_buffer(view):
+    return {
+        "format": view.format,
+        "shape": list(view.shape),
+        "data": base64.b64encode(view.tobytes()).decode("ascii"),
+    }
+
+
+def _decode_buffer(value):
+    data = base64.b64decode(value["data"])
+    if value["format"] in ("B", "b", "c") and len(value["shape"]) <= 1:
+        return data
+    return memoryview(data).cast(value["format"], value["shape"])
+
+
+def _encode_dataclass(value):
+    fields = {field.name: getattr(value, field.name) for field in dataclasses.fields(value)}
+    return {"type": _qualified_name(type(value)), "fields": fields}
+
+
+def _decode_dataclass(value):
+    cls = _import_class(value["type"])
+    if cls is None or not dataclasses.is_dataclass(cls):
+        return value["fields"]
+    init = {f.name for f in dataclasses.fields(cls) if f.init}
+    instance = cls(**{k: v for k, v in value["fields"].items() if k in init})
+    for name, field_value in value["fields"].items():
+        if name not in init:
+            object.__setattr__(instance, name, field_value)
+    return instance
+
+
+def _encode_enum(value):
+    return {"type": _qualified_name(type(value)), "value": value.value}
+
+
+def _decode_enum(value):
+    cls = _import_class(value["type"])
+    return cls(value["value"]) if cls is not None else value["value"]
+
+
+def _encode_ndarray(value):
+    return {
+        "dtype": value.dtype.str,
+        "shape": list(value.shape),
+        "data": base64.b64encode(value.tobytes()).decode("ascii"),
+    }
+
+
+def _decode_ndarray(value):
+    try:
+        import numpy
+    except ImportError:
+        return value
+    data = base64.b64decode(value["data"])
+    return numpy.frombuffer(data, dtype=value["dtype"]).reshape(value["shape"]).copy()
+
+
+def _decode_bytes(value):
+    return base64.b64decode(value)
+
+
+for _cls, _tag, _encode, _decode in (
+    (bytes, "bytes", lambda v: base64.b64encode(v).decode("ascii"), _decode_bytes),
+    (bytearray, "bytearray", lambda v: base64.b64encode(v).decode("ascii"), lambda v: bytearray(_decode_bytes(v))),
+    (memoryview, "buffer", _encode_buffer, _decode_buffer),
+    (tuple, "tuple", list, tuple),
+    (set, "set", list, set),
+    (frozenset, "frozenset", list, frozenset),
+    (complex, "complex", lambda v: [v.real, v.imag], lambda v: complex(*v)),
+    (datetime.datetime, "datetime", datetime.datetime.isoformat, datetime.datetime.fromisoformat),
+    (datetime.date, "date", datetime.date.isoformat, datetime.date.fromisoformat),
+    (datetime.time, "time", datetime.time.isoformat, datetime.time.fromisoformat),
+    (datetime.timedelta, "timedelta", lambda v: [v.days, v.seconds, v.microseconds],
+     lambda v: datetime.timedelta(*v)),
+    (decimal.Decimal, "decimal", str, decimal.Decimal),
+    (uuid.UUID, "uuid", str, uuid.UUID),
+    (pathlib.PurePath, "path", str, pathlib.Path),
+    (enum.Enum, "enum", _encode_enum, _decode_enum),
+):
+    register_serializer(_cls, _tag, _encode, _decode)
+_decoders["dataclass"] = _decode_dataclass
+_decoders["ndarray"] = _decode_ndarray
+_decoders["float"] = float
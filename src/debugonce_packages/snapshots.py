@@ -0,0 +1,125 @@
+"""
+Content snapshots of the files a captured call reads.
+
+With :func:`configure_file_snapshots`, the first time a call opens a file for
+reading its contents are added to the blob store (streamed, deduplicated by
+SHA-256) and the file's ``file_access`` entry gets a snapshot::
+
+    {"path": "/data/input.csv", "sha256": "<hash>", "size": 8192}
+
+Files over the per-file cap, or past the per-session budget, are recorded
+with a ``skipped`` reason instead.
+
+Replay scripts call :func:`materialize`, which lays the snapshots out in a
+sandbox directory mirroring their original absolute paths, then runs the
+call from the sandbox's copy of the working directory with ``open``
+redirected for the snapshotted paths. Files that are only read are
+hard-linked from the store; files the call also writes are cloned
+(copy-on-write where the filesystem supports it) or copied.
+"""
+
+import builtins
+import os
+import shutil
+import tempfile
+from . import hooks
+
+SANDBOX_ENV = "DEBUGONCE_SANDBOX"
+
+_max_file = 16 * 1024 * 1024
+_session_budget = 128 * 1024 * 1024
+_FICLONE = 0x40049409
+
+
+def configure_file_snapshots(enabled=True, max_file=16 * 1024 * 1024, session_budget=128 * 1024 * 1024):
+    """Snapshot files read by captured calls.
+
+    Files larger than ``max_file`` bytes are skipped, as are files that
+    would take a session past ``session_budget`` bytes of snapshots
+    (``None`` for no limit).
+    """
+    global _max_file, _session_budget
+    _max_file = max_file
+    _session_budget = session_budget
+    hooks._snapshotter = snapshot_file if enabled else None
+
+
+def snapshot_file(path, size, used):
+    """Store the file at ``path`` (``size`` bytes at open) for a session that has ``used`` bytes of snapshots."""
+    path = os.path.abspath(path)
+    if _max_file is not None and size > _max_file:
+        return {"path": path, "size": size, "skipped": "file too large"}
+    if _session_budget is not None and used + size > _session_budget:
+        return {"path": path, "size": size, "skipped": "session budget exceeded"}
+    try:
+        from .blobs import store_file
+        from .storage import get_default_storage
+        digest, size = store_file(get_default_storage().storage_dir, path)
+    except (OSError, ValueError) as e:
+        return {"path": path, "size": size, "skipped": f"{type(e).__name__}: {e}"}
+    return {"path": path, "sha256": digest, "size": size}
+
+
+def _clone(source, target):
+    """Copy ``source`` to ``target``, sharing blocks where the filesystem allows it."""
+    try:
+        import fcntl
+        src = os.open(source, os.O_RDONLY)
+        try:
+            dst = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                fcntl.ioctl(dst, _FICLONE, src)
+                return
+            finally:
+                os.close(dst)
+        finally:
+            os.close(src)
+    except (ImportError, OSError):
+        pass
+    shutil.copyfile(source, target)
+    os.chmod(target, 0o644)
+
+
+def _place(source, target, writable):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.lexists(target):
+        os.remove(target)
+    if not writable:
+        try:
+            os.link(source, target)
+            return
+        except OSError:
+            pass
+    _clone(source, target)
+
+
+def _sandboxed(sandbox, path):
+    return os.path.join(sandbox, os.path.abspath(path).lstrip(os.sep))
+
+
+def materialize(files, cwd, sandbox=None):
+    """Lay out snapshotted ``files`` in ``sandbox`` and run from there.
+
+    ``files`` are ``{"path", "blob", "writable"}`` dicts (``blob`` being the
+    stored file). The sandbox defaults to ``$DEBUGONCE_SANDBOX`` or a new
+    temporary directory. Changes into the sandbox's copy of ``cwd``, routes
+    ``open`` of the original paths to the copies and returns the sandbox.
+    """
+    sandbox = sandbox or os.environ.get(SANDBOX_ENV) or tempfile.mkdtemp(prefix="debugonce-files-")
+    redirects = {}
+    for file in files:
+        target = _sandboxed(sandbox, file["path"])
+        _place(file["blob"], target, file.get("writable", False))
+        redirects[os.path.abspath(file["path"])] = target
+    workdir = _sandboxed(sandbox, cwd)
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    real_open = builtins.open
+
+    def sandboxed_open(file, *args, **kwargs):
+        if isinstance(file, (str, os.PathLike)):
+            file = redirects.get(os.path.abspath(file), file)
+        return real_open(file, *args, **kwargs)
+
+    builtins.open = sandboxed_open
+    return sandbox
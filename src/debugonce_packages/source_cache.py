@@ -0,0 +1,92 @@
+"""
+Memoized function source and module import extraction.
+
+``inspect.getsource`` and scanning the whole module for ``import`` lines are
+the most expensive parts of a capture. Results are cached per code object and
+per module file, validated against the file's mtime and size, and bounded by
+an LRU so long-running processes with many decorated functions don't grow
+without limit.
+"""
+
+import inspect
+import os
+import threading
+from collections import OrderedDict
+
+MAX_ENTRIES = 512
+
+_functions = OrderedDict()  # id(code) -> (code, signature, source, imports)
+_modules = OrderedDict()    # module file -> (signature, imports)
+_lock = threading.Lock()
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError, ValueError):
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _remember(cache, key, value):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > MAX_ENTRIES:
+        cache.popitem(last=False)
+
+
+def _fallback_source(func):
+    return f"def {func.__name__}(*args, **kwargs):\n    raise NotImplementedError('Source code not available')"
+
+
+def _module_imports(module_file, module, signature):
+    with _lock:
+        entry = _modules.get(module_file)
+        if entry is not None and entry[0] == signature:
+            _modules.move_to_end(module_file)
+            return entry[1]
+    imports = [line for line in inspect.getsource(module).split('\n')
+               if line.startswith('import') or line.startswith('from')]
+    with _lock:
+        _remember(_modules, module_file, (signature, imports))
+    return imports
+
+
+def get_source_and_imports(func):
+    """Return ``(function_source, imports)`` for ``func``.
+
+    Falls back to a stub that raises ``NotImplementedError`` when the source
+    cannot be found. A cache hit costs a dictionary lookup and one ``stat``
+    of the defining file; no source is read.
+    """
+    code = getattr(func, "__code__", None)
+    if code is None:
+        return _load(func, None)
+    signature = _file_signature(code.co_filename)
+    key = id(code)
+    with _lock:
+        entry = _functions.get(key)
+        if entry is not None and entry[0] is code and entry[1] == signature:
+            _functions.move_to_end(key)
+            return entry[2], entry[3]
+    source, imports = _load(func, code)
+    with _lock:
+        _remember(_functions, key, (code, signature, source, imports))
+    return source, imports
+
+
+def _load(func, code):
+    try:
+        source = inspect.getsource(func)
+        module = inspect.getmodule(func)
+        module_file = getattr(module, "__file__", None) or (code and code.co_filename)
+        return source, _module_imports(module_file, module, _file_signature(module_file))
+    except Exception:
+        return _fallback_source(func), []
+
+
+def clear():
+    """Drop every cached entry."""
+    with _lock:
+        _functions.clear()
+        _modules.clear()
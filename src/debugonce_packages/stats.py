@@ -0,0 +1,274 @@
+"""
+In-process timing statistics for captures.
+
+The wrapper and the capture path time their phases with
+``time.perf_counter_ns`` and feed the spans into log-bucketed histograms
+(four buckets per power of two, so percentiles are within ~12%), keyed by
+function and phase. Phases:
+
+- ``overhead``: time the wrapper added around the call, capture included
+- ``source``: function source and import lookup
+- ``environment``: environment snapshot
+- ``serialize`` / ``write``: encoding and storing the session
+- ``io``: time spent inside tracked ``open()`` and HTTP calls during the call
+- ``cpu``: process CPU time (user + system) during the call, when
+  :func:`~debugonce_packages.resources.configure_resources` is on
+
+Resource samples also keep per-function maxima: RSS growth, peak RSS, open
+file descriptors and threads, and how often a call raised the RSS peak.
+
+``get_stats()`` returns a summary, ``persist_stats()`` writes the raw
+histograms to ``<store>/stats/`` so ``debugonce stats`` can merge them across
+processes.
+"""
+
+import atexit
+import os
+import threading
+import time
+
+STATS_DIR = "stats"
+
+_lock = threading.Lock()
+_histograms = {}  # (function, phase) -> Histogram
+_counters = {}    # function -> {"captures": n, "bytes_written": n}
+_resources = {}   # function -> {"samples": n, "peak_raised": n, "max_*": n}
+_persist_dir = None
+_atexit_registered = False
+_started = int(time.time())
+
+
+def _bucket(ns):
+    if ns < 8:
+        return max(ns, 0)
+    bits = ns.bit_length()
+    return bits * 4 + ((ns >> (bits - 3)) & 3)
+
+
+def _bucket_value(index):
+    """Midpoint of the values that fall into bucket ``index``, in ns."""
+    if index < 8:
+        return index
+    bits, sub = divmod(index, 4)
+    low = (4 + sub) << (bits - 3)
+    high = (5 + sub) << (bits - 3)
+    return (low + high) / 2
+
+
+class Histogram:
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, ns):
+        index = _bucket(ns)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+    def merge(self, other):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, fraction):
+        if not self.count:
+            return 0
+        rank = fraction * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(_bucket_value(index), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_us": self.total / self.count / 1000 if self.count else 0,
+            "p50_us": self.percentile(0.5) / 1000,
+            "p99_us": self.percentile(0.99) / 1000,
+            "max_us": self.max / 1000,
+            "total_ms": self.total / 1e6,
+        }
+
+    def to_dict(self):
+        return {"buckets": self.buckets, "count": self.count, "total": self.total, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        histogram.buckets = {int(k): v for k, v in data["buckets"].items()}
+        histogram.count = data["count"]
+        histogram.total = data["total"]
+        histogram.max = data["max"]
+        return histogram
+
+
+def record(function, phase, ns):
+    """Add one span of ``ns`` nanoseconds for ``function``/``phase``."""
+    key = (function, phase)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.add(ns)
+
+
+def count(function, captures=0, bytes_written=0):
+    with _lock:
+        counters = _counters.get(function)
+        if counters is None:
+            counters = _counters[function] = {"captures": 0, "bytes_written": 0}
+        counters["captures"] += captures
+        counters["bytes_written"] += bytes_written
+
+
+def _merge_resources(merged, values):
+    for key, value in values.items():
+        if value is None:
+            continue
+        if key.startswith("max_"):
+            merged[key] = max(merged.get(key) or 0, value)
+        else:
+            merged[key] = merged.get(key, 0) + value
+
+
+def record_resources(function, usage):
+    """Add one ``resources`` entry (see :mod:`debugonce_packages.resources`) for ``function``."""
+    if "cpu_user_ms" in usage:
+        record(function, "cpu", int((usage["cpu_user_ms"] + usage["cpu_system_ms"]) * 1e6))
+    rss_before = usage.get("rss_before")
+    values = {
+        "samples": 1,
+        "peak_raised": 1 if usage.get("peak_raised") else 0,
+        "max_rss_growth": usage["rss_after"] - rss_before if rss_before is not None else None,
+        "max_rss_peak": usage.get("rss_peak"),
+        "max_fds": usage.get("fds_after"),
+        "max_threads": usage.get("threads_after"),
+    }
+    with _lock:
+        _merge_resources(_resources.setdefault(function, {}), values)
+
+
+def reset_stats():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _resources.clear()
+
+
+def _writer_stats():
+    from .decorator import get_async_writer
+    writer = get_async_writer()
+    return writer.stats() if writer is not None else None
+
+
+def raw_stats():
+    """Histograms and counters in the persisted (mergeable) form."""
+    with _lock:
+        histograms = {}
+        for (function, phase), histogram in _histograms.items():
+            histograms.setdefault(function, {})[phase] = histogram.to_dict()
+        counters = {function: dict(values) for function, values in _counters.items()}
+        resources = {function: dict(values) for function, values in _resources.items()}
+    return {"histograms": histograms, "counters": counters, "resources": resources, "writer": _writer_stats()}
+
+
+def summarize(raw_list):
+    """Merge raw stats from one or more processes into a summary."""
+    histograms = {}
+    counters = {}
+    resources = {}
+    writer = {}
+    for raw in raw_list:
+        for function, phases in raw.get("histograms", {}).items():
+            for phase, data in phases.items():
+                merged = histograms.setdefault(function, {}).setdefault(phase, Histogram())
+                merged.merge(Histogram.from_dict(data))
+        for function, values in raw.get("counters", {}).items():
+            merged = counters.setdefault(function, {"captures": 0, "bytes_written": 0})
+            for key, value in values.items():
+                merged[key] = merged.get(key, 0) + value
+        for function, values in raw.get("resources", {}).items():
+            _merge_resources(resources.setdefault(function, {}), values)
+        for key, value in (raw.get("writer") or {}).items():
+            writer[key] = writer.get(key, 0) + value
+    functions = {}
+    for function in sorted(set(histograms) | set(counters)):
+        functions[function] = {
+            "phases": {phase: h.summary() for phase, h in sorted(histograms.get(function, {}).items())},
+            **counters.get(function, {"captures": 0, "bytes_written": 0}),
+        }
+        if function in resources:
+            functions[function]["resources"] = resources[function]
+    slowest = sorted(
+        ((function, phase, h.summary()) for function, phases in histograms.items()
+         for phase, h in phases.items() if phase not in ("overhead", "cpu")),
+        key=lambda item: item[2]["p99_us"],
+        reverse=True,
+    )
+    return {
+        "functions": functions,
+        "writer": writer,
+        "dropped": writer.get("dropped_oldest", 0) + writer.get("dropped_new", 0),
+        "slowest_phases": [
+            {"function": function, "phase": phase, "p99_us": summary["p99_us"], "total_ms": summary["total_ms"]}
+            for function, phase, summary in slowest[:5]
+        ],
+    }
+
+
+def get_stats():
+    """Summary of the spans recorded in this process."""
+    return summarize([raw_stats()])
+
+
+def persist_stats(storage_dir=".debugonce"):
+    """Write this process's raw stats to ``<storage_dir>/stats/<pid>-<start>.json``."""
+    import json
+    stats_dir = os.path.join(storage_dir, STATS_DIR)
+    os.makedirs(stats_dir, exist_ok=True)
+    path = os.path.join(stats_dir, f"{os.getpid()}-{_started}.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(raw_stats(), f)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_persisted(storage_dir=".debugonce"):
+    import json
+    stats_dir = os.path.join(storage_dir, STATS_DIR)
+    raw_list = []
+    if os.path.isdir(stats_dir):
+        for name in sorted(os.listdir(stats_dir)):
+            if name.endswith(".json"):
+                with open(os.path.join(stats_dir, name), "r") as f:
+                    raw_list.append(json.load(f))
+    return raw_list
+
+
+def configure_stats(persist=False, storage_dir=".debugonce"):
+    """Persist this process's stats to ``storage_dir`` at interpreter exit."""
+    global _persist_dir, _atexit_registered
+    if persist and not _atexit_registered:
+        atexit.register(_persist_at_exit)
+        _atexit_registered = True
+    _persist_dir = storage_dir if persist else None
+
+
+def _persist_at_exit():
+    if _persist_dir is not None:
+        try:
+            persist_stats(_persist_dir)
+        except OSError:
+            pass
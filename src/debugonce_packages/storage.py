@@ -1,48 +1,499 @@
+import io
 import os
-import json
+import shutil
+import threading
+import time
+from . import stats
+from .catalog import BLOB, SessionCatalog, session_refs, session_row
+from .compression import DICT_DIR, TRAIN_SAMPLES, SessionCompressor, decompress, open_stream
+from .ids import is_session_id, shard_of
+from .layout import blob_digests, encode_session, header_first, parse_session, read_header, read_sections
+from .segments import SegmentLog
+
+BACKENDS = ("files", "segments")
+COMPRESSIONS = (None, "zlib")
+SEGMENTS_DIR = "segments"
+SESSIONS_DIR = "sessions"
+SWEEP_GRACE = 600.0  # seconds a shared store entry is kept after a capture last referred to it
+
+
+def session_path(storage_dir, session_name):
+    """Where the session file for ``session_name`` lives.
+
+    Generated session ids are sharded into ``sessions/<time prefix>/<next
+    chars>/`` so no directory grows without bound; any other name maps to a
+    flat file.
+    """
+    if is_session_id(session_name):
+        return os.path.join(storage_dir, SESSIONS_DIR, shard_of(session_name), f"{session_name}.json")
+    return os.path.join(storage_dir, f"{session_name}.json")
+
+
+def iter_session_files(storage_dir):
+    """Yield ``os.DirEntry`` objects for every session file, flat or sharded."""
+    if not os.path.isdir(storage_dir):
+        return
+    for entry in os.scandir(storage_dir):
+        if entry.is_file() and entry.name.endswith(".json"):
+            yield entry
+    sessions_dir = os.path.join(storage_dir, SESSIONS_DIR)
+    if os.path.isdir(sessions_dir):
+        for outer in sorted(os.scandir(sessions_dir), key=lambda e: e.name):
+            if not outer.is_dir():
+                continue
+            for shard in sorted(os.scandir(outer.path), key=lambda e: e.name):
+                if shard.is_dir():
+                    for entry in os.scandir(shard.path):
+                        if entry.is_file() and entry.name.endswith(".json"):
+                            yield entry
+
+
+def find_in_store(session_file, *parts):
+    """Locate a shared store file (env snapshot, blob, ...) for a session.
+
+    The store is searched from the session's directory upwards, then in
+    ``.debugonce`` under the current directory. Returns ``None`` if absent.
+    """
+    candidates = []
+    directory = os.path.dirname(os.path.abspath(session_file))
+    for _ in range(4):
+        candidates.append(directory)
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    candidates.append(os.path.abspath(".debugonce"))
+    for storage_dir in candidates:
+        path = os.path.join(storage_dir, *parts)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def open_session_file(path):
+    """Open the session file at ``path`` for reading its JSON body, inflating it if compressed."""
+    f = open(path, "rb")
+    try:
+        return open_stream(f, lambda name: find_in_store(path, DICT_DIR, name))
+    except BaseException:
+        f.close()
+        raise
+
+
+def read_session_file(path):
+    """Body of the session file at ``path`` as JSON bytes."""
+    with open_session_file(path) as stream:
+        return stream.read()
+
+
+def touch(path):
+    """Refresh the modification time of ``path``; False if it doesn't exist.
+
+    Shared store entries are touched whenever a new capture refers to them
+    again, so a sweep running meanwhile leaves them alone.
+    """
+    try:
+        os.utime(path)
+    except OSError:
+        return False
+    return True
+
+
+def write_atomic(path, body):
+    """Write ``body`` so readers see either the old file or the complete new one."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb" if isinstance(body, (bytes, bytearray, memoryview)) else "w") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
 
 class StorageManager:
-    """Manages storage for captured sessions."""
+    """Manages storage for captured sessions.
 
-    def __init__(self, storage_dir=".debugonce"):
+    The ``"files"`` backend writes one JSON file per session. The
+    ``"segments"`` backend appends compact records to a rotating segment log
+    under ``<storage_dir>/segments`` (see :class:`SegmentLog`); ``fsync`` and
+    ``max_segment_bytes`` are passed through to it.
+
+    With ``catalog=True`` every write and delete is mirrored into the
+    SQLite :class:`SessionCatalog` so sessions can be queried by metadata.
+    A :class:`RetentionPolicy` passed as ``retention`` is enforced from the
+    catalog as sessions are saved. Deleting sessions also removes the blobs
+    and environment snapshots that no session in the catalog refers to any
+    more (see :meth:`sweep`).
+
+    With ``compression="zlib"`` new session bodies are compressed with a
+    dictionary trained from recent sessions (see
+    :mod:`debugonce_packages.compression`). Plain and compressed sessions
+    are read alike whatever this is set to.
+    """
+
+    def __init__(self, storage_dir=".debugonce", backend="files", fsync="batch",
+                 max_segment_bytes=64 * 1024 * 1024, catalog=True, retention=None,
+                 compression=None, compression_level=6):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown storage backend '{backend}', expected one of {BACKENDS}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression '{compression}', expected one of {COMPRESSIONS}")
         self.storage_dir = storage_dir
+        self.backend = backend
         os.makedirs(self.storage_dir, exist_ok=True)
+        self.segments = None
+        if backend == "segments":
+            self.segments = SegmentLog(
+                os.path.join(self.storage_dir, SEGMENTS_DIR),
+                max_segment_bytes=max_segment_bytes,
+                fsync=fsync,
+            )
+        self.catalog = SessionCatalog(self.storage_dir) if catalog or retention else None
+        self.retention = retention
+        self.compressor = SessionCompressor(self.storage_dir, compression_level) if compression else None
+        self._sweep_lock = threading.Lock()
+        self._deferred = set()  # unreferenced entries kept for SWEEP_GRACE, retried by the next sweep
 
     def save_session(self, session_name, data):
         """Save session data to a file."""
+        return self.save_sessions([(session_name, data)])[0]
+
+    def save_sessions(self, sessions):
+        """Save several ``(session_name, data)`` pairs in one batch."""
         try:
-            file_path = os.path.join(self.storage_dir, f"{session_name}.json")
-            with open(file_path, "w") as f:
-                json.dump(data, f, indent=4)
-            return file_path
+            compressor = self.compressor
+            if compressor is not None:
+                compressor.refresh()
+            if self.segments is not None:
+                started = time.perf_counter_ns()
+                records = [(session_name, encode_session(data)) for session_name, data in sessions]
+                if compressor is not None:
+                    records = [(session_name, compressor.compress(body)) for session_name, body in records]
+                sizes = self.segments.append_many(records)
+                per_session = (time.perf_counter_ns() - started) // max(len(sessions), 1)
+                for (_, data), size in zip(sessions, sizes):
+                    stats.record(data.get("function"), "write", per_session)
+                    stats.count(data.get("function"), bytes_written=size)
+                paths = [session_name for session_name, _ in sessions]
+                locations = [SEGMENTS_DIR] * len(sessions)
+            else:
+                paths, sizes, locations = [], [], []
+                for session_name, data in sessions:
+                    file_path = session_path(self.storage_dir, session_name)
+                    started = time.perf_counter_ns()
+                    body = encode_session(data, indent=True)
+                    if compressor is not None:
+                        body = compressor.compress(body)
+                    serialized = time.perf_counter_ns()
+                    write_atomic(file_path, body)
+                    stats.record(data.get("function"), "serialize", serialized - started)
+                    stats.record(data.get("function"), "write", time.perf_counter_ns() - serialized)
+                    stats.count(data.get("function"), bytes_written=len(body))
+                    paths.append(file_path)
+                    sizes.append(len(body))
+                    locations.append(os.path.relpath(file_path, self.storage_dir))
+            if self.catalog is not None:
+                self.catalog.add_many([
+                    session_row(session_name, data, size, location)
+                    for (session_name, data), size, location in zip(sessions, sizes, locations)
+                ], [
+                    ref for session_name, data in sessions
+                    for ref in session_refs(session_name, data.get("environment_ref"), blob_digests(data))
+                ])
+            if self.retention is not None and self.retention.note_writes(
+                    len(sessions), {data.get("function") for _, data in sessions}):
+                self.enforce_retention()
+            return paths
         except Exception as e:
             raise IOError(f"Failed to save session: {e}")
 
     def load_session(self, session_name):
         """Load session data from a file."""
         try:
-            file_path = os.path.join(self.storage_dir, f"{session_name}.json")
+            if self.segments is not None:
+                return self.segments.read(session_name)
+            file_path = session_path(self.storage_dir, session_name)
             if not os.path.exists(file_path):
                 raise FileNotFoundError(f"Session file '{file_path}' not found.")
-            with open(file_path, "r") as f:
-                return json.load(f)
+            return parse_session(read_session_file(file_path))
         except Exception as e:
             raise IOError(f"Failed to load session: {e}")
 
     def list_sessions(self):
         """List all saved sessions."""
         try:
-            return [
-                f for f in os.listdir(self.storage_dir)
-                if f.endswith(".json")
-            ]
+            if self.segments is not None:
+                return self.segments.ids()
+            return [entry.name for entry in iter_session_files(self.storage_dir)]
         except Exception as e:
             raise IOError(f"Failed to list sessions: {e}")
 
+    def delete_session(self, session_name):
+        """Delete a single session."""
+        self.delete_sessions([session_name])
+
+    def delete_sessions(self, session_names):
+        """Delete several sessions in one batch, whichever backend holds them."""
+        try:
+            tombstones = []
+            for session_name in session_names:
+                try:
+                    os.remove(session_path(self.storage_dir, session_name))
+                except FileNotFoundError:
+                    tombstones.append(session_name)
+            if tombstones:
+                segments = self.segments
+                if segments is None and os.path.isdir(os.path.join(self.storage_dir, SEGMENTS_DIR)):
+                    segments = SegmentLog(os.path.join(self.storage_dir, SEGMENTS_DIR))
+                missing = [name for name in tombstones if segments is None or name not in segments]
+                if missing and self.catalog is None:
+                    raise FileNotFoundError(f"Session '{missing[0]}' not found.")
+                if segments is not None:
+                    segments.append_many([(name, None) for name in tombstones if name not in missing])
+            if self.catalog is not None:
+                self.sweep(self.catalog.remove_many(session_names))
+        except Exception as e:
+            raise IOError(f"Failed to delete session: {e}")
+
+    def sweep(self, candidates):
+        """Remove the blobs and environment snapshots among ``candidates`` that nothing refers to.
+
+        ``candidates`` are ``(kind, digest)`` pairs as returned by
+        ``SessionCatalog.remove_many``. An entry a capture referred to within
+        the last ``SWEEP_GRACE`` seconds may belong to a session that isn't
+        in the catalog yet, so it is kept and checked again by the next
+        sweep. Returns the number of bytes freed.
+        """
+        from .blobs import blob_path
+        from .environment import ENV_DIR
+        with self._sweep_lock:
+            candidates = set(candidates) | self._deferred
+            self._deferred = set()
+            if not candidates:
+                return 0
+            freed = 0
+            cutoff = time.time() - SWEEP_GRACE
+            for kind, digest in self.catalog.unreferenced(candidates):
+                if kind == BLOB:
+                    path = blob_path(self.storage_dir, digest)
+                else:
+                    path = os.path.join(self.storage_dir, ENV_DIR, f"{digest}.json")
+                try:
+                    stat = os.stat(path)
+                    if stat.st_mtime > cutoff:
+                        self._deferred.add((kind, digest))
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                freed += stat.st_size
+            return freed
+
+    def enforce_retention(self, policy=None):
+        """Evict one batch of sessions that exceed ``policy`` (default: ``self.retention``)."""
+        policy = policy or self.retention
+        if policy is None or self.catalog is None:
+            return []
+        victims = policy.select_victims(self.catalog)
+        if victims:
+            self.delete_sessions(victims)
+            policy.evicted += len(victims)
+        return victims
+
     def clean_sessions(self):
         """Delete all saved sessions."""
         try:
-            for file in self.list_sessions():
-                os.remove(os.path.join(self.storage_dir, file))
+            if self.catalog is not None:
+                self.catalog.clear()
+            if self.segments is not None:
+                self.segments.clear()
+                return
+            for entry in list(iter_session_files(self.storage_dir)):
+                os.remove(entry.path)
         except Exception as e:
-            raise IOError(f"Failed to clean sessions: {e}")
\ No newline at end of file
+            raise IOError(f"Failed to clean sessions: {e}")
+
+    def compact(self):
+        """Drop superseded and deleted records from the segment log."""
+        if self.segments is None:
+            return None
+        try:
+            return self.segments.compact()
+        except Exception as e:
+            raise IOError(f"Failed to compact sessions: {e}")
+
+    def recompress(self, level=6):
+        """Train a dictionary from the newest sessions and recompress every stored session with it.
+
+        Session files are rewritten in place; the segment log, if any, is
+        compacted with its records recompressed. Sessions written before the
+        header-first layout are converted to it on the way. Returns the
+        counts and sizes before and after.
+        """
+        try:
+            compressor = self.compressor or SessionCompressor(self.storage_dir, level)
+            compressor.level = level
+            files = sorted(iter_session_files(self.storage_dir), key=lambda entry: entry.stat().st_mtime_ns)
+            segments = self.segments
+            if segments is None and os.path.isdir(os.path.join(self.storage_dir, SEGMENTS_DIR)):
+                segments = SegmentLog(os.path.join(self.storage_dir, SEGMENTS_DIR))
+            samples = [read_session_file(entry.path) for entry in files[-TRAIN_SAMPLES:]]
+            if segments is not None:
+                ids = segments.ids()[-TRAIN_SAMPLES:]
+                samples += [decompress(segments.read_bytes(i), segments.find_dictionary) for i in ids]
+            compressor.train(samples[-TRAIN_SAMPLES:])
+            result = {"files": 0, "bytes_before": 0, "bytes_after": 0, "dictionary": compressor.current[0].hex()}
+            sizes = []
+            for entry in files:
+                before = entry.stat().st_size
+                body = compressor.compress(header_first(read_session_file(entry.path), indent=True))
+                write_atomic(entry.path, body)
+                result["files"] += 1
+                result["bytes_before"] += before
+                result["bytes_after"] += len(body)
+                sizes.append((entry.name[:-len(".json")], len(body)))
+            if segments is not None:
+                result["segments"] = segments.compact(
+                    lambda payload: compressor.compress(header_first(decompress(payload, segments.find_dictionary))))
+                sizes += [(i, len(segments.read_bytes(i))) for i in segments.ids()]
+            if self.catalog is not None:
+                self.catalog.set_sizes(sizes)
+            return result
+        except Exception as e:
+            raise IOError(f"Failed to recompress sessions: {e}")
+
+    def reindex(self):
+        """Rebuild the catalog from the session bodies on disk."""
+        if self.catalog is None:
+            return 0
+        try:
+            rows, refs = [], []
+            prefix = len(os.path.join(self.storage_dir, ""))  # entries are paths under the store
+            for entry in iter_session_files(self.storage_dir):
+                # The header has every catalog column; only old sessions are parsed whole.
+                with open_session_file(entry.path) as stream:
+                    data = read_header(stream)
+                if data is None or "blobs" not in data:
+                    data = parse_session(read_session_file(entry.path))
+                if isinstance(data, dict) and "function" in data:
+                    session_id = entry.name[:-len(".json")]
+                    rows.append(session_row(session_id, data, entry.stat().st_size, entry.path[prefix:]))
+                    refs.extend(_refs(session_id, data))
+            if self.segments is not None or os.path.isdir(os.path.join(self.storage_dir, SEGMENTS_DIR)):
+                segments = self.segments or SegmentLog(os.path.join(self.storage_dir, SEGMENTS_DIR))
+                for session_id in segments.ids():
+                    payload = segments.read_bytes(session_id)
+                    with open_stream(io.BytesIO(payload), segments.find_dictionary) as stream:
+                        data = read_header(stream)
+                    if data is None or "blobs" not in data:
+                        data = parse_session(decompress(payload, segments.find_dictionary))
+                    rows.append(session_row(session_id, data, len(payload), SEGMENTS_DIR))
+                    refs.extend(_refs(session_id, data))
+            self.catalog.clear()
+            self.catalog.add_many(rows, refs)
+            return len(rows)
+        except Exception as e:
+            raise IOError(f"Failed to reindex sessions: {e}")
+
+
+def _refs(session_id, data):
+    # ``data`` is a session header, which lists the blobs, or a whole session
+    blobs = data["blobs"] if isinstance(data.get("blobs"), list) else blob_digests(data)
+    return session_refs(session_id, data.get("environment_ref"), blobs)
+
+
+_storage_options = {"storage_dir": ".debugonce", "backend": "files"}
+_default_storage = None
+
+
+def configure_storage(**options):
+    """Set the options of the store used by ``@debugonce``, e.g. ``backend="segments"``."""
+    global _default_storage
+    if "backend" in options and options["backend"] not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{options['backend']}', expected one of {BACKENDS}")
+    if "compression" in options and options["compression"] not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression '{options['compression']}', expected one of {COMPRESSIONS}")
+    _storage_options.update(options)
+    _default_storage = None
+
+
+def get_default_storage():
+    """Return the store used by ``@debugonce``, creating it on first use."""
+    global _default_storage
+    if _default_storage is None or not os.path.isdir(_default_storage.storage_dir):
+        _default_storage = StorageManager(**_storage_options)
+    return _default_storage
+
+
+def open_session_ref(ref, storage_dir=".debugonce"):
+    """Open a session given as a file path or a session id for reading its JSON body.
+
+    Returns ``(stream, path)``; the stream yields the plain JSON body
+    whether or not the session was stored compressed. For sessions held in
+    a segment log ``path`` is where the session file would live, so derived
+    files such as replay scripts are named consistently across backends.
+    """
+    if os.path.isfile(ref):
+        return open_session_file(ref), ref
+    session_id = os.path.splitext(os.path.basename(ref))[0]
+    storage_dir = os.path.dirname(ref) or storage_dir
+    file_path = session_path(storage_dir, session_id)
+    if os.path.isfile(file_path):
+        return open_session_file(file_path), file_path
+    segments_dir = os.path.join(storage_dir, SEGMENTS_DIR)
+    if os.path.isdir(segments_dir):
+        log = SegmentLog(segments_dir)
+        if session_id in log:
+            return io.BytesIO(decompress(log.read_bytes(session_id), log.find_dictionary)), file_path
+    raise FileNotFoundError(f"Session '{ref}' not found.")
+
+
+def read_session_ref(ref, storage_dir=".debugonce"):
+    """Read the JSON body of a session given as a file path or a session id.
+
+    Returns ``(payload, path)``, see :func:`open_session_ref`.
+    """
+    stream, path = open_session_ref(ref, storage_dir)
+    with stream:
+        return stream.read(), path
+
+
+def load_session_ref(ref, storage_dir=".debugonce"):
+    """Load a session from a file path or a session id; returns ``(data, path)``."""
+    payload, path = read_session_ref(ref, storage_dir)
+    return parse_session(payload), path
+
+
+def load_session_sections(ref, names, storage_dir=".debugonce"):
+    """Load only the top-level keys ``names`` of a session; returns ``(data, path)``.
+
+    Sessions in the header-first layout are read up to the last wanted
+    section; older ones are parsed whole.
+    """
+    stream, path = open_session_ref(ref, storage_dir)
+    with stream:
+        data = read_sections(stream, names)
+    if data is None:
+        full, path = load_session_ref(path if os.path.isfile(path) else ref, storage_dir)
+        data = {name: full[name] for name in names if name in full}
+    return data, path
+
+
+def clean_storage(storage_dir=".debugonce"):
+    """Remove every session, segment and snapshot under ``storage_dir``."""
+    global _default_storage
+    if _default_storage is not None and os.path.abspath(_default_storage.storage_dir) == os.path.abspath(storage_dir):
+        _default_storage = None
+    for name in os.listdir(storage_dir):
+        path = os.path.join(storage_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
@@ -0,0 +1,253 @@
+"""
+Callee tracing for ``@debugonce(trace=True)``.
+
+While a traced call runs, every Python function it calls (directly or not)
+is recorded as call and return events. On Python 3.12+ the events come from
+``sys.monitoring``, which is switched on for the duration of the call only;
+on older versions, or when another tool holds the profiler slot, from
+``sys.setprofile`` for the calling thread. The profiler tool id is claimed
+when a traced call starts and freed when it ends, so ``cProfile`` and other
+profilers can use it between traced calls.
+
+Events go into arrays sized up front (``max_events``); once full, further
+events are only counted. Whether a function is recorded is decided once per
+code object from its module: the module and each of its parent packages are
+looked up in the include and exclude sets, and the standard library and
+debugonce itself are skipped unless asked for. With ``sys.monitoring``
+functions that are never recorded are disabled at the interpreter level, so
+they cost nothing after their first call.
+
+The session stores::
+
+    "trace": {"backend": "monitoring", "functions": [[module, qualname, file, line], ...],
+              "time_ns": [...], "function": [...], "kinds": "ccrr", "dropped": 0}
+
+``kinds`` has one character per event: ``c`` call (or resume), ``r`` return
+(or yield), ``u`` exit by exception.
+"""
+
+import sys
+import threading
+import time
+from array import array
+
+CALL, RETURN, UNWIND = 0, 1, 2
+KINDS = "cru"
+
+_STDLIB = frozenset(getattr(sys, "stdlib_module_names", ()))
+_OWN = __name__.partition(".")[0]
+
+_include = None
+_exclude = frozenset()
+_stdlib = False
+_max_events = 10000
+
+_lock = threading.Lock()
+_owner = None        # the Tracer currently using sys.monitoring
+_tool_used = False   # whether locations may have been disabled for the tool
+_callbacks = None    # event -> callback, built on first use
+
+
+def configure_tracing(include=None, exclude=None, stdlib=False, max_events=10000):
+    """Choose which modules traced calls record, and how many events they keep.
+
+    ``include`` and ``exclude`` are module or package names; a module
+    matches if it or any package containing it is listed. ``stdlib=True``
+    records standard library functions too.
+    """
+    global _include, _exclude, _stdlib, _max_events
+    if max_events < 0:
+        raise ValueError("max_events must not be negative")
+    _include = frozenset(include) if include is not None else None
+    _exclude = frozenset(exclude or ())
+    _stdlib = stdlib
+    _max_events = max_events
+    if _tool_used:
+        # Functions disabled under the old filters may be wanted now.
+        sys.monitoring.restart_events()
+
+
+def _listed(module, names):
+    while True:
+        if module in names:
+            return True
+        module, dot, _ = module.rpartition(".")
+        if not dot:
+            return False
+
+
+def wanted(module):
+    """Whether functions of ``module`` are recorded under the current filters."""
+    if not module:
+        return False
+    top = module.partition(".")[0]
+    if top == _OWN or (not _stdlib and top in _STDLIB):
+        return False
+    if _exclude and _listed(module, _exclude):
+        return False
+    return _include is None or _listed(module, _include)
+
+
+class Tracer:
+    """Call/return events of one traced call, in preallocated arrays."""
+
+    __slots__ = ("capacity", "times", "functions", "kinds", "count", "dropped", "codes", "table",
+                 "start_ns", "thread", "backend", "_previous")
+
+    def __init__(self, capacity=None):
+        capacity = _max_events if capacity is None else capacity
+        self.capacity = capacity
+        self.times = array("q", bytes(8 * capacity))
+        self.functions = array("i", bytes(4 * capacity))
+        self.kinds = bytearray(capacity)
+        self.count = 0
+        self.dropped = 0
+        self.codes = {}    # code object -> index in table, or -1 if not recorded
+        self.table = []
+        self.start_ns = 0
+        self.thread = None
+        self.backend = None
+        self._previous = None
+
+    def register(self, code, module):
+        if wanted(module):
+            index = len(self.table)
+            self.table.append([module, getattr(code, "co_qualname", code.co_name),
+                               code.co_filename, code.co_firstlineno])
+        else:
+            index = -1
+        self.codes[code] = index
+        return index
+
+    def add(self, index, kind):
+        count = self.count
+        if count >= self.capacity:
+            self.dropped += 1
+            return
+        self.times[count] = time.perf_counter_ns() - self.start_ns
+        self.functions[count] = index
+        self.kinds[count] = kind
+        self.count = count + 1
+
+    def start(self):
+        global _owner
+        self.thread = threading.get_ident()
+        self.start_ns = time.perf_counter_ns()
+        if hasattr(sys, "monitoring"):
+            with _lock:
+                if _owner is None and _claim_tool():
+                    _owner = self
+                    self.backend = "monitoring"
+                    sys.monitoring.set_events(sys.monitoring.PROFILER_ID, _EVENTS)
+                    return
+        self.backend = "setprofile"
+        self._previous = sys.getprofile()
+        sys.setprofile(self._profile)
+
+    def stop(self):
+        global _owner
+        if self.backend == "monitoring":
+            with _lock:
+                _release_tool()
+                _owner = None
+        else:
+            sys.setprofile(self._previous)
+
+    def _profile(self, frame, event, arg, _kinds={"call": CALL, "return": RETURN}, _now=time.perf_counter_ns):
+        kind = _kinds.get(event)
+        if kind is None:
+            return  # c_call and friends
+        code = frame.f_code
+        index = self.codes.get(code)
+        if index is None:
+            index = self.register(code, frame.f_globals.get("__name__"))
+        if index < 0:
+            return
+        # Tracer.add, inlined: this runs for every Python call while tracing.
+        count = self.count
+        if count >= self.capacity:
+            self.dropped += 1
+            return
+        self.times[count] = _now() - self.start_ns
+        self.functions[count] = index
+        self.kinds[count] = kind
+        self.count = count + 1
+
+    def to_dict(self):
+        count = self.count
+        return {
+            "backend": self.backend,
+            "functions": self.table,
+            "time_ns": self.times[:count].tolist(),
+            "function": self.functions[:count].tolist(),
+            "kinds": "".join(KINDS[kind] for kind in self.kinds[:count]),
+            "dropped": self.dropped,
+        }
+
+
+def _event(kind, can_disable, _now=time.perf_counter_ns):
+    def callback(code, offset, *_):
+        tracer = _owner
+        if tracer is None or tracer.thread != threading.get_ident():
+            return None
+        index = tracer.codes.get(code)
+        if index is None:
+            # The callback runs on top of the frame that fired the event.
+            index = tracer.register(code, sys._getframe(1).f_globals.get("__name__"))
+        if index < 0:
+            # The filters are global, so this location never needs the event again.
+            return disable
+        count = tracer.count
+        if count >= tracer.capacity:
+            tracer.dropped += 1
+            return None
+        tracer.times[count] = _now() - tracer.start_ns
+        tracer.functions[count] = index
+        tracer.kinds[count] = kind
+        tracer.count = count + 1
+        return None
+    disable = sys.monitoring.DISABLE if can_disable else None
+    return callback
+
+
+def _claim_tool():
+    global _tool_used, _callbacks, _EVENTS
+    monitoring = sys.monitoring
+    tool = monitoring.PROFILER_ID
+    try:
+        monitoring.use_tool_id(tool, "debugonce")
+    except ValueError:
+        return False  # another profiler holds the slot
+    events = monitoring.events
+    if _callbacks is None:
+        _callbacks = {
+            event: _event(kind, can_disable)
+            for event, kind, can_disable in (
+                (events.PY_START, CALL, True),
+                (events.PY_RESUME, CALL, True),
+                (events.PY_RETURN, RETURN, True),
+                (events.PY_YIELD, RETURN, True),
+                (events.PY_UNWIND, UNWIND, False),
+            )
+        }
+        _EVENTS = (events.PY_START | events.PY_RESUME | events.PY_RETURN
+                   | events.PY_YIELD | events.PY_UNWIND)
+    for event, callback in _callbacks.items():
+        monitoring.register_callback(tool, event, callback)
+    _tool_used = True
+    return True
+
+
+def _release_tool():
+    monitoring = sys.monitoring
+    tool = monitoring.PROFILER_ID
+    monitoring.set_events(tool, 0)
+    # free_tool_id leaves callbacks in place before 3.14; the next holder must not inherit ours.
+    for event in _callbacks:
+        monitoring.register_callback(tool, event, None)
+    monitoring.free_tool_id(tool)
+    # Locations we disabled would otherwise stay silent for the next tool on this id.
+    monitoring.restart_events()
+
+
+_EVENTS = 0
@@ -0,0 +1,76 @@
+"""
+Grouping failed sessions by exception fingerprint.
+
+A session's fingerprint hashes its function, exception type and the frames
+of its stack trace, normalized to ``<file name>:<function>`` so line numbers,
+install paths and debugonce's own wrapper don't split a bug into several
+clusters. Fingerprints are cached in the session catalog by session id, so
+:func:`triage` only opens the bodies of sessions captured since the last run.
+"""
+
+import hashlib
+import os
+import re
+from .catalog import SessionCatalog
+from .storage import SEGMENTS_DIR, load_session_sections
+
+BATCH = 500
+SECTIONS = ("function", "exception_type", "stack_trace")
+
+_FRAME_RE = re.compile(r'^\s*File "([^"]+)", line \d+, in (.+)$', re.MULTILINE)
+_WRAPPER = os.path.join("debugonce_packages", "decorator.py")
+
+
+def normalize_trace(stack_trace):
+    """The ``<file name>:<function>`` frames of a formatted traceback, outermost first."""
+    if not stack_trace:
+        return []
+    return [
+        f"{os.path.basename(path)}:{name.strip()}"
+        for path, name in _FRAME_RE.findall(stack_trace)
+        if not path.endswith(_WRAPPER)
+    ]
+
+
+def fingerprint(data):
+    """Return ``(fingerprint, innermost frame)`` for a loaded session."""
+    frames = normalize_trace(data.get("stack_trace"))
+    key = "\0".join([data.get("function") or "", data.get("exception_type") or "", *frames])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16], frames[-1] if frames else None
+
+
+def _fingerprint_new(catalog, storage_dir):
+    pending = catalog.unfingerprinted()
+    batch = []
+    for session_id, location in pending:
+        ref = session_id if location == SEGMENTS_DIR else os.path.join(storage_dir, location)
+        try:
+            data, _ = load_session_sections(ref, SECTIONS, storage_dir)
+        except (OSError, ValueError):
+            continue  # deleted or unreadable since it was indexed
+        batch.append((session_id, *fingerprint(data)))
+        if len(batch) >= BATCH:
+            catalog.add_fingerprints(batch)
+            batch = []
+    if batch:
+        catalog.add_fingerprints(batch)
+    return len(pending)
+
+
+def triage(storage_dir=".debugonce", limit=None, **filters):
+    """Fingerprint new failed sessions and return ``(clusters, newly fingerprinted)``.
+
+    ``filters`` are the catalog filters (``function``, ``exception``,
+    ``module``, ``since``, ``until``).
+    """
+    catalog = SessionCatalog(storage_dir)
+    try:
+        fresh = _fingerprint_new(catalog, storage_dir)
+        clusters = catalog.clusters(limit=limit, **filters)
+    finally:
+        catalog.close()
+    for cluster in clusters:
+        location = cluster.pop("location")
+        cluster["representative"] = (cluster["session_id"] if location == SEGMENTS_DIR
+                                     else os.path.join(storage_dir, location))
+    return clusters, fresh
@@ -0,0 +1,157 @@
+"""
+Background, batched session writer.
+
+``AsyncSessionWriter`` keeps a bounded in-memory queue of captured states and
+hands them to a sink from a daemon thread, either when ``batch_size`` states
+are waiting or when ``flush_interval`` seconds have passed. The caller only
+pays for an enqueue, so states must be snapshots (the decorator encodes
+captured values before queueing them) rather than live objects the caller
+may still mutate.
+
+If the sink raises on a batch, each state in it is retried on its own so
+one bad state can't take the others down; ``errors`` counts failed sink
+calls and ``failed`` the states that were never written.
+"""
+
+import atexit
+import collections
+import logging
+import threading
+import time
+
+POLICIES = ("block", "drop_oldest", "drop_new")
+
+
+class AsyncSessionWriter:
+    """Queue captured states and write them in batches from a worker thread."""
+
+    def __init__(self, sink, max_queue=1000, batch_size=64, flush_interval=0.5, policy="block"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy '{policy}', expected one of {POLICIES}")
+        if max_queue < 1 or batch_size < 1:
+            raise ValueError("max_queue and batch_size must be positive")
+        self.sink = sink
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.counters = {
+            "enqueued": 0,
+            "written": 0,
+            "dropped_oldest": 0,
+            "dropped_new": 0,
+            "errors": 0,
+            "failed": 0,
+        }
+        self._queue = collections.deque()
+        self._in_flight = 0
+        self._closed = False
+        self._flush_requested = False
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._drained = threading.Condition(self._lock)
+        self._thread = threading.Thread(target=self._run, name="debugonce-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, state):
+        """Enqueue ``state``. Returns False if it was dropped."""
+        with self._lock:
+            if self._closed:
+                return False
+            if len(self._queue) >= self.max_queue:
+                if self.policy == "drop_new":
+                    self.counters["dropped_new"] += 1
+                    return False
+                if self.policy == "drop_oldest":
+                    self._queue.popleft()
+                    self.counters["dropped_oldest"] += 1
+                else:
+                    while len(self._queue) >= self.max_queue and not self._closed:
+                        self._not_full.wait()
+                    if self._closed:
+                        return False
+            self._queue.append(state)
+            self.counters["enqueued"] += 1
+            if len(self._queue) >= self.batch_size:
+                self._not_empty.notify()
+            return True
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far has been handed to the sink."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._flush_requested = True
+            self._not_empty.notify()
+            while self._queue or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._drained.wait(remaining)
+            return True
+
+    def close(self, timeout=None):
+        """Flush pending states and stop the worker thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+        self._thread.join(timeout)
+        atexit.unregister(self.close)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["queued"] = len(self._queue)
+            return stats
+
+    def _run(self):
+        while True:
+            with self._lock:
+                deadline = time.monotonic() + self.flush_interval
+                while (len(self._queue) < self.batch_size and not self._flush_requested
+                       and not self._closed):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._not_empty.wait(remaining)
+                if not self._queue:
+                    self._flush_requested = False
+                    self._drained.notify_all()
+                    if self._closed:
+                        return
+                    continue
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                self._in_flight = len(batch)
+                self._not_full.notify_all()
+            written, errors = self._write(batch)
+            with self._lock:
+                self.counters["written"] += written
+                self.counters["errors"] += errors
+                self.counters["failed"] += len(batch) - written
+                self._in_flight = 0
+                if not self._queue:
+                    self._flush_requested = False
+                    self._drained.notify_all()
+
+    def _write(self, batch):
+        """Hand ``batch`` to the sink, one state at a time if it fails. Returns (written, errors)."""
+        try:
+            self.sink(batch)
+            return len(batch), 0
+        except Exception:
+            logging.getLogger("debugonce").exception("Error writing a batch of %d captured states", len(batch))
+        if len(batch) == 1:
+            return 0, 1
+        written, errors = 0, 1
+        for state in batch:
+            try:
+                self.sink([state])
+                written += 1
+            except Exception:
+                errors += 1
+                logging.getLogger("debugonce").exception("Error writing captured state")
+        return written, errors
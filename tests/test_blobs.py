@@ -0,0 +1,76 @@
+import json
+import os
+from click.testing import CliRunner
+from debugonce_packages import blobs
+from debugonce_packages.cli import export, inspect
+
+
+def _state(*args, result=None, **kwargs):
+    return {"function": "f", "args": list(args), "kwargs": kwargs, "result": result}
+
+
+def test_large_values_are_stored_once_and_referenced(tmp_path):
+    blobs.configure_blobs(threshold=1024)
+    try:
+        payload = b"x" * 4096
+        first = blobs.externalize(_state(payload, 1, text="y" * 2048), str(tmp_path))
+        second = blobs.externalize(_state(payload), str(tmp_path))
+    finally:
+        blobs.configure_blobs()
+    ref = first["args"][0]
+    assert ref == {blobs.BLOB_KEY: ref[blobs.BLOB_KEY], "size": 4096, "kind": "bytes"}
+    assert second["args"][0] == ref
+    assert first["args"][1] == 1
+    assert first["kwargs"]["text"]["kind"] == "str"
+    stored = [name for _, _, names in os.walk(tmp_path / blobs.BLOB_DIR) for name in names]
+    assert len(stored) == 2
+
+
+def test_session_budget_truncates_values(tmp_path):
+    blobs.configure_blobs(threshold=1024, session_budget=3000)
+    try:
+        state = blobs.externalize(_state("a" * 2000, "b" * 2000, result=[1, 2]), str(tmp_path))
+    finally:
+        blobs.configure_blobs()
+    assert state["args"][0]["kind"] == "str"
+    assert state["args"][1][blobs.TRUNCATED_KEY] is True
+    assert state["args"][1]["size"] == 2000
+    assert state["result"] == [1, 2]
+
+
+def test_blob_refs_load_lazily(tmp_path):
+    blobs.configure_blobs(threshold=16)
+    try:
+        state = blobs.externalize(_state(b"\x00" * 64, result={"rows": list(range(20))}), str(tmp_path))
+    finally:
+        blobs.configure_blobs()
+    session_file = tmp_path / "session_1.json"
+    blobs.attach_blobs(state, str(session_file))
+    assert isinstance(state["args"][0], blobs.BlobRef)
+    view = state["args"][0].load()
+    assert isinstance(view, memoryview) and view.readonly
+    assert bytes(view) == b"\x00" * 64
+    assert state["result"].load() == {"rows": list(range(20))}
+
+
+def test_cli_inspects_and_exports_blob_arguments(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    blobs.configure_blobs(threshold=1024)
+    try:
+        state = blobs.externalize(_state("z" * 5000, 3), ".debugonce")
+    finally:
+        blobs.configure_blobs()
+    state["function_source"] = "def f(text, n):\n    return len(text) * n\n"
+    session_file = tmp_path / ".debugonce" / "session_1.json"
+    session_file.write_text(json.dumps(state))
+
+    runner = CliRunner()
+    result = runner.invoke(inspect, [str(session_file)])
+    assert result.exit_code == 0
+    assert "<blob str 5000 bytes sha256:" in result.output
+    assert "zzzz" not in result.output
+
+    result = runner.invoke(export, [str(session_file)])
+    assert result.exit_code == 0
+    script = (tmp_path / ".debugonce" / "session_1_replay.py").read_text()
+    assert "_load_blob(" in script and "zzzz" not in script
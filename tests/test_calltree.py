@@ -0,0 +1,86 @@
+import json
+from click.testing import CliRunner
+from debugonce_packages import calltree
+from debugonce_packages.cli import inspect
+from debugonce_packages.decorator import debugonce
+from debugonce_packages.storage import iter_session_files
+
+
+@debugonce
+def factorial(n):
+    return 1 if n <= 1 else n * factorial(n - 1)
+
+
+@debugonce
+def load(path):
+    with open(path) as f:
+        return f.read()
+
+
+@debugonce
+def check(value):
+    if value < 0:
+        raise ValueError("negative")
+    return value
+
+
+@debugonce
+def pipeline(path, values):
+    text = load(path)
+    checked = []
+    for value in values:
+        try:
+            checked.append(check(value))
+        except ValueError:
+            pass
+    return text, checked
+
+
+def _sessions():
+    sessions = []
+    for entry in iter_session_files(".debugonce"):
+        with open(entry.path) as f:
+            sessions.append(json.load(f))
+    return sessions
+
+
+def test_recursion_is_one_session_with_a_bounded_tree(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    calltree.configure_call_tree(max_depth=10)
+    try:
+        assert factorial(100) > 0
+    finally:
+        calltree.configure_call_tree()
+    session, = _sessions()
+    depth, frames = 0, session["call_tree"]
+    while frames:
+        frame, = frames
+        depth += 1
+        frames = frame.get("children")
+    assert depth == 10
+    assert session["call_tree"][0]["args"] == [99]
+    assert session["call_tree_dropped"] == 89
+
+
+def test_nested_frames_record_results_exceptions_and_io(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "input.txt").write_text("data")
+    calltree.configure_call_tree(max_children=3)
+    try:
+        assert pipeline("input.txt", [1, -2, 3, 4]) == ("data", [1, 3, 4])
+    finally:
+        calltree.configure_call_tree()
+    session, = _sessions()
+    frames = session["call_tree"]
+    assert [frame["function"] for frame in frames] == ["load", "check", "check"]
+    assert frames[0]["result"] == "data"
+    assert frames[0]["file_access"][0]["file"] == "input.txt"
+    assert "file_access" not in frames[1]
+    assert frames[2]["exception_type"] == "ValueError"
+    assert session["call_tree_dropped"] == 2
+    assert session["file_access"][0]["file"] == "input.txt"
+
+    result = CliRunner().invoke(inspect, [next(iter_session_files(".debugonce")).path])
+    assert result.exit_code == 0, result.output
+    assert "Call tree: 3 nested calls (2 more not recorded)" in result.output
+    assert "  check(-2,) raised ValueError: negative" in result.output
@@ -0,0 +1,99 @@
+import os
+from click.testing import CliRunner
+from debugonce_packages.catalog import SessionCatalog, parse_time, session_row
+from debugonce_packages.cli import cli
+from debugonce_packages.storage import StorageManager
+
+
+def _session(function, exception_type=None, timestamp="2025-05-20T17:55:08"):
+    return {
+        "function": function,
+        "module": "app.views",
+        "args": [],
+        "kwargs": {},
+        "exception": f"{exception_type} happened" if exception_type else None,
+        "exception_type": exception_type,
+        "timestamp": timestamp,
+        "duration_ms": 1.5,
+    }
+
+
+def test_catalog_tracks_saves_and_deletes(tmp_path):
+    storage = StorageManager(str(tmp_path / ".debugonce"))
+    storage.save_session("session_1", _session("divide", "ZeroDivisionError"))
+    storage.save_session("session_2", _session("fetch", "KeyError", "2025-05-21T10:00:00"))
+    storage.save_session("session_3", _session("fetch"))
+    catalog = storage.catalog
+    assert catalog.count() == 3
+    assert [r["session_id"] for r in catalog.query(function="fetch")] == ["session_2", "session_3"]
+    assert [r["session_id"] for r in catalog.query(exception="ZeroDivision")] == ["session_1"]
+    assert [r["session_id"] for r in catalog.query(since=parse_time("2025-05-21T00:00:00"))] == ["session_2"]
+    row = catalog.query(exception="KeyError")[0]
+    assert row["size"] == os.path.getsize(tmp_path / ".debugonce" / "session_2.json")
+    storage.delete_session("session_1")
+    assert catalog.count() == 2
+
+
+def test_running_totals_follow_every_change(tmp_path):
+    catalog = SessionCatalog(str(tmp_path))
+
+    def scanned():
+        return catalog._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions").fetchone()
+
+    catalog.add_many([session_row(f"session_{i}", _session("f"), 100 + i, "x") for i in range(4)])
+    catalog.add_many([session_row("session_0", _session("f"), 500, "x")])  # replaces a row
+    assert catalog.totals() == scanned() == (4, 500 + 101 + 102 + 103)
+    catalog.set_sizes([("session_1", 1), ("session_missing", 7)])
+    catalog.remove_many(["session_2", "session_missing"])
+    assert catalog.totals() == scanned() == (3, 500 + 1 + 103)
+    assert catalog.count(function="f") == 3 and catalog.count(function="g") == 0
+    catalog.close()
+    catalog = SessionCatalog(str(tmp_path))
+    catalog._conn.execute("DROP TABLE totals")  # a catalog from before the running totals
+    catalog.close()
+    catalog = SessionCatalog(str(tmp_path))
+    assert catalog.totals() == (3, 604)
+    catalog.clear()
+    assert catalog.totals() == (0, 0)
+    catalog.close()
+
+
+def test_reindex_rebuilds_catalog(tmp_path):
+    storage = StorageManager(str(tmp_path / ".debugonce"))
+    storage.save_session("session_1", _session("divide", "ZeroDivisionError"))
+    storage.catalog.clear()
+    assert storage.reindex() == 1
+    assert SessionCatalog(str(tmp_path / ".debugonce")).query()[0]["function"] == "divide"
+
+
+def test_cli_list_and_query_filters(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage = StorageManager(".debugonce")
+    storage.save_session("session_1", _session("divide", "ZeroDivisionError"))
+    storage.save_session("session_2", _session("fetch", "KeyError"))
+    runner = CliRunner()
+    result = runner.invoke(cli, ["list", "--function", "divide"])
+    assert result.exit_code == 0
+    assert "- session_1.json" in result.output
+    assert "session_2" not in result.output
+    result = runner.invoke(cli, ["query", "--exception", "KeyError"])
+    assert result.exit_code == 0
+    assert "fetch  KeyError" in result.output
+    result = runner.invoke(cli, ["reindex"])
+    assert "Indexed 2 sessions." in result.output
+
+
+def test_cli_list_pages_through_sessions(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage = StorageManager(".debugonce")
+    for i in range(5):
+        storage.save_session(f"session_{i}", _session("divide", timestamp=f"2025-05-2{i}T00:00:00"))
+    runner = CliRunner()
+    result = runner.invoke(cli, ["list", "--limit", "2"])
+    assert result.exit_code == 0
+    assert [line for line in result.output.splitlines() if line.startswith("- ")] == [
+        "- session_4.json", "- session_3.json"]
+    assert "--page 2" in result.output
+    result = runner.invoke(cli, ["list", "--limit", "2", "--page", "3"])
+    assert [line for line in result.output.splitlines() if line.startswith("- ")] == ["- session_0.json"]
+    assert "next page" not in result.output
@@ -0,0 +1,163 @@
+import os
+import threading
+import hashlib
+from debugonce_packages import decorator, exporter
+from debugonce_packages.blobs import blob_path, configure_blobs
+from debugonce_packages.collector import SESSION, Collector, CollectorClient, FrameReader, frame
+from debugonce_packages.decorator import debugonce
+from debugonce_packages.storage import StorageManager, iter_session_files
+
+
+@debugonce
+def square(x):
+    return x * x
+
+
+@debugonce
+def echo(value):
+    return value
+
+
+def test_frame_reader_reassembles_split_frames():
+    stream = frame(SESSION, b"a\n{}") + frame(SESSION, b"b\n" + b"x" * 1000)
+    reader = FrameReader()
+    frames = []
+    for i in range(0, len(stream), 7):
+        frames.extend(reader.feed(stream[i:i + 7]))
+    assert frames == [(SESSION, b"a\n{}"), (SESSION, b"b\n" + b"x" * 1000)]
+    assert not reader.buffer
+
+
+def test_workers_send_captures_to_the_collector(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage = StorageManager(str(tmp_path / "central"))
+    collector = Collector(storage, str(tmp_path / "collector.sock"), batch_size=4, flush_interval=0.05)
+    collector.listen()
+    thread = threading.Thread(target=collector.serve_forever)
+    thread.start()
+    try:
+        client = decorator.enable_collector(str(tmp_path / "collector.sock"))
+        for i in range(3):
+            square(i)
+        pids = []
+        for worker in range(2):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    for i in range(5):
+                        square(i)
+                    decorator.disable_collector()
+                finally:
+                    os._exit(0)
+            pids.append(pid)
+        for pid in pids:
+            os.waitpid(pid, 0)
+        decorator.disable_collector()
+    finally:
+        collector.stop()
+        thread.join(10)
+    assert client.counters["sent"] == 3
+    assert collector.counters["sessions"] == 13
+    assert collector.counters["environments"] == 1
+    assert len(list(iter_session_files(str(tmp_path / "central")))) == 13
+    assert len(os.listdir(tmp_path / "central" / "env")) == 1
+    assert storage.catalog.count() == 13
+    assert not os.path.exists(tmp_path / ".debugonce" / "sessions")
+    assert not os.path.exists(tmp_path / "collector.sock")
+
+
+def test_captures_are_written_locally_without_a_collector(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    client = decorator.enable_collector(str(tmp_path / "missing.sock"))
+    try:
+        square(3)
+        square(4)
+    finally:
+        decorator.disable_collector()
+    assert client.counters == {"sent": 0, "fallback": 2, "connects": 0}
+    assert len(list(iter_session_files(".debugonce"))) == 2
+
+
+class _BrokenSocket:
+    """Takes part of the first frame, then fails like a collector that went away."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def send(self, data):
+        self.calls += 1
+        if self.calls == 1:
+            return len(data) // 2
+        raise ConnectionResetError()
+
+    def close(self):
+        pass
+
+
+def test_partly_sent_captures_fall_back_to_local_writes(tmp_path):
+    written = []
+    client = CollectorClient(str(tmp_path / "collector.sock"), fallback=written.extend)
+    client._sock, client._pid, client.storage_dir = _BrokenSocket(), os.getpid(), str(tmp_path)
+    try:
+        assert client.submit("session_1", {"function": "square"}, lambda state, storage_dir, blobs: None)
+        assert written == []
+        assert not client.submit("session_2", {"function": "square"}, lambda state, storage_dir, blobs: None)
+        assert written == [("session_1", {"function": "square"}, [])]
+        assert client.counters == {"sent": 0, "fallback": 2, "connects": 0}
+    finally:
+        client.close()
+
+
+class _ResetSocket:
+    def send(self, data):
+        raise ConnectionResetError()
+
+    def close(self):
+        pass
+
+
+def test_blobs_go_with_captures_written_locally(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    client = decorator.enable_collector(str(tmp_path / "collector.sock"))
+    client._sock, client._pid, client.storage_dir = _ResetSocket(), os.getpid(), str(tmp_path / "central")
+    configure_blobs(threshold=1024)
+    try:
+        echo("x" * 5000)
+    finally:
+        configure_blobs()
+        decorator.disable_collector()
+    assert client.counters["fallback"] == 1
+    digest = hashlib.sha256(b"x" * 5000).hexdigest()
+    assert os.path.exists(blob_path(".debugonce", digest))
+    entry, = iter_session_files(".debugonce")
+    summary = exporter.export_sessions([entry.path], workers=1)
+    assert (summary["written"], summary["failed"]) == (1, 0), summary["errors"]
+
+
+class _FlakyStorage:
+    def __init__(self, failures):
+        self.storage_dir = "."
+        self.failures = failures
+        self.saved = []
+
+    def save_sessions(self, sessions):
+        if self.failures:
+            self.failures -= 1
+            raise IOError("disk full")
+        self.saved.extend(session_id for session_id, _ in sessions)
+
+
+def test_collector_keeps_batches_it_failed_to_store():
+    storage = _FlakyStorage(failures=1)
+    collector = Collector(storage, max_backlog=3)
+    collector._handle([(SESSION, f"session_{i}\n{{}}".encode()) for i in range(2)])
+    assert not collector.flush()
+    collector._handle([(SESSION, f"session_{i}\n{{}}".encode()) for i in range(2, 4)])
+    assert collector.flush()
+    assert storage.saved == ["session_0", "session_1", "session_2", "session_3"]
+    assert collector.counters["errors"] == 1 and collector.counters["dropped"] == 0
+
+    storage.failures = 1
+    collector._handle([(SESSION, f"session_{i}\n{{}}".encode()) for i in range(4, 8)])
+    assert not collector.flush()
+    assert collector.counters["dropped"] == 1
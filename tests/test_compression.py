@@ -0,0 +1,103 @@
+import io
+import json
+import os
+import pytest
+import zlib
+from click.testing import CliRunner
+from debugonce_packages import compression
+from debugonce_packages.catalog import SessionCatalog
+from debugonce_packages.cli import cli
+from debugonce_packages.compression import HEADER, MAGIC, is_compressed, read_stream
+from debugonce_packages.storage import StorageManager, iter_session_files, load_session_ref
+
+
+def _session(i):
+    return {
+        "function": "process_order",
+        "module": "shop.orders",
+        "args": [i, [{"sku": f"SKU-{i * 7919 % 10000}", "qty": i % 5}]],
+        "kwargs": {},
+        "result": i * 3,
+        "exception": None,
+        "exception_type": None,
+        "timestamp": f"2024-05-01T12:00:{i % 60:02d}",
+        "python_version": "3.11.7 (main, Oct  2 2025, 21:14:28) [GCC 12.2.0]",
+        "function_source": "def process_order(order_id, items):\n    return sum(item['qty'] for item in items)\n" * 4,
+        "imports": ["import json", "from shop import models", "from shop.pricing import total"],
+        "file_access": [],
+        "http_requests": [],
+    }
+
+
+def _raw_sizes(storage_dir):
+    return sum(entry.stat().st_size for entry in iter_session_files(storage_dir))
+
+
+def test_compressed_files_round_trip_and_train_a_dictionary(tmp_path, monkeypatch):
+    monkeypatch.setattr(compression, "TRAIN_SAMPLES", 8)
+    storage = StorageManager(str(tmp_path / "store"), compression="zlib")
+    for i in range(20):
+        storage.save_session(f"session_{i}", _session(i))
+    assert os.listdir(tmp_path / "store" / "dicts")
+    for i in (0, 19):
+        path = tmp_path / "store" / f"session_{i}.json"
+        assert is_compressed(path.read_bytes())
+        assert storage.load_session(f"session_{i}") == _session(i)
+        data, _ = load_session_ref(str(path))
+        assert data == _session(i)
+    # Sessions written after training use the dictionary and are much smaller.
+    early = (tmp_path / "store" / "session_0.json").stat().st_size
+    late = (tmp_path / "store" / "session_19.json").stat().st_size
+    assert late * 2 < early
+
+
+def test_plain_and_compressed_sessions_mix(tmp_path):
+    store = str(tmp_path / "store")
+    StorageManager(store).save_session("session_plain", _session(1))
+    StorageManager(store, compression="zlib").save_session("session_packed", _session(2))
+    reader = StorageManager(store)
+    assert reader.load_session("session_plain") == _session(1)
+    assert reader.load_session("session_packed") == _session(2)
+    assert reader.reindex() == 2
+
+
+def test_segment_log_payloads_are_compressed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage = StorageManager(".debugonce", backend="segments", compression="zlib")
+    storage.save_sessions([(f"session_{i}", _session(i)) for i in range(5)])
+    assert is_compressed(storage.segments.read_bytes("session_3"))
+    assert storage.load_session("session_3") == _session(3)
+    result = CliRunner().invoke(cli, ["inspect", "session_3"])
+    assert result.exit_code == 0
+    assert "process_order" in result.output
+
+
+def test_compact_recompresses_existing_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage = StorageManager(".debugonce")
+    storage.save_sessions([(f"session_{i}", _session(i)) for i in range(100)])
+    before = _raw_sizes(".debugonce")
+    result = CliRunner().invoke(cli, ["compact"])
+    assert result.exit_code == 0, result.output
+    assert "Recompressed 100 session files" in result.output
+    after = _raw_sizes(".debugonce")
+    assert after * 10 < before
+    assert StorageManager(".debugonce").load_session("session_42") == _session(42)
+    catalog = SessionCatalog(".debugonce")
+    try:
+        assert catalog.totals()[1] == after
+    finally:
+        catalog.close()
+
+
+def test_unknown_version_and_truncation_are_errors():
+    body = json.dumps(_session(1)).encode()
+    packed = HEADER.pack(MAGIC, compression.VERSION, compression.NO_DICTIONARY) + zlib.compress(body)
+    assert read_stream(io.BytesIO(packed), lambda name: None) == body
+    with pytest.raises(ValueError):
+        read_stream(io.BytesIO(packed[:-10]), lambda name: None)
+    with pytest.raises(ValueError):
+        read_stream(io.BytesIO(MAGIC + bytes([99]) + packed[4:]), lambda name: None)
+    missing = HEADER.pack(MAGIC, compression.VERSION, b"\x01" * 8) + b"x"
+    with pytest.raises(FileNotFoundError):
+        read_stream(io.BytesIO(missing), lambda name: None)
@@ -1,11 +1,12 @@
 import unittest
 from debugonce_packages.decorator import debugonce
 from debugonce_packages.tracking_context import TrackingContext
-import json
 import os, io
+import shutil
 import requests
 from requests import sessions
 import unittest.mock
+from tests.utils_for_tests import load_session
 
 class TestDebugOnceDecorator(unittest.TestCase):
     def setUp(self):
@@ -16,11 +17,9 @@ class TestDebugOnceDecorator(unittest.TestCase):
 
     def tearDown(self):
         """Clean up the test environment."""
-        # Remove all files in the .debugonce directory
+        # Remove the .debugonce directory, including shared snapshot stores
         if os.path.exists(self.debugonce_dir):
-            for file in os.listdir(self.debugonce_dir):
-                os.remove(os.path.join(self.debugonce_dir, file))
-            os.rmdir(self.debugonce_dir)
+            shutil.rmtree(self.debugonce_dir)
 
     def test_capture_state(self):
         """Test capturing state with no exception."""
@@ -31,18 +30,8 @@ class TestDebugOnceDecorator(unittest.TestCase):
         result = add(2, 3)
         self.assertEqual(result, 5)
 
-        # Check if the state is saved to a file
-        session_files = os.listdir(self.debugonce_dir)
-        self.assertTrue(len(session_files) > 0)
-
         # Load the state from the file for 'add'
-        state = None
-        for fname in session_files:
-            with open(os.path.join(self.debugonce_dir, fname), "r") as f:
-                s = json.load(f)
-                if s.get("function") == "add":
-                    state = s
-                    break
+        state = load_session(self.debugonce_dir, "add")
         self.assertIsNotNone(state)
         # Check if the state is correct
         self.assertEqual(state["function"], "add")
@@ -60,13 +49,9 @@ class TestDebugOnceDecorator(unittest.TestCase):
         with self.assertRaises(ZeroDivisionError):
             divide(2, 0)
 
-        # Check if the state is saved to a file
-        session_files = os.listdir(self.debugonce_dir)
-        self.assertTrue(len(session_files) > 0)
-
         # Load the state from the file
-        with open(os.path.join(self.debugonce_dir, session_files[0]), "r") as f:
-            state = json.load(f)
+        state = load_session(self.debugonce_dir, "divide")
+        self.assertIsNotNone(state)
 
         # Check if the state is correct
         self.assertEqual(state["function"], "divide")
@@ -89,13 +74,9 @@ class TestDebugOnceDecorator(unittest.TestCase):
         result = file_operations()
         self.assertEqual(result, "Hello, DebugOnce!")
 
-        # Check if the state is saved to a file
-        session_files = os.listdir(self.debugonce_dir)
-        self.assertTrue(len(session_files) > 0)
-
         # Load the state from the file
-        with open(os.path.join(self.debugonce_dir, session_files[0]), "r") as f:
-            state = json.load(f)
+        state = load_session(self.debugonce_dir, "file_operations")
+        self.assertIsNotNone(state)
 
         # Verify file access tracking
         file_access = state.get("file_access", [])
@@ -124,17 +105,8 @@ class TestDebugOnceDecorator(unittest.TestCase):
                 return response.status_code
             result = make_request()
             self.assertEqual(result, 200)
-            # Check if the state is saved to a file
-            session_files = os.listdir(self.debugonce_dir)
-            self.assertTrue(len(session_files) > 0)
             # Load the state from the file for 'make_request'
-            state = None
-            for fname in session_files:
-                with open(os.path.join(self.debugonce_dir, fname), "r") as f:
-                    s = json.load(f)
-                    if s.get("function") == "make_request":
-                        state = s
-                        break
+            state = load_session(self.debugonce_dir, "make_request")
             self.assertIsNotNone(state)
             # Verify HTTP request tracking
             http_requests = state.get("http_requests", [])
@@ -187,3 +159,145 @@ class TestDebugOnceDecorator(unittest.TestCase):
             self.assertEqual(http_requests[0]["url"], "https://www.example.com/")
             self.assertEqual(http_requests[0]["method"].lower(), "get")
             self.assertEqual(http_requests[0]["status_code"], 200)
+
+    def test_concurrent_captures_keep_io_logs_separate(self):
+        """Each thread's capture only sees the files that thread opened."""
+        import threading
+        from debugonce_packages import decorator
+        captured = []
+        lock = threading.Lock()
+
+        def fake_capture_state(func, args, kwargs, **kw):
+            with lock:
+                captured.append((args[0], kw["file_access_log"]))
+
+        @debugonce
+        def touch(index):
+            path = os.path.join(self.debugonce_dir, f"thread_{index}.txt")
+            with open(path, "w") as f:
+                f.write(str(index))
+            with open(path, "r") as f:
+                return f.read()
+
+        barrier = threading.Barrier(64)
+
+        def worker(index):
+            barrier.wait()
+            touch(index)
+
+        with unittest.mock.patch.object(decorator, "capture_state", new=fake_capture_state):
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(64)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        self.assertEqual(len(captured), 64)
+        for index, file_access in captured:
+            self.assertEqual([entry["operation"] for entry in file_access], ["write", "read"])
+            for entry in file_access:
+                self.assertTrue(entry["file"].endswith(f"thread_{index}.txt"))
+
+    def test_async_writer_writes_sessions_off_thread(self):
+        """Captures queued on the background writer land on disk after a flush."""
+        from debugonce_packages.decorator import enable_async_writer, disable_async_writer
+
+        @debugonce
+        def multiply(a, b):
+            return a * b
+
+        writer = enable_async_writer(flush_interval=60)
+        try:
+            self.assertEqual(multiply(3, 4), 12)
+            self.assertTrue(writer.flush(timeout=5))
+            self.assertEqual(writer.stats()["written"], 1)
+        finally:
+            disable_async_writer()
+        state = load_session(self.debugonce_dir, "multiply")
+        self.assertIsNotNone(state)
+        self.assertEqual(state["result"], 12)
+
+    def test_async_writer_captures_arguments_as_they_were(self):
+        """Arguments mutated after the call returns are stored as they were at capture time."""
+        from debugonce_packages.decorator import enable_async_writer, disable_async_writer
+
+        @debugonce
+        def total(items):
+            return sum(items)
+
+        writer = enable_async_writer(flush_interval=60)
+        try:
+            items = [1, 2, 3]
+            self.assertEqual(total(items), 6)
+            items.append(4)
+            self.assertTrue(writer.flush(timeout=5))
+        finally:
+            disable_async_writer()
+        state = load_session(self.debugonce_dir, "total")
+        self.assertEqual(state["args"], [[1, 2, 3]])
+
+    def test_async_writer_stores_blobs_off_the_calling_thread(self):
+        """Large values are hashed by the caller and written to the blob store by the writer thread."""
+        import threading
+        from debugonce_packages import blobs
+        from debugonce_packages.decorator import enable_async_writer, disable_async_writer
+
+        @debugonce
+        def measure(text):
+            return len(text)
+
+        threads = []
+        real_write_atomic = blobs.write_atomic
+
+        def write_atomic(path, body):
+            threads.append(threading.current_thread())
+            real_write_atomic(path, body)
+
+        blobs.configure_blobs(threshold=1024)
+        writer = enable_async_writer(flush_interval=60)
+        try:
+            with unittest.mock.patch.object(blobs, "write_atomic", write_atomic):
+                self.assertEqual(measure("x" * 5000), 5000)
+                self.assertEqual(threads, [])
+                self.assertTrue(writer.flush(timeout=5))
+        finally:
+            disable_async_writer()
+            blobs.configure_blobs()
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+        state = load_session(self.debugonce_dir, "measure")
+        digest = state["args"][0][blobs.BLOB_KEY]
+        self.assertTrue(os.path.exists(blobs.blob_path(self.debugonce_dir, digest)))
+
+    def test_environment_stored_once_by_reference(self):
+        """Sessions reference a shared environment snapshot instead of embedding it."""
+        @debugonce
+        def identity(x):
+            return x
+
+        identity(1)
+        identity(2)
+        state = load_session(self.debugonce_dir, "identity")
+        self.assertNotIn("environment_variables", state)
+        env_dir = os.path.join(self.debugonce_dir, "env")
+        self.assertEqual(os.listdir(env_dir), [state["environment_ref"] + ".json"])
+
+    def test_concurrent_captures_are_all_saved(self):
+        """Captures in the same second get distinct ids and sharded, complete files."""
+        import threading
+        from tests.utils_for_tests import load_sessions
+
+        @debugonce
+        def square(x):
+            return x * x
+
+        threads = [threading.Thread(target=square, args=(i,)) for i in range(32)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        results = sorted(s["result"] for s in load_sessions(self.debugonce_dir) if s["function"] == "square")
+        self.assertEqual(results, sorted(i * i for i in range(32)))
+        self.assertTrue(os.path.isdir(os.path.join(self.debugonce_dir, "sessions")))
+        for root, _, files in os.walk(self.debugonce_dir):
+            self.assertFalse([f for f in files if f.endswith(".tmp")])
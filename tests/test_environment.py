@@ -0,0 +1,71 @@
+import json
+from click.testing import CliRunner
+from debugonce_packages import environment
+from debugonce_packages.cli import export, inspect
+
+
+def test_snapshot_is_stable_until_environment_changes(monkeypatch):
+    environment.configure_environment()
+    first = environment.snapshot_environment()
+    assert environment.snapshot_environment() == first
+    monkeypatch.setenv("DEBUGONCE_TEST_VAR", "changed")
+    second = environment.snapshot_environment()
+    assert second != first
+    monkeypatch.delenv("DEBUGONCE_TEST_VAR")
+    assert environment.snapshot_environment() == first
+
+
+def test_redaction_applies_allow_and_deny(monkeypatch):
+    monkeypatch.setenv("DEBUGONCE_API_TOKEN", "secret")
+    monkeypatch.setenv("DEBUGONCE_MODE", "debug")
+    environment.configure_environment(allow=["DEBUGONCE_*"], deny=["*token*"])
+    try:
+        digest = environment.snapshot_environment()
+        env = environment._snapshots[digest]
+        assert env == {"DEBUGONCE_API_TOKEN": environment.REDACTED, "DEBUGONCE_MODE": "debug"}
+    finally:
+        environment.configure_environment()
+
+
+def test_unwritten_snapshots_survive_eviction(tmp_path, monkeypatch, caplog):
+    environment.configure_environment(allow=["DEBUGONCE_*"])
+    try:
+        monkeypatch.setenv("DEBUGONCE_STEP", "first")
+        first = environment.snapshot_environment()
+        environment.persist_environment(str(tmp_path / "a"), first)
+        monkeypatch.setenv("DEBUGONCE_STEP", "second")
+        second = environment.snapshot_environment()
+        for step in range(environment.MAX_SNAPSHOTS):
+            monkeypatch.setenv("DEBUGONCE_STEP", str(step))
+            environment.snapshot_environment()
+    finally:
+        environment.configure_environment()
+    environment.persist_environment(str(tmp_path / "b"), second)
+    with open(tmp_path / "b" / environment.ENV_DIR / f"{second}.json") as f:
+        assert json.load(f) == {"DEBUGONCE_STEP": "second"}
+    environment.persist_environment(str(tmp_path / "b"), first)  # written once, then evicted
+    assert not (tmp_path / "b" / environment.ENV_DIR / f"{first}.json").exists()
+    assert "is not in memory" in caplog.text
+
+
+def test_cli_resolves_environment_reference(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("DEBUGONCE_MODE", "replay")
+    environment.configure_environment(allow=["DEBUGONCE_MODE"])
+    try:
+        digest = environment.snapshot_environment()
+        environment.persist_environment(".debugonce", digest)
+    finally:
+        environment.configure_environment()
+    session_file = tmp_path / ".debugonce" / "session_1.json"
+    session_file.write_text(json.dumps({"function": "f", "args": [1], "kwargs": {}, "environment_ref": digest}))
+
+    runner = CliRunner()
+    result = runner.invoke(inspect, [str(session_file)])
+    assert result.exit_code == 0
+    assert "Environment: 1 variables" in result.output
+
+    result = runner.invoke(export, [str(session_file)])
+    assert result.exit_code == 0
+    script = (tmp_path / ".debugonce" / "session_1_replay.py").read_text()
+    assert 'os.environ["DEBUGONCE_MODE"] = "replay"' in script
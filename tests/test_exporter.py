@@ -0,0 +1,64 @@
+import json
+import os
+from click.testing import CliRunner
+from debugonce_packages import exporter
+from debugonce_packages.cli import export
+from debugonce_packages.storage import StorageManager
+
+
+def _store_sessions(count):
+    storage = StorageManager(".debugonce")
+    storage.save_sessions([
+        (f"session_{i}", {"function": "double", "args": [i], "kwargs": {},
+                          "function_source": "def double(x):\n    return 2 * x\n",
+                          "timestamp": "2025-05-20T17:55:08"})
+        for i in range(count)
+    ])
+    storage.catalog.close()
+
+
+def test_build_script_strips_decorator_and_records_digest():
+    script = exporter.build_script({
+        "function": "f",
+        "args": [1, "a"],
+        "function_source": "@debugonce\ndef f(x, y):\n    return x\n",
+    }, digest="abc")
+    lines = script.splitlines()
+    assert lines[1] == "# debugonce-session: abc"
+    assert "@debugonce" not in script
+    assert "        result = f(1, 'a')" in lines
+
+
+def test_export_all_skips_up_to_date_scripts(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _store_sessions(40)
+    runner = CliRunner()
+
+    result = runner.invoke(export, ["--all", "--workers", "2"])
+    assert result.exit_code == 0, result.output
+    assert "Exported 40 sessions (40 written, 0 unchanged, 0 failed)" in result.output
+    script = tmp_path / ".debugonce" / "session_7_replay.py"
+    assert "result = double(7)" in script.read_text()
+
+    result = runner.invoke(export, ["--glob", ".debugonce/session_*.json"])
+    assert "(0 written, 40 unchanged, 0 failed)" in result.output
+
+    (tmp_path / ".debugonce" / "session_7.json").write_text(json.dumps({"function": "double", "args": [70]}))
+    result = runner.invoke(export, ["--function", "double", "--workers", "1"])
+    assert "(1 written, 39 unchanged, 0 failed)" in result.output
+    assert "result = double(70)" in script.read_text()
+
+
+def test_export_sessions_reports_failures(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _store_sessions(2)
+    (tmp_path / ".debugonce" / "session_bad.json").write_text(json.dumps({"args": []}))
+    seen = []
+    summary = exporter.export_sessions(
+        [".debugonce/session_0.json", ".debugonce/session_bad.json", "session_missing"],
+        workers=1, progress=seen.append,
+    )
+    assert (summary["written"], summary["failed"]) == (1, 2)
+    assert len(seen) == 3
+    assert "Missing function name" in dict(summary["errors"])[".debugonce/session_bad.json"]
+    assert os.path.exists(".debugonce/session_0_replay.py")
@@ -0,0 +1,79 @@
+import os
+from debugonce_packages import hooks
+from debugonce_packages.hooks import IOLog
+
+
+def _track(func, max_events=1000):
+    hooks.configure_file_tracking(max_events=max_events)
+    try:
+        log = IOLog()
+        hooks.install()
+        token = hooks.activate(log)
+        try:
+            func()
+        finally:
+            hooks.deactivate(token)
+        log.files.finish()
+    finally:
+        hooks.configure_file_tracking()
+    return log
+
+
+def test_repeated_opens_are_aggregated(tmp_path):
+    path = str(tmp_path / "data.txt")
+    with open(path, "w") as f:
+        f.write("x" * 100)
+
+    def work():
+        for _ in range(50):
+            with open(path) as f:
+                f.read()
+        with open(path, "a") as f:
+            f.write("y" * 20)
+
+    entries = _track(work).file_access_log
+    assert [(e["file"], e["operation"], e["count"]) for e in entries] == [(path, "read", 50), (path, "write", 1)]
+    read, write = entries
+    assert read["size_at_open"] == 50 * 100 and "growth" not in read
+    assert write["growth"] == 20 and "size_at_open" not in write
+    assert 0 <= read["first_ns"] <= read["last_ns"] <= write["first_ns"]
+
+
+def test_event_ring_keeps_latest_events_and_counts_overflow(tmp_path):
+    paths = [str(tmp_path / f"{i}.txt") for i in range(5)]
+
+    def work():
+        for path in paths:
+            with open(path, "w"):
+                pass
+
+    events = _track(work, max_events=3).files.events()
+    assert events["overflow"] == 2
+    assert [events["paths"][i] for i in events["path"]] == paths[2:]
+    assert events["operation"] == ["write"] * 3
+    assert events["time_ns"] == sorted(events["time_ns"])
+
+
+def test_failed_opens_are_recorded_and_events_can_be_disabled(tmp_path):
+    missing = str(tmp_path / "missing.txt")
+
+    def work():
+        try:
+            open(missing)
+        except FileNotFoundError:
+            pass
+
+    log = _track(work, max_events=0)
+    assert log.file_access_log[0]["file"] == missing
+    assert log.file_access_log[0]["size_at_open"] == 0
+    assert log.files.events() is None
+
+
+def test_nested_logs_share_file_events(tmp_path):
+    path = os.fspath(tmp_path / "nested.txt")
+    outer = IOLog()
+    inner = IOLog()
+    inner.parent = outer
+    inner.record_file(tmp_path / "nested.txt", "w")
+    assert outer.file_access_log[0]["file"] == path
+    assert inner.file_access_log[0]["operation"] == "write"
@@ -0,0 +1,122 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import requests
+from debugonce_packages import hooks
+from debugonce_packages.decorator import debugonce
+from debugonce_packages.exporter import LATENCY_ENV, export_session
+from debugonce_packages.http_replay import serve_recorded, stop_serving
+from debugonce_packages.storage import iter_session_files
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps({"path": self.path}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("X-Served-By", "origin")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@debugonce
+def fetch_stream(base):
+    import requests
+    response = requests.get(f"{base}/stream", stream=True)
+    return b"".join(response.iter_content(4)).decode()
+
+
+@debugonce
+def fetch_item(base, item):
+    import requests
+    response = requests.get(f"{base}/items", params={"id": item})
+    return response.json()["path"] + " " + response.headers["X-Served-By"]
+
+
+def test_recorded_responses_are_served_offline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server = HTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    hooks.configure_http_recording()
+    try:
+        assert fetch_item(base, 7) == "/items?id=7 origin"
+    finally:
+        hooks.configure_http_recording(enabled=False)
+        server.shutdown()
+        server.server_close()
+
+    session_file, = [entry.path for entry in iter_session_files(".debugonce")]
+    with open(session_file) as f:
+        request = json.load(f)["http_requests"][0]
+    assert request["url"] == f"{base}/items?id=7"
+    assert request["elapsed_ms"] > 0
+    assert request["response"]["status_code"] == 200
+    assert request["response"]["body"]["kind"] == "bytes"
+
+    script, _ = export_session(session_file)
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path), LATENCY_ENV: "1"}
+    proc = subprocess.run([sys.executable, script], capture_output=True, text=True, env=env, timeout=60)
+    assert proc.returncode == 0, proc.stderr
+    assert "Function returned: /items?id=7 origin" in proc.stdout
+
+
+def test_unrecorded_requests_fail_and_repeats_reuse_the_last_response():
+    recordings = [
+        {"method": "GET", "url": "http://example.invalid/a", "elapsed_ms": 1.5,
+         "response": {"status_code": 500, "headers": {}, "body": b"first"}},
+        {"method": "GET", "url": "http://example.invalid/a", "elapsed_ms": 2.5,
+         "response": {"status_code": 200, "headers": {"Content-Type": "text/plain"}, "body": b"second"}},
+    ]
+    adapter = serve_recorded(recordings)
+    try:
+        bodies = [requests.get("http://example.invalid/a").content for _ in range(3)]
+        try:
+            requests.get("http://example.invalid/b")
+        except requests.ConnectionError as e:
+            assert "No recorded response" in str(e)
+        else:
+            raise AssertionError("unrecorded request was served")
+    finally:
+        stop_serving()
+    assert bodies == [b"first", b"second", b"second"]
+    assert [served["recorded_ms"] for served in adapter.served] == [1.5, 2.5, 2.5]
+
+
+def test_streamed_responses_are_left_to_the_caller(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server = HTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    hooks.configure_http_recording()
+    try:
+        assert fetch_stream(f"http://127.0.0.1:{server.server_port}") == '{"path": "/stream"}'
+    finally:
+        hooks.configure_http_recording(enabled=False)
+        server.shutdown()
+        server.server_close()
+    session_file, = [entry.path for entry in iter_session_files(".debugonce")]
+    with open(session_file) as f:
+        response = json.load(f)["http_requests"][0]["response"]
+    assert response["streamed"] and response["truncated"] and response["body"] is None
+
+
+def test_incomplete_recordings_are_not_served():
+    recordings = [{"method": "GET", "url": "http://example.invalid/big", "elapsed_ms": 1.0,
+                   "response": {"status_code": 200, "headers": {}, "body": b"par", "size": 10, "truncated": True}}]
+    serve_recorded(recordings)
+    try:
+        requests.get("http://example.invalid/big")
+    except requests.ConnectionError as e:
+        assert "incomplete" in str(e)
+    else:
+        raise AssertionError("truncated response was served")
+    finally:
+        stop_serving()
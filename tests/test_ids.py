@@ -0,0 +1,50 @@
+import os
+import threading
+from debugonce_packages import ids
+
+
+def test_ids_are_unique_and_monotonic_across_threads():
+    minted = []
+    lock = threading.Lock()
+
+    def worker():
+        local = [ids.new_session_id() for _ in range(2000)]
+        assert local == sorted(local)
+        with lock:
+            minted.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(minted)) == len(minted)
+    assert all(ids.is_session_id(session_id) for session_id in minted)
+
+
+def test_id_encodes_time_and_shard():
+    session_id = ids.new_session_id()
+    later = ids.new_session_id()
+    assert later > session_id
+    assert abs(ids.timestamp_of(session_id) - __import__("time").time()) < 5
+    body = session_id[len(ids.PREFIX):]
+    assert ids.shard_of(session_id) == os.path.join(body[:5], body[5:7])
+
+
+def test_forked_process_gets_new_process_component():
+    import os
+    import pytest
+    if not hasattr(os, "fork"):
+        pytest.skip("requires fork()")
+    parent = ids.new_session_id()
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.write(write_fd, ids.new_session_id().encode())
+        os._exit(0)
+    os.close(write_fd)
+    child = os.read(read_fd, 100).decode()
+    os.waitpid(pid, 0)
+    process = slice(len(ids.PREFIX) + 10, len(ids.PREFIX) + 18)
+    assert ids.is_session_id(child)
+    assert child[process] != parent[process]
@@ -0,0 +1,106 @@
+import io
+import json
+import pytest
+from click.testing import CliRunner
+from debugonce_packages import storage
+from debugonce_packages.catalog import SessionCatalog
+from debugonce_packages.cli import cli
+from debugonce_packages.layout import copy_section, encode_session, parse_session, read_header, read_sections
+from debugonce_packages.storage import (
+    StorageManager, iter_session_files, load_session_sections, open_session_file, session_path,
+)
+
+
+def _session(i, exception=None):
+    return {
+        "function": "parse_invoice",
+        "module": "billing.parse",
+        "args": [f"INV-{i}", {"lines": list(range(i))}],
+        "kwargs": {"strict": True},
+        "result": None if exception else i,
+        "exception": exception,
+        "exception_type": "ValueError" if exception else None,
+        "timestamp": f"2024-05-01T12:00:{i % 60:02d}",
+        "duration_ms": 1.5,
+        "stack_trace": ["Traceback (most recent call last):\n", "ValueError: bad line\n"] * 50,
+        "function_source": "def parse_invoice(number, body, strict=False):\n    ...\n",
+    }
+
+
+@pytest.mark.parametrize("indent", [False, True])
+def test_encoded_session_is_json_with_a_header_line(indent):
+    data = _session(3, "bad line")
+    body = encode_session(data, indent=indent)
+    assert parse_session(body) == data
+    first_line = body.split(b"\n", 1)[0]
+    assert first_line.startswith(b'{"_header":')
+    header = read_header(io.BytesIO(body))
+    assert header["function"] == "parse_invoice"
+    assert header["exception_type"] == "ValueError"
+    assert set(header["sections"]) == set(data)
+    for name in data:
+        chunks = []
+        assert copy_section(io.BytesIO(body), name, chunks.append)
+        assert json.loads(b"".join(chunks)) == data[name]
+    assert read_sections(io.BytesIO(body), ["stack_trace", "args", "missing"]) == {
+        "args": data["args"], "stack_trace": data["stack_trace"]}
+
+
+def test_old_layout_has_no_header():
+    body = json.dumps(_session(1)).encode()
+    assert read_header(io.BytesIO(body)) is None
+    assert not copy_section(io.BytesIO(body), "args", lambda chunk: None)
+    assert read_sections(io.BytesIO(body), ["args"]) is None
+    with pytest.raises(KeyError):
+        copy_section(io.BytesIO(encode_session(_session(1))), "missing", lambda chunk: None)
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_headers_and_sections_read_from_stored_sessions(tmp_path, compression):
+    store = str(tmp_path / "store")
+    StorageManager(store, compression=compression).save_session("session_1", _session(7, "bad line"))
+    with open_session_file(session_path(store, "session_1")) as stream:
+        assert read_header(stream)["exception"] == "bad line"
+    data, _ = load_session_sections("session_1", ["args", "function"], store)
+    assert data == {"function": "parse_invoice", "args": _session(7)["args"]}
+
+
+def test_inspect_section_streams_one_section(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    StorageManager(".debugonce", compression="zlib").save_session("session_5", _session(5))
+    result = CliRunner().invoke(cli, ["inspect", "session_5", "--section", "args"])
+    assert result.exit_code == 0, result.output
+    assert json.loads(result.output) == _session(5)["args"]
+    result = CliRunner().invoke(cli, ["inspect", "session_5", "--section", "nothing"])
+    assert result.exit_code == 1
+
+
+def test_old_sessions_are_read_and_converted_by_compact(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage = StorageManager(".debugonce")
+    with open(session_path(".debugonce", "session_2"), "w") as f:
+        json.dump(_session(2, "bad line"), f)
+    assert storage.reindex() == 1
+    result = CliRunner().invoke(cli, ["inspect", "session_2", "--section", "kwargs"])
+    assert json.loads(result.output) == {"strict": True}
+    result = CliRunner().invoke(cli, ["inspect", "session_2"])
+    assert "Exception occurred: bad line" in result.output
+
+    assert CliRunner().invoke(cli, ["compact"]).exit_code == 0
+    entry, = iter_session_files(".debugonce")
+    with open_session_file(entry.path) as stream:
+        assert read_header(stream)["function"] == "parse_invoice"
+    assert storage.load_session("session_2") == _session(2, "bad line")
+
+
+def test_reindex_reads_only_headers(tmp_path, monkeypatch):
+    store = str(tmp_path / "store")
+    StorageManager(store, backend="segments").save_sessions(
+        [(f"session_{i}", _session(i, "bad line" if i % 2 else None)) for i in range(10)])
+    monkeypatch.setattr(storage, "decompress", lambda *args: pytest.fail("read a whole body"))
+    assert StorageManager(store).reindex() == 10
+    catalog = SessionCatalog(store)
+    try:
+        assert len(catalog.query(exception="ValueError")) == 5
+    finally:
+        catalog.close()
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+CHECK = """
+import sys
+from debugonce_packages import debugonce
+heavy = [m for m in ("click", "requests", "sqlite3", "logging", "inspect", "datetime",
+                    "debugonce_packages.hooks", "debugonce_packages.stats") if m in sys.modules]
+print(",".join(heavy))
+"""
+
+
+def _run(code, cwd):
+    env = dict(os.environ, PYTHONPATH=SRC)
+    return subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env,
+                          capture_output=True, text=True, check=True).stdout.strip()
+
+
+def test_import_is_lazy_and_touches_no_files(tmp_path):
+    assert _run(CHECK, tmp_path) == ""
+    assert not (tmp_path / ".debugonce").exists()
+
+
+def test_first_capture_sets_up_store_and_log(tmp_path):
+    code = "from debugonce_packages import debugonce\ndebugonce(len)([1, 2])\n"
+    _run(code, tmp_path)
+    assert (tmp_path / ".debugonce" / "debugonce.log").exists()
+    assert (tmp_path / ".debugonce" / "sessions").is_dir()
+
+
+def test_lazy_names_resolve():
+    import debugonce_packages
+    import debugonce_packages.cli  # noqa: F401
+    assert debugonce_packages.cli is sys.modules["debugonce_packages.cli"].cli
+    assert "configure_storage" in dir(debugonce_packages)
+    assert debugonce_packages.StorageManager.__name__ == "StorageManager"
@@ -0,0 +1,67 @@
+import json
+import os
+from click.testing import CliRunner
+from debugonce_packages import replayer
+from debugonce_packages.cli import replay
+from debugonce_packages.storage import StorageManager
+
+DIVIDE = "def divide(a, b):\n    return a / b\n"
+SLOW = "def slow():\n    import time\n    time.sleep(30)\n"
+
+
+def _session(function, source, args, exception_type=None, exception=None):
+    return {"function": function, "args": args, "kwargs": {}, "function_source": source,
+            "exception_type": exception_type, "exception": exception,
+            "timestamp": "2025-05-20T17:55:08"}
+
+
+def _store(tmp_path, sessions):
+    storage = StorageManager(".debugonce")
+    storage.save_sessions(sessions)
+    storage.catalog.close()
+    return [str(tmp_path / ".debugonce" / f"{name}.json") for name, _ in sessions]
+
+
+def test_classify():
+    none = {"exception_type": None, "exception": None}
+    zero = {"exception_type": "ZeroDivisionError", "exception": "division by zero"}
+    assert replayer.classify(none, dict(none, error=None)) == "pass"
+    assert replayer.classify(zero, dict(zero, error=None)) == "reproduced"
+    assert replayer.classify(zero, dict(none, error=None)) == "different"
+    assert replayer.classify(none, dict(zero, error=None)) == "different"
+    assert replayer.classify(none, dict(none, error="boom")) == "error"
+
+
+def test_replay_many_sessions_reports_verdicts(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _store(tmp_path, [
+        ("session_ok", _session("divide", DIVIDE, [4, 2])),
+        ("session_zero", _session("divide", DIVIDE, [1, 0], "ZeroDivisionError", "division by zero")),
+        ("session_fixed", _session("divide", DIVIDE, [1, 1], "ZeroDivisionError", "division by zero")),
+    ])
+    result = CliRunner().invoke(replay, ["--all", "--json", "--workers", "2"])
+    assert result.exit_code == 0, result.output
+    verdicts = {r["session"].rsplit("/", 1)[-1]: r for r in json.loads(result.output)}
+    assert verdicts["session_ok.json"]["status"] == "pass"
+    assert "Function returned: 2.0" in verdicts["session_ok.json"]["stdout"]
+    assert verdicts["session_zero.json"]["status"] == "reproduced"
+    assert verdicts["session_zero.json"]["actual"]["exception"] == "division by zero"
+    assert verdicts["session_fixed.json"]["status"] == "different"
+
+
+def test_replays_are_isolated_and_time_out(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("DEBUGONCE_REPLAY_MARK", "parent")
+    env_source = "def mark():\n    import os\n    os.environ['DEBUGONCE_REPLAY_MARK'] = 'child'\n    return os.getcwd()\n"
+    sessions = _store(tmp_path, [
+        ("session_mark", dict(_session("mark", env_source, []), current_working_directory=str(tmp_path))),
+        ("session_slow", _session("slow", SLOW, [])),
+    ])
+    results = replayer.replay_sessions(sessions, workers=2, timeout=1.0)
+    assert [r["status"] for r in results] == ["pass", "timeout"]
+    # The script would chdir to the captured directory; the runner keeps it in its sandbox.
+    assert "debugonce-replay-" in results[0]["stdout"]
+    assert f"Function returned: {tmp_path}\n" not in results[0]["stdout"]
+    assert results[1]["duration_ms"] < 10_000
+    assert os.environ["DEBUGONCE_REPLAY_MARK"] == "parent"
+    assert os.getcwd() == str(tmp_path)
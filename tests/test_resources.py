@@ -0,0 +1,101 @@
+import json
+from click.testing import CliRunner
+from debugonce_packages import resources, stats
+from debugonce_packages.cli import cli
+from debugonce_packages.decorator import debugonce
+from debugonce_packages.storage import iter_session_files
+
+
+@debugonce
+def allocate(size):
+    return len(bytearray(size))
+
+
+@debugonce
+def fail(message):
+    raise MemoryError(message)
+
+
+def _sessions():
+    sessions = []
+    for entry in iter_session_files(".debugonce"):
+        with open(entry.path) as f:
+            sessions.append(json.load(f))
+    return sessions
+
+
+def _session_path():
+    entry, = iter_session_files(".debugonce")
+    return entry.path
+
+
+def test_captured_calls_record_resource_deltas(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stats.reset_stats()
+    resources.configure_resources()
+    try:
+        assert allocate(8 * 1024 * 1024) == 8 * 1024 * 1024
+    finally:
+        resources.configure_resources(enabled=False)
+    session, = _sessions()
+    usage = session["resources"]
+    assert usage["sampled"] == "always"
+    assert usage["wall_ms"] > 0
+    assert usage["cpu_user_ms"] >= 0 and usage["cpu_system_ms"] >= 0
+    assert usage["rss_before"] > 0 and usage["rss_after"] > 0
+    assert usage["rss_peak"] >= usage["rss_before"]
+    assert usage["fds_before"] > 0 and usage["threads_after"] >= 1
+    summary = stats.get_stats()["functions"]["allocate"]
+    assert summary["resources"]["samples"] == 1
+    assert summary["phases"]["cpu"]["count"] == 1
+
+    result = CliRunner().invoke(cli, ["inspect", _session_path()])
+    assert result.exit_code == 0
+    assert "Resources: wall" in result.output
+    stats.reset_stats()
+
+
+def test_only_on_exception_skips_successful_calls(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    resources.configure_resources(only_on_exception=True)
+    try:
+        allocate(16)
+        try:
+            fail("out of memory")
+        except MemoryError:
+            pass
+    finally:
+        resources.configure_resources(enabled=False)
+    by_function = {session["function"]: session for session in _sessions()}
+    assert "resources" not in by_function["allocate"]
+    usage = by_function["fail"]["resources"]
+    assert usage["sampled"] == "on_exception"
+    assert "rss_before" not in usage and usage["rss_after"] > 0
+
+
+def test_resources_are_off_by_default(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    allocate(16)
+    session, = _sessions()
+    assert "resources" not in session
+
+
+def test_stats_command_shows_resource_maxima(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stats.reset_stats()
+    for growth in (1024 * 1024, 3 * 1024 * 1024):
+        stats.record_resources("load", {
+            "sampled": "always", "wall_ms": 5.0, "cpu_user_ms": 4.0, "cpu_system_ms": 1.0,
+            "rss_before": 10 * 1024 * 1024, "rss_after": 10 * 1024 * 1024 + growth,
+            "rss_peak": 20 * 1024 * 1024, "peak_raised": False, "fds_before": 5, "fds_after": 6,
+            "threads_before": 1, "threads_after": 2,
+        })
+    stats.count("load", captures=2)
+    stats.persist_stats(".debugonce")
+    result = CliRunner().invoke(cli, ["stats", "--json"])
+    usage = json.loads(result.output)["functions"]["load"]["resources"]
+    assert usage == {"samples": 2, "peak_raised": 0, "max_rss_growth": 3 * 1024 * 1024,
+                     "max_rss_peak": 20 * 1024 * 1024, "max_fds": 6, "max_threads": 2}
+    result = CliRunner().invoke(cli, ["stats"])
+    assert "3.0 MiB" in result.output
+    stats.reset_stats()
@@ -0,0 +1,108 @@
+import os
+import pytest
+from click.testing import CliRunner
+from debugonce_packages import storage as storage_module
+from debugonce_packages.blobs import BLOB_KEY, blob_path, store_blob
+from debugonce_packages.cli import cli
+from debugonce_packages.environment import ENV_DIR, persist_environment
+from debugonce_packages.retention import RetentionPolicy
+from debugonce_packages.storage import StorageManager
+
+
+def _session(function, minute):
+    return {"function": function, "args": [], "kwargs": {}, "timestamp": f"2025-05-20T17:{minute:02d}:00"}
+
+
+def test_max_sessions_evicts_oldest_first(tmp_path):
+    policy = RetentionPolicy(max_sessions=3, check_every=1)
+    storage = StorageManager(str(tmp_path), retention=policy)
+    for i in range(6):
+        storage.save_session(f"session_{i}", _session("f", i))
+    assert sorted(storage.list_sessions()) == ["session_3.json", "session_4.json", "session_5.json"]
+    assert storage.catalog.count() == 3
+    assert policy.evicted == 3
+
+
+def test_per_function_quota_and_bytes(tmp_path):
+    storage = StorageManager(str(tmp_path))
+    for i in range(4):
+        storage.save_session(f"a_{i}", _session("a", i))
+    storage.save_session("b_0", _session("b", 10))
+    evicted = storage.enforce_retention(RetentionPolicy(per_function=2))
+    assert evicted == ["a_0", "a_1"]
+    size = os.path.getsize(tmp_path / "b_0.json")
+    evicted = storage.enforce_retention(RetentionPolicy(max_bytes=size))
+    assert evicted == ["a_2", "a_3"]
+
+
+def test_per_function_quota_counts_only_functions_written_since_the_last_check(tmp_path, monkeypatch):
+    policy = RetentionPolicy(per_function=2, check_every=1, batch=1)
+    storage = StorageManager(str(tmp_path), retention=policy)
+    for i in range(3):
+        storage.save_session(f"a_{i}", _session("a", i))  # first check: every function
+    assert sorted(storage.list_sessions()) == ["a_1.json", "a_2.json"]
+    counted = []
+    count = storage.catalog.count
+    monkeypatch.setattr(storage.catalog, "functions_over", lambda quota: pytest.fail("scanned every function"))
+    monkeypatch.setattr(storage.catalog, "totals", lambda: pytest.fail("summed every session"))
+    monkeypatch.setattr(storage.catalog, "count", lambda function=None: counted.append(function) or count(function))
+    storage.save_sessions([(f"b_{i}", _session("b", 10 + i)) for i in range(4)])
+    assert counted == ["b"]
+    assert sorted(storage.list_sessions()) == ["a_1.json", "a_2.json", "b_1.json", "b_2.json", "b_3.json"]
+    storage.save_session("c_0", _session("c", 20))  # b is still over and is checked again
+    assert sorted(counted[1:]) == ["b", "c"]
+    assert "b_1.json" not in storage.list_sessions()
+
+
+def test_eviction_is_incremental(tmp_path):
+    storage = StorageManager(str(tmp_path))
+    for i in range(10):
+        storage.save_session(f"session_{i}", _session("f", i))
+    policy = RetentionPolicy(max_sessions=0, batch=4)
+    assert len(storage.enforce_retention(policy)) == 4
+    assert storage.catalog.count() == 6
+
+
+def test_cli_selective_clean(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage = StorageManager(".debugonce")
+    for i in range(5):
+        storage.save_session(f"a_{i}", _session("a", i))
+    storage.save_session("b_0", _session("b", 0))
+    runner = CliRunner()
+    result = runner.invoke(cli, ["clean", "--function", "a", "--keep-latest", "2"])
+    assert "Removed 3 sessions." in result.output
+    assert sorted(storage.list_sessions()) == ["a_3.json", "a_4.json", "b_0.json"]
+    result = runner.invoke(cli, ["clean", "--older-than", "2025-05-20T17:04:00"])
+    assert "Removed 2 sessions." in result.output
+    assert storage.list_sessions() == ["a_4.json"]
+
+
+def test_evictions_remove_blobs_and_environments_nothing_refers_to(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_module, "SWEEP_GRACE", 0)
+    store = str(tmp_path)
+    shared = store_blob(store, b"shared" * 100)
+    own = [store_blob(store, f"own {i}".encode()) for i in range(2)]
+    for digest in ("env_a", "env_b"):
+        persist_environment(store, digest, {"NAME": digest})
+    storage = StorageManager(store)
+    for i, env in enumerate(("env_a", "env_b")):
+        args = [{BLOB_KEY: shared, "size": 600, "kind": "bytes"}, {BLOB_KEY: own[i], "size": 5, "kind": "bytes"}]
+        storage.save_session(f"session_{i}", dict(_session("f", i), args=args, environment_ref=env))
+    storage.save_session("session_2", dict(_session("f", 2), environment_ref="env_b"))
+    assert storage.reindex() == 3  # refs come back from the session headers
+
+    assert storage.enforce_retention(RetentionPolicy(max_sessions=2)) == ["session_0"]
+    assert not os.path.exists(blob_path(store, own[0]))
+    assert not os.path.exists(tmp_path / ENV_DIR / "env_a.json")
+    assert os.path.exists(blob_path(store, shared)) and os.path.exists(blob_path(store, own[1]))
+
+    monkeypatch.setattr(storage_module, "SWEEP_GRACE", 3600)
+    storage.delete_session("session_1")
+    assert os.path.exists(blob_path(store, own[1]))  # referred to too recently
+    assert os.path.exists(tmp_path / ENV_DIR / "env_b.json")  # session_2 still uses it
+    monkeypatch.setattr(storage_module, "SWEEP_GRACE", 0)
+    storage.delete_sessions([])
+    assert not os.path.exists(blob_path(store, own[1]))
+    assert not os.path.exists(blob_path(store, shared))
+    assert os.path.exists(tmp_path / ENV_DIR / "env_b.json")
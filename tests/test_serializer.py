@@ -0,0 +1,129 @@
+import dataclasses
+import datetime
+import decimal
+import enum
+import json
+import pathlib
+import uuid
+from click.testing import CliRunner
+from debugonce_packages import serializer
+from debugonce_packages.cli import export, inspect
+
+
+@dataclasses.dataclass
+class Point:
+    x: int
+    y: int = 0
+
+
+class Color(enum.Enum):
+    RED = "red"
+
+
+class Opaque:
+    def __repr__(self):
+        return "Opaque()"
+
+
+def _roundtrip(value):
+    return serializer.decode(json.loads(serializer.dumps(serializer.encode(value))))
+
+
+def test_stdlib_values_roundtrip():
+    values = [
+        datetime.datetime(2024, 5, 20, 14, 35, 8),
+        datetime.date(2024, 5, 20),
+        datetime.timedelta(days=1, seconds=5),
+        decimal.Decimal("1.10"),
+        uuid.UUID(int=7),
+        pathlib.Path("/tmp/data.csv"),
+        {1, 2, 3},
+        frozenset({"a"}),
+        (1, (2, 3)),
+        3 + 4j,
+        b"\x00\xff",
+        bytearray(b"abc"),
+        float("inf"),
+        {1: "one", (2, 3): "pair"},
+        {serializer.TYPE_KEY: "not a tag"},
+        Point(1, 2),
+        Color.RED,
+    ]
+    for value in values:
+        assert _roundtrip(value) == value, value
+
+
+def test_buffer_protocol_objects_keep_format_and_shape():
+    view = memoryview(b"\x01\x00\x00\x00\x02\x00\x00\x00").cast("i")
+    decoded = _roundtrip(view)
+    assert decoded.format == "i" and decoded.tolist() == [1, 2]
+
+
+def test_unknown_types_fall_back_to_repr():
+    encoded = serializer.encode([Opaque()])
+    assert encoded == [{serializer.TYPE_KEY: "repr", "type": f"{__name__}.Opaque", "value": "Opaque()"}]
+
+
+def test_registered_serializer_takes_precedence_and_is_cached():
+    class Money:
+        def __init__(self, cents):
+            self.cents = cents
+
+    serializer.register_serializer(Money, "money", lambda m: m.cents, Money)
+    try:
+        encoded = serializer.encode(Money(250))
+        assert encoded == {serializer.TYPE_KEY: "money", "value": 250}
+        assert serializer._cache[Money][0] == "money"
+        assert serializer.decode(encoded).cents == 250
+    finally:
+        del serializer._encoders[Money]
+        del serializer._decoders["money"]
+        serializer._cache.clear()
+
+
+def test_stdlib_backend_matches_fast_backend(monkeypatch):
+    data = serializer.encode({"when": datetime.date(2024, 1, 1), "n": [1, 2.5, None]})
+    fast = json.loads(serializer.dumps(data, indent=True))
+    monkeypatch.setattr(serializer, "orjson", None)
+    assert json.loads(serializer.dumps(data, indent=True)) == fast
+
+
+def test_cli_decodes_arguments_for_inspect_and_export(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    state = serializer.encode_state({
+        "function": "age",
+        "args": [datetime.date(2024, 5, 20), decimal.Decimal("2")],
+        "kwargs": {},
+        "result": None,
+        "function_source": "def age(day, factor):\n    return day.year * factor\n",
+    })
+    session_file = tmp_path / "session_1.json"
+    session_file.write_text(json.dumps(state))
+
+    runner = CliRunner()
+    result = runner.invoke(inspect, [str(session_file)])
+    assert result.exit_code == 0
+    assert "datetime.date(2024, 5, 20)" in result.output
+
+    result = runner.invoke(export, [str(session_file)])
+    assert result.exit_code == 0
+    script = (tmp_path / "session_1_replay.py").read_text()
+    assert "from debugonce_packages.serializer import decode as _decode" in script
+    assert "_decode(json.loads(" in script
+
+
+def test_decoding_only_imports_allowed_modules(tmp_path, monkeypatch):
+    (tmp_path / "untrusted_models.py").write_text(
+        "import enum, os\nos.environ['UNTRUSTED_IMPORTED'] = '1'\n"
+        "class Status(enum.Enum):\n    OK = 'ok'\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delenv("UNTRUSTED_IMPORTED", raising=False)
+    data = {serializer.TYPE_KEY: "enum", "value": {"type": "untrusted_models.Status", "value": "ok"}}
+    assert serializer.decode(data) == "ok"
+    assert "UNTRUSTED_IMPORTED" not in __import__("os").environ
+    serializer.configure_decoding(allow_imports=["untrusted_models"])
+    try:
+        assert serializer.decode(data).name == "OK"
+    finally:
+        serializer.configure_decoding()
+        __import__("sys").modules.pop("untrusted_models", None)
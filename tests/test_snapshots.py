@@ -0,0 +1,69 @@
+import json
+import os
+from debugonce_packages import blobs, hooks, snapshots
+from debugonce_packages.decorator import debugonce
+from debugonce_packages.hooks import IOLog
+from debugonce_packages.replayer import replay_sessions
+from debugonce_packages.storage import iter_session_files
+
+
+@debugonce
+def read_config(path):
+    with open(path) as f:
+        name = f.read().strip()
+    with open("local.txt") as f:
+        return name + "/" + f.read().strip()
+
+
+def _read_all(paths):
+    log = IOLog()
+    token = hooks.activate(log)
+    try:
+        for path in paths:
+            with open(path, "rb") as f:
+                f.read()
+    finally:
+        hooks.deactivate(token)
+    return {entry["file"]: entry.get("snapshot") for entry in log.file_access_log}
+
+
+def test_snapshots_are_deduplicated_and_capped(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.txt").write_text("same")
+    (tmp_path / "b.txt").write_text("same")
+    (tmp_path / "big.txt").write_text("x" * 100)
+    (tmp_path / "c.txt").write_text("other")
+    snapshots.configure_file_snapshots(max_file=50, session_budget=10)
+    try:
+        taken = _read_all(["a.txt", "b.txt", "big.txt", "c.txt"])
+    finally:
+        snapshots.configure_file_snapshots(enabled=False)
+    assert taken["a.txt"]["sha256"] == taken["b.txt"]["sha256"]
+    assert taken["a.txt"]["path"] == str(tmp_path / "a.txt")
+    assert taken["big.txt"]["skipped"] == "file too large"
+    assert taken["c.txt"]["skipped"] == "session budget exceeded"
+    stored = [name for _, _, names in os.walk(tmp_path / ".debugonce" / blobs.BLOB_DIR) for name in names]
+    assert len(stored) == 1
+
+
+def test_replay_reads_the_snapshotted_files(tmp_path, monkeypatch):
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / "name.txt").write_text("captured")
+    (tmp_path / "local.txt").write_text("relative")
+    monkeypatch.chdir(tmp_path)
+    snapshots.configure_file_snapshots()
+    try:
+        assert read_config(str(data / "name.txt")) == "captured/relative"
+    finally:
+        snapshots.configure_file_snapshots(enabled=False)
+    (data / "name.txt").write_text("changed")
+    os.remove(tmp_path / "local.txt")
+
+    session_file, = [entry.path for entry in iter_session_files(".debugonce")]
+    with open(session_file) as f:
+        assert all("sha256" in entry["snapshot"] for entry in json.load(f)["file_access"])
+    result, = replay_sessions([session_file], workers=1, timeout=60)
+    assert result["status"] == "pass", result
+    assert "Function returned: captured/relative" in result["stdout"]
+    assert (data / "name.txt").read_text() == "changed"
@@ -0,0 +1,51 @@
+import importlib.util
+import os
+import sys
+import unittest.mock
+from debugonce_packages import source_cache
+
+
+def _load_module(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_repeated_lookups_do_not_read_source(tmp_path):
+    path = tmp_path / "cached_mod.py"
+    path.write_text("import os\nfrom sys import version\n\ndef target(x):\n    return x\n")
+    module = _load_module(path, "cached_mod")
+    source_cache.clear()
+    source, imports = source_cache.get_source_and_imports(module.target)
+    assert "def target(x)" in source
+    assert imports == ["import os", "from sys import version"]
+    with unittest.mock.patch("inspect.getsource", side_effect=AssertionError("source read")):
+        for _ in range(5):
+            assert source_cache.get_source_and_imports(module.target) == (source, imports)
+
+
+def test_cache_invalidated_when_file_changes(tmp_path):
+    path = tmp_path / "changing_mod.py"
+    path.write_text("import os\n\ndef target(x):\n    return x\n")
+    module = _load_module(path, "changing_mod")
+    source_cache.clear()
+    _, imports = source_cache.get_source_and_imports(module.target)
+    assert imports == ["import os"]
+    path.write_text("import os\nimport json\n\ndef target(x):\n    return x + 1\n")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    source, imports = source_cache.get_source_and_imports(module.target)
+    assert imports == ["import os", "import json"]
+    assert "x + 1" in source
+
+
+def test_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(source_cache, "MAX_ENTRIES", 2)
+    source_cache.clear()
+    # Three distinct code objects.
+    funcs = [eval(compile(f"lambda: {i}", "<bounded>", "eval")) for i in range(3)]
+    for func in funcs:
+        source_cache.get_source_and_imports(func)
+    assert len(source_cache._functions) == 2
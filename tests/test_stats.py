@@ -0,0 +1,49 @@
+from click.testing import CliRunner
+from debugonce_packages import stats
+from debugonce_packages.cli import cli
+from debugonce_packages.stats import Histogram
+
+
+def test_histogram_percentiles_are_close():
+    histogram = Histogram()
+    for value in range(1, 10001):
+        histogram.add(value * 1000)
+    assert abs(histogram.percentile(0.5) - 5_000_000) / 5_000_000 < 0.15
+    assert abs(histogram.percentile(0.99) - 9_900_000) / 9_900_000 < 0.15
+    assert histogram.percentile(1.0) <= 10_000_000
+
+
+def test_decorated_calls_record_phases(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from debugonce_packages import debugonce
+    stats.reset_stats()
+
+    @debugonce
+    def read_back(path):
+        with open(path, "w") as f:
+            f.write("data")
+        return path
+
+    for _ in range(3):
+        read_back(str(tmp_path / "data.txt"))
+    summary = stats.get_stats()["functions"]["read_back"]
+    assert summary["captures"] == 3
+    assert summary["bytes_written"] > 0
+    for phase in ("overhead", "source", "environment", "serialize", "write", "io"):
+        assert summary["phases"][phase]["count"] == 3
+    assert summary["phases"]["io"]["max_us"] > 0
+
+
+def test_stats_command_merges_persisted_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stats.reset_stats()
+    stats.record("divide", "overhead", 400_000)
+    stats.record("divide", "write", 300_000)
+    stats.count("divide", captures=1, bytes_written=1024)
+    stats.persist_stats(".debugonce")
+    result = CliRunner().invoke(cli, ["stats"])
+    assert result.exit_code == 0
+    assert "divide" in result.output
+    assert "Dropped captures: 0" in result.output
+    assert "divide  write" in result.output
+    stats.reset_stats()
@@ -0,0 +1,85 @@
+import os
+from click.testing import CliRunner
+from debugonce_packages.cli import cli
+from debugonce_packages.segments import SegmentLog
+from debugonce_packages.storage import StorageManager
+
+
+def test_segment_log_round_trip_and_reopen(tmp_path):
+    log = SegmentLog(str(tmp_path / "segments"), max_segment_bytes=256)
+    for i in range(20):
+        log.append(f"session_{i}", {"function": "f", "args": [i]})
+    assert len(log.segments()) > 1
+    reopened = SegmentLog(str(tmp_path / "segments"))
+    assert reopened.ids() == [f"session_{i}" for i in range(20)]
+    assert reopened.read("session_7") == {"function": "f", "args": [7]}
+
+
+def test_segment_log_delete_and_compact(tmp_path):
+    log = SegmentLog(str(tmp_path / "segments"), max_segment_bytes=256, fsync="never")
+    for i in range(10):
+        log.append(f"session_{i}", {"n": i})
+    log.append("session_3", {"n": 33})
+    for i in range(5):
+        log.delete(f"session_{i}")
+    stats = log.compact()
+    assert stats["records"] == 5
+    assert stats["bytes_after"] < stats["bytes_before"]
+    reopened = SegmentLog(str(tmp_path / "segments"))
+    assert reopened.ids() == [f"session_{i}" for i in range(5, 10)]
+    assert "session_3" not in reopened
+
+
+def test_segment_log_compact_streams_and_rolls_back_on_failure(tmp_path):
+    log = SegmentLog(str(tmp_path / "segments"), max_segment_bytes=256, fsync="never")
+    for i in range(10):
+        log.append(f"session_{i}", {"n": i})
+    before = sorted(os.listdir(tmp_path / "segments"))
+    seen = []
+
+    def transform(payload):
+        # Earlier records are already on disk when later ones are transformed.
+        seen.append(sum(entry.stat().st_size for entry in os.scandir(tmp_path / "segments")))
+        if len(seen) == 8:
+            raise ValueError("bad record")
+        return payload
+
+    try:
+        log.compact(transform)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("compact swallowed the failure")
+    assert seen[-1] > seen[0]
+    assert sorted(os.listdir(tmp_path / "segments")) == before
+    assert SegmentLog(str(tmp_path / "segments")).read("session_9") == {"n": 9}
+
+
+def test_segment_log_ignores_torn_tail(tmp_path):
+    log = SegmentLog(str(tmp_path / "segments"))
+    log.append("session_a", {"n": 1})
+    with open(os.path.join(log.directory, "segment_000001.log"), "ab") as f:
+        f.write(b"\x01\x00\x09\x00\x00")
+    reopened = SegmentLog(log.directory)
+    assert reopened.ids() == ["session_a"]
+    reopened.append("session_b", {"n": 2})
+    assert SegmentLog(log.directory).read("session_b") == {"n": 2}
+
+
+def test_cli_works_against_segment_store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    storage = StorageManager(".debugonce", backend="segments")
+    storage.save_session("session_1", {"function": "divide", "args": [1, 0], "kwargs": {},
+                                       "exception": "division by zero"})
+    runner = CliRunner()
+    result = runner.invoke(cli, ["list"])
+    assert "- session_1" in result.output
+    result = runner.invoke(cli, ["inspect", "session_1"])
+    assert result.exit_code == 0
+    assert "Exception occurred: division by zero" in result.output
+    result = runner.invoke(cli, ["export", "session_1"])
+    assert result.exit_code == 0
+    assert os.path.exists(os.path.join(".debugonce", "session_1_replay.py"))
+    storage.delete_session("session_1")
+    result = runner.invoke(cli, ["compact"])
+    assert "Compacted 0 sessions" in result.output
@@ -0,0 +1,140 @@
+import cProfile
+import json
+import pstats
+import sys
+import pytest
+from debugonce_packages import tracing
+from debugonce_packages.decorator import debugonce
+from debugonce_packages.replayer import replay_sessions
+from debugonce_packages.storage import iter_session_files
+from debugonce_packages.tracing import Tracer
+
+
+def leaf(value):
+    return value + 1
+
+
+def middle(values):
+    return [leaf(value) for value in values]
+
+
+@debugonce(trace=True)
+def traced(values):
+    json.dumps(values)
+    return middle(values)
+
+
+@debugonce
+def untraced(values):
+    return middle(values)
+
+
+@debugonce(
+    trace=True,
+)
+def standalone(values):
+    return sorted(values)[0]
+
+
+def _sessions():
+    sessions = []
+    for entry in iter_session_files(".debugonce"):
+        with open(entry.path) as f:
+            sessions.append(json.load(f))
+    return sessions
+
+
+def test_traced_call_records_its_callees(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert traced([1, 2]) == [2, 3]
+    session, = _sessions()
+    trace = session["trace"]
+    names = [function[1] for function in trace["functions"]]
+    calls = [names[index] for index, kind in zip(trace["function"], trace["kinds"]) if kind == "c"]
+    assert calls[0] == "traced"
+    assert calls.count("leaf") == 2 and "middle" in calls
+    assert "dumps" not in names  # standard library is left out by default
+    assert trace["kinds"].count("c") == trace["kinds"].count("r")
+    assert trace["time_ns"] == sorted(trace["time_ns"])
+    assert trace["dropped"] == 0
+    assert sys.getprofile() is None
+
+
+def test_tracing_is_opt_in(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    untraced([1])
+    session, = _sessions()
+    assert "trace" not in session
+
+
+def test_module_filters():
+    tracing.configure_tracing(include=["myapp"], exclude=["myapp.vendor"])
+    try:
+        assert tracing.wanted("myapp")
+        assert tracing.wanted("myapp.views.admin")
+        assert not tracing.wanted("myapp.vendor.lib")
+        assert not tracing.wanted("myapplication")
+        assert not tracing.wanted("debugonce_packages.hooks")
+    finally:
+        tracing.configure_tracing()
+    assert tracing.wanted(__name__)
+    assert not tracing.wanted("json.encoder")
+    tracing.configure_tracing(stdlib=True)
+    try:
+        assert tracing.wanted("json.encoder")
+    finally:
+        tracing.configure_tracing()
+
+
+def test_full_buffer_counts_dropped_events():
+    tracer = Tracer(capacity=4)
+    tracer.start()
+    try:
+        for value in range(3):
+            leaf(value)
+    finally:
+        tracer.stop()
+    trace = tracer.to_dict()
+    assert trace["kinds"] == "crcr"
+    assert trace["dropped"] == 2
+
+
+def test_exception_in_traced_call_still_stops_tracing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    @debugonce(trace=True)
+    def failing():
+        leaf(1)
+        raise RuntimeError("boom")
+
+    try:
+        failing()
+    except RuntimeError:
+        pass
+    session, = _sessions()
+    assert session["exception_type"] == "RuntimeError"
+    assert [function[1] for function in session["trace"]["functions"]][-1] == "leaf"
+    assert sys.getprofile() is None
+
+
+def test_traced_session_exports_and_replays(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert standalone([3, 1, 2]) == 1
+    entry, = iter_session_files(".debugonce")
+    result, = replay_sessions([entry.path], workers=1)
+    assert result["status"] == "pass", result
+    assert "Function returned: 1" in result["stdout"]
+
+
+@pytest.mark.skipif(not hasattr(sys, "monitoring"), reason="needs sys.monitoring")
+def test_profiler_tool_id_is_free_between_traced_calls(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    traced([1])
+    assert sys.monitoring.get_tool(sys.monitoring.PROFILER_ID) is None
+    profile = cProfile.Profile()
+    profile.enable()
+    leaf(1)
+    profile.disable()
+    assert any(name == "leaf" for _, _, name in pstats.Stats(profile).stats)
+    traced([2])
+    assert [session["trace"]["backend"] for session in _sessions()] == ["monitoring", "monitoring"]
@@ -0,0 +1,63 @@
+import json
+from click.testing import CliRunner
+from debugonce_packages.cli import triage
+from debugonce_packages.decorator import debugonce
+from debugonce_packages.triage import fingerprint, normalize_trace
+
+
+@debugonce
+def parse_amount(text):
+    return int(text)
+
+
+@debugonce
+def ratio(a, b):
+    return a / b
+
+
+TRACE = '''Traceback (most recent call last):
+  File "/site-packages/debugonce_packages/decorator.py", line 69, in wrapper
+    result = func(*args, **kwargs)
+  File "/home/{user}/app/billing.py", line {line}, in parse_amount
+    return int(text)
+ValueError: invalid literal for int() with base 10: 'x'
+'''
+
+
+def test_fingerprint_ignores_paths_and_line_numbers():
+    first = {"function": "parse_amount", "exception_type": "ValueError", "stack_trace": TRACE.format(user="a", line=3)}
+    second = {"function": "parse_amount", "exception_type": "ValueError", "stack_trace": TRACE.format(user="b", line=9)}
+    assert normalize_trace(first["stack_trace"]) == ["billing.py:parse_amount"]
+    assert fingerprint(first) == fingerprint(second)
+    assert fingerprint(first) != fingerprint(dict(first, exception_type="TypeError"))
+
+
+def _fail(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        pass
+
+
+def test_triage_clusters_and_is_incremental(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for i in range(3):
+        _fail(parse_amount, f"x{i}")
+    _fail(ratio, 1, 0)
+    parse_amount("5")
+    runner = CliRunner()
+
+    result = runner.invoke(triage, ["--json"])
+    assert result.exit_code == 0, result.output
+    clusters = json.loads(result.output)
+    assert [(c["function"], c["exception_type"], c["count"]) for c in clusters] == [
+        ("parse_amount", "ValueError", 3), ("ratio", "ZeroDivisionError", 1)]
+    assert clusters[0]["frame"] == "test_triage.py:parse_amount"
+    assert clusters[0]["first_seen"] <= clusters[0]["last_seen"]
+
+    _fail(ratio, 2, 0)
+    result = runner.invoke(triage, [])
+    assert result.exit_code == 0, result.output
+    assert "5 failed sessions in 2 clusters (1 newly fingerprinted" in result.output
+    result = runner.invoke(triage, ["--function", "ratio"])
+    assert "2 failed sessions in 1 clusters (0 newly fingerprinted" in result.output
@@ -0,0 +1,58 @@
+import threading
+import pytest
+from debugonce_packages.writer import AsyncSessionWriter
+
+
+def test_writer_batches_and_flushes():
+    batches = []
+    writer = AsyncSessionWriter(batches.append, batch_size=4, flush_interval=60)
+    for i in range(10):
+        assert writer.submit({"n": i})
+    assert writer.flush(timeout=5)
+    writer.close()
+    assert [s["n"] for batch in batches for s in batch] == list(range(10))
+    assert all(len(batch) <= 4 for batch in batches)
+    assert writer.stats()["written"] == 10
+
+
+def test_writer_retries_a_failed_batch_state_by_state():
+    written = []
+
+    def sink(batch):
+        if any(state["n"] == 2 for state in batch):
+            raise ValueError("bad state")
+        written.extend(state["n"] for state in batch)
+
+    writer = AsyncSessionWriter(sink, batch_size=4, flush_interval=60)
+    for i in range(4):
+        writer.submit({"n": i})
+    assert writer.flush(timeout=5)
+    writer.close()
+    assert written == [0, 1, 3]
+    stats = writer.stats()
+    assert (stats["written"], stats["failed"], stats["errors"]) == (3, 1, 2)
+
+
+def test_writer_drop_policies_count_drops():
+    release = threading.Event()
+
+    def slow_sink(batch):
+        release.wait(5)
+
+    for policy, counter in (("drop_new", "dropped_new"), ("drop_oldest", "dropped_oldest")):
+        release.clear()
+        writer = AsyncSessionWriter(slow_sink, max_queue=2, batch_size=1, flush_interval=0.01, policy=policy)
+        writer.submit({"n": 0})
+        # Give the worker time to pick up the first state and block in the sink.
+        while writer.stats()["queued"]:
+            pass
+        for i in range(1, 6):
+            writer.submit({"n": i})
+        assert writer.stats()[counter] == 3
+        release.set()
+        writer.close()
+
+
+def test_writer_rejects_unknown_policy():
+    with pytest.raises(ValueError):
+        AsyncSessionWriter(lambda batch: None, policy="spill")
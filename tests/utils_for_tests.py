@@ -1,3 +1,26 @@
 #functions_for_test.py
+import json
+import os
+
+
 def test_function(a, b, c):
-    return a + b + c
\ No newline at end of file
+    return a + b + c
+
+
+def load_sessions(debugonce_dir):
+    """Return every captured session under ``debugonce_dir``, flat or sharded."""
+    sessions = []
+    for root, _, files in sorted(os.walk(debugonce_dir)):
+        for fname in sorted(files):
+            if fname.startswith("session_") and fname.endswith(".json"):
+                with open(os.path.join(root, fname), "r") as f:
+                    sessions.append(json.load(f))
+    return sessions
+
+
+def load_session(debugonce_dir, function_name):
+    """Return the first captured session for ``function_name``."""
+    for state in load_sessions(debugonce_dir):
+        if state.get("function") == function_name:
+            return state
+    return None